@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+Fits the partnership rates to the GOANNA number of partners in the last year.
+
+Runs partnership-only simulations in parallel and writes candidate versions
+of data/partnership_rates_scaling.csv and data/partnership_rates.csv to
+simulations/partnership_rates, along with a report of the fit. Copy the
+candidates over into data/ once happy with them.
+"""
+#%% SETUP Modules
+
+
+# My modules
+import src.calibration.partnership_rates as rates
+
+
+# How many cores to run on
+n_cores = 10
+
+
+#%% RUN Fit the partnership rates
+
+
+if __name__ == '__main__':
+    fit = rates.fit_partnership_rates(scenarios = [1, 2, 3], n_reps = 8, n_cores = n_cores)
+    rates.write_fit(fit)
+    print('Loss before fitting: ' + str(round(fit['initial_loss'], 5)))
+    print('Loss after fitting: ' + str(round(fit['fitted_loss'], 5)))
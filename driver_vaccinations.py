@@ -27,6 +27,8 @@ import src.demographic.population_dynamics as demo
 import src.partners.partners as prt
 import src.calibration.setup as setup
 import src.infections.ng as ng
+import src.infections.events as ev
+import src.demographic.schema as schema
 
 
 
@@ -57,10 +59,18 @@ inf_parameters = setup.parse_parameters('calibrated', scenario, parameter_no)
 pop_parameters = pop.setup_data(scenario, run_mode)
 
 
+# Parse partnership behaviour parameters
+prt_parameters = prt.setup_data()
+
+
 # Parse simulated population
 # Pass this function the scenario number and which simulated population to use
 # Will default back to scenario 1 and population 0 if none selected
-meta, partner_expire, partner_matrix = setup.parse_population_data(scenario, population_no)
+meta, partner_graph = setup.parse_population_data(scenario, population_no)
+
+
+# Queue up everybody's infection events
+events = ev.InfectionEvents(meta, partner_graph)
 
 
 #%% RUN Simulation
@@ -99,15 +109,19 @@ if os.path.exists(last_file) == False:
 
 
         # Update population
-        meta, partner_matrix, partner_expire = demo.update_population(pop_parameters, inf_parameters, meta, partner_matrix, partner_expire, t)
+        meta, partner_graph = demo.update_population(pop_parameters, prt_parameters, inf_parameters, meta, partner_graph, t)
 
 
         # Update partnerships
-        meta, partner_matrix, partner_expire = prt.update_partnerships(meta, partner_matrix, partner_expire, t)
+        meta, partner_graph = prt.update_partnerships(prt_parameters, meta, partner_graph, t)
 
 
         # Update infections
-        meta = ng.update_infections(inf_parameters, meta, partner_matrix, t)
+        meta = ng.update_infections(inf_parameters, meta, partner_graph, t, events)
+
+
+        # Catch any drift in the column types
+        meta = schema.check(meta)
 
 
         # Dump simulation output
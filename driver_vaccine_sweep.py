@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Runs a sweep of vaccine scenarios from the end of a calibrated simulation.
+
+The calibrated end state is read in once and shared across a Pool of
+workers, which each run some of the configurations of vax_parameters. The
+results are written to simulations/vaccination/sweep.csv as they come in.
+
+Each replicate is paired with a baseline run without the vaccine, using
+common random numbers, so the effect of each configuration can be read off
+from the differences with fewer replicates.
+"""
+#%% SETUP Modules
+
+
+# Standard modules
+import os
+
+
+# My modules
+import src.vaccinations.sweep as sweep
+
+
+# How many cores to run on
+n_cores = 10
+
+
+# Which calibrated simulation to start from
+scenario = 1
+calibrated_no = 0
+
+
+# Whether to pair each replicate with a baseline run
+paired = True
+
+
+#%% SETUP Vaccine configurations
+
+
+# Parameters shared by every configuration
+base = {'deployment': 0,
+        'effect': 1,
+        'prop_effective': 0.3,
+        'duration_mean': 2*365,
+        'duration_var': 1,
+        'site0_trans_reduce': 0.5,
+        'site1_trans_reduce': 0.5,
+        'site2_trans_reduce': 0.5,
+        'site0_symp_reduce': 0.5,
+        'site1_symp_reduce': 0.5,
+        'site2_symp_reduce': 0.5,
+        'site0_duration_reduce': 0.5,
+        'site1_duration_reduce': 0.5,
+        'site2_duration_reduce': 0.5,
+        'prop_vax_0': 0.5,
+        'prop_vax_1': 0.4,
+        'prop_vax_2': 0.1,
+        'prop_vax_3': 0.0}
+
+
+# Sample the effect, how often it works and how well it works
+configurations = sweep.latin_hypercube(base,
+                                       {'effect': [0, 1, 2, 3],
+                                        'prop_effective': (0.1, 0.9),
+                                        'site0_trans_reduce': (0.1, 1.0),
+                                        'site1_trans_reduce': (0.1, 1.0),
+                                        'site2_trans_reduce': (0.1, 1.0),
+                                        'duration_mean': (180, 5*365)},
+                                       n = 100)
+
+
+#%% RUN Sweep
+
+
+if __name__ == '__main__':
+    os.makedirs('simulations/vaccination', exist_ok = True)
+    state = sweep.load_calibrated_state(scenario, calibrated_no)
+    results = sweep.run_sweep(state, configurations, n_days = 5*365, n_reps = 4, n_cores = n_cores,
+                              out_file = 'simulations/vaccination/sweep.csv', paired = paired)
+    print(results.groupby('configuration').prevalence_difference.mean() if paired else results.groupby('configuration').prevalence.mean())
@@ -37,6 +37,9 @@ from multiprocessing import Pool
 # Load modules for simulation script
 import src.demographic.generate_population as pop
 import src.partners.partners as prt
+import src.partners.partnership_graph as pg
+import src.partners.burn_in as burn
+import src.partners.equilibrium as eq
 # import src.infections.ng as ng
 # import src.treatment.simple as trt
 
@@ -61,8 +64,21 @@ n_cores = 10
 generate_populations = True
 burn_in_partnerships = False
 track_partnership_rates = False
+validate_equilibrium = False
 generate_parameters = False
 
+
+# How to get the partnership networks to equilibrium
+#   simulate = run the partnership dynamics until they settle down
+#   sample = sample the network directly from its equilibrium
+burn_in_method = 'simulate'
+
+
+# Burn in stops once the partnership network is stationary, but not before
+# burn_in_min_days or after param.partner_burn_in days
+burn_in_min_days = 365
+burn_in_window = 100
+
 # Set whether or not you want to overwrite the existing data
 recovery_mode = False
 
@@ -166,8 +182,8 @@ if burn_in_partnerships:
         for scenario in [1, 2, 3]:
 
 
-            # Parse demographic parameters for population
-            pop_parameters = pop.setup_data(scenario, 'parallel')
+            # Parse partnership parameters
+            prt_parameters = prt.setup_data()
 
 
             # Iterate over the simulation number
@@ -176,35 +192,40 @@ if burn_in_partnerships:
 
             # Skip file if it is already there
             save_dir = 'simulations/partnerships/scenario_' + str(scenario) + '/population_' + str(i)
-            if os.path.exists(save_dir + '_matrix.npy') == False:
+            if os.path.exists(save_dir + '_graph.npz') == False:
 
 
                 # Initilise data for burn in
                 n_days = param.partner_burn_in[0]
-                p0ht, p0lt, p1ht, p1lt, p2ht, p2lt, p3ht, p3lt, _, _, _, _, _ = pstat.initilise_partner_number_tracking(n_days)
-                partner_matrix = pop.initilise_partner_matrix(pop_parameters)
-                partner_expire = pop.initilise_partner_duration(pop_parameters)
                 file_name_pop = 'simulations/populations/scenario_' + str(scenario) + '/population_' + str(i) + '.ftr'
                 meta = pd.read_feather(file_name_pop)
+                partner_graph = pg.PartnershipGraph(meta)
+
+
+                # Sample the network straight from equilibrium
+                if burn_in_method == 'sample':
+                    meta, partner_graph = eq.sample_equilibrium(prt_parameters, meta, partner_graph, n_days)
+                    burn_in = 0
+
 
+                # Run Partnership Dynamics until they settle down
+                else:
+                    meta, partner_graph, burn_in, series = burn.burn_in_partnerships(prt_parameters, meta, partner_graph, n_days, burn_in_min_days, burn_in_window)
+                    print('Population ' + str(i) + ' of scenario ' + str(scenario) + ' burnt in after ' + str(burn_in) + ' days')
 
-                # Run Partnership Dynamics
-                for t in range(0, n_days):
-                    meta, partner_matrix, partner_expire, d0ti, d1ti, d2ti, d3ti = prt.new_partnership(meta, partner_matrix, partner_expire, t)
-                    meta, partner_matrix, partner_expire = prt.old_partnerships(meta, partner_matrix, partner_expire, t)
-                    if track_partnership_rates:
-                        p0ht, p0lt, p1ht, p1lt, p2ht, p2lt, p3ht, p3lt = pstat.update_partnership_types(meta, partner_matrix, t, p0ht, p0lt, p1ht, p1lt, p2ht, p2lt, p3ht, p3lt)
+
+                    # Line the partnership times up with the start of the simulation
+                    partner_graph.shift_time(n_days - burn_in)
 
 
                 # Store data for later
                 meta.to_feather(save_dir + '_meta.ftr')
-                np.save(save_dir + '_matrix.npy', partner_matrix)
-                np.save(save_dir + '_expire.npy', partner_expire)
+                partner_graph.save(save_dir + '_graph.npz', burn_in)
 
 
                 # Graph Partnership dynamics
-                if track_partnership_rates:
-                    pstat.graph_partnership_numbers(meta, n_days, p0ht, p0lt, p1ht, p1lt, p2ht, p2lt, p3ht, p3lt, save_dir)
+                if track_partnership_rates & (burn_in_method != 'sample'):
+                    pstat.graph_partnership_numbers(meta, burn_in, *series, save_dir)
 
 
     # Define function for handling the parallel pool
@@ -218,6 +239,26 @@ if burn_in_partnerships:
         pool_handler()
 
 
+#%% RUN Validate the equilibrium sampler
+
+
+# Compare sampled networks to full burn ins of the first population of each scenario
+if (__name__ == '__main__') & (validate_equilibrium == True):
+    prt_parameters = prt.setup_data()
+    for scenario in [1, 2, 3]:
+
+
+        # Build networks both ways
+        meta = pd.read_feather('simulations/populations/scenario_' + str(scenario) + '/population_0.ftr')
+        sampled, burnt_in = eq.compare_to_burn_in(prt_parameters, meta, param.partner_burn_in[0], 5)
+
+
+        # Summarise the number of people in each partnership type
+        print('Scenario ' + str(scenario) + ' (single, long-term, long-term + short-term, short-term, multiple short-term)')
+        print('    sampled:  ' + str(np.round(sampled.sum(axis = 1).mean(axis = 0), 1)))
+        print('    burnt in: ' + str(np.round(burnt_in.sum(axis = 1).mean(axis = 0), 1)))
+
+
 #%% RUN Generate parameters
 
 
@@ -17,6 +17,10 @@ import re
 from multiprocessing import Pool
 
 
+# My modules
+import src.infections.states as st
+
+
 # Model parameters
 param = pd.read_csv('data/param.csv')
 tt = range(0, param['simulation_length'][0])
@@ -57,11 +61,11 @@ def extract_prevalence(sim):
 
 
                     # Read in meta
-                    meta = pd.read_feather('simulations/calibration/scenario_' + str(scenario) + '/simulation_' + str(sim) + '/timestep' + str(param['partner_burn_in'][0] + t) + '.ftr')
+                    meta = st.encode(pd.read_feather('simulations/calibration/scenario_' + str(scenario) + '/simulation_' + str(sim) + '/timestep' + str(param['partner_burn_in'][0] + t) + '.ftr'))
 
 
                     # Compute prevalence
-                    I = meta.state == 'I'
+                    I = meta.state == st.I
                     prvt[t,:] = [100 * sum(I)/len(meta),
                                 100 * sum(I & (meta.gender == 1))/sum(meta.gender == 1),
                                 100 * sum(I & (meta.gender == 0))/sum(meta.gender == 0),
@@ -121,15 +125,11 @@ def run_standard_checks(sim):
 
 
                     # Read in file
-                    meta = pd.read_feather(file_name + str(sim) + '/timestep' + str(param['partner_burn_in'][0] + t) + '.ftr')
+                    meta = st.encode(pd.read_feather(file_name + str(sim) + '/timestep' + str(param['partner_burn_in'][0] + t) + '.ftr'))
 
 
                     # Compute the number in each infectious state
-                    yt[t,:] = [sum(meta.state == 'S'),
-                               sum(meta.state == 'E'),
-                               sum(meta.state == 'I'),
-                               sum(meta.state == 'R'),
-                               sum(meta.state == 'T')]
+                    yt[t,:] = np.bincount(meta.state, minlength = len(st.LABELS))[[st.S, st.E, st.I, st.R, st.T]]
 
 
                     # Compute the number in each age group
@@ -144,22 +144,13 @@ def run_standard_checks(sim):
                                 sum(meta.partner > -1)]
 
 
-                    # Compute the total nuber of infections by site
-                    site0 = meta.site0 == 1
-                    site1 = meta.site1 == 1
-                    site2 = meta.site2 == 1
-                    inft[t,:] = [sum( ~site0 & ~site1 & ~site2 ),
-                                sum( site0 & ~site1 & ~site2 ),
-                                sum( ~site0 & site1 & ~site2 ),
-                                sum( ~site0 & ~site1 & site2 ),
-                                sum( site0 & site1 & ~site2 ),
-                                sum( ~site0 & site1 & site2 ),
-                                sum( site0 & ~site1 & site2 ),
-                                sum( site0 & site1 & site2 )]
+                    # Compute the total nuber of infections by site, in the order
+                    # none, 0, 1, 2, 0 & 1, 1 & 2, 0 & 2, all three
+                    inft[t,:] = np.bincount(meta.sites, minlength = st.ALL_SITES + 1)[[0, 1, 2, 4, 3, 6, 5, 7]]
 
 
                     # Compute prevalence by sex and age group
-                    I = meta.state == 'I'
+                    I = meta.state == st.I
                     prvt[t,:] = [100 * sum(I)/len(meta),
                                 100 * sum(I & (meta.gender == 1))/sum(meta.gender == 1),
                                 100 * sum(I & (meta.gender == 0))/sum(meta.gender == 0),
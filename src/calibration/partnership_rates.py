@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Fitting the partnership formation rates to GOANNA
+
+The partnership rates are set by the low and high-risk rates in
+data/partnership_rates.csv, scaled by age group and risk group with
+data/partnership_rates_scaling.csv. This module fits them so that the
+number of partners people have had over the last year matches the GOANNA
+survey data in data/calibration_partnership_rates.csv.
+
+Only the partnership dynamics are simulated. Each simulation samples a
+partnership network straight from equilibrium, runs the partnerships for a
+year and bins everybody's number of partners over that year. Simulations
+are run across a Pool of workers for a few replicate populations of each
+scenario, and the replicates use the same seeds for every set of rates
+tried. Changing the rates still changes how the random numbers get used,
+so the loss is noisy and enough replicates are needed for the optimiser to
+see past the noise.
+
+The rates are fitted as the eight effective rates (rate x scaling) for each
+risk group and age group by Nelder-Mead on the log scale. As only the
+product is identifiable, the low-risk rate is held fixed and the high-risk
+rate is rescaled by the average change in the high-risk effective rates
+when splitting the fit back into the two CSVs.
+
+INDEX
+    fit_partnership_rates: fits the rates and scalings
+    simulate_partner_counts: runs one partnership-only simulation
+    partner_count_loss: distance between simulated and target partner counts
+    write_fit: writes out the candidate CSVs and a fit report
+"""
+
+
+#%% SETUP Load Libraries
+import numpy as np
+import pandas as pd
+import scipy.optimize as opt
+import os
+from multiprocessing import Pool
+
+
+# My modules
+import src.demographic.generate_population as pop
+import src.partners.partners as prt
+import src.partners.partnership_graph as pg
+import src.partners.equilibrium as eq
+import src.partners.summary_stats as pstat
+
+
+# Labels of the bins used for the number of partners in the last year
+BINS = ['0', '1', '2-4', '5+']
+
+
+#%% FUN fit_partnership_rates()
+#
+#
+# Search for the partnership rates and scalings which best reproduce the
+# number of partners over the last year reported in GOANNA.
+#
+#
+# INPUT
+#   scenarios = the population scenarios to simulate
+#   n_reps = the number of replicate populations of each scenario
+#   n_days = the number of days to run each simulation for
+#   n_cores = the number of workers in the Pool
+#   max_evals = the most sets of rates to try
+#   step = the size of the initial steps, on the log scale
+#   seed = the seed of the first replicate
+#   data_dir = the directory to read the data from
+#
+# OUTPUT
+#   fit = dictionary with
+#       scaling = the fitted partnership_rates_scaling table
+#       rates = the fitted low and high-risk rates
+#       target, initial, fitted = the proportion of each age group (row) with
+#                                 each number of partners (column)
+#       initial_loss, fitted_loss = partner_count_loss() before and after
+#       n_evals = the number of sets of rates tried
+#
+#
+def fit_partnership_rates(scenarios = [1, 2, 3], n_reps = 8, n_days = 365, n_cores = 10,
+                          max_evals = 300, step = 0.3, seed = 0, data_dir = 'data'):
+
+
+    # Read in the starting point and the targets
+    prt_parameters = prt.setup_data(data_dir)
+    scaling = prt_parameters['p_new_partner_scaling']
+    low, high = prt_parameters['partner_rates']['low'], prt_parameters['partner_rates']['high']
+    target = pd.read_csv(data_dir + '/calibration_partnership_rates.csv').to_numpy(dtype = float).T
+
+
+    # Work out the effective rates to start from
+    effective = scaling * np.array([[low], [high]])
+    x0 = np.log(effective).flatten()
+
+
+    # Set up the replicate simulations
+    jobs = [(scenario, seed + r) for scenario in scenarios for r in range(0, n_reps)]
+
+
+    # Run the optimiser with all the simulations for each set of rates
+    # spread across the pool
+    with Pool(n_cores) as pool:
+
+
+        # Work out how close a set of rates gets to the targets
+        def simulate(x):
+            rates = np.exp(x).reshape(effective.shape)
+            counts = pool.map(simulate_partner_counts, [(prt_parameters, rates, scenario, s, n_days) for scenario, s in jobs])
+            counts = sum(counts)
+            return counts / np.maximum(counts.sum(axis = 1, keepdims = True), 1)
+        def loss(x):
+            return partner_count_loss(simulate(x), target)
+
+
+        # Step out from the starting point in each direction
+        simplex = np.vstack((x0, x0 + step * np.eye(len(x0))))
+        result = opt.minimize(loss, x0, method = 'Nelder-Mead',
+                              options = {'maxfev': max_evals, 'initial_simplex': simplex,
+                                         'xatol': 0.01, 'fatol': 1e-4})
+
+
+        # Summarise the fit before and after
+        initial = simulate(x0)
+        fitted = simulate(result.x)
+
+
+    # Split the effective rates back into the rates and scalings
+    fitted_effective = np.exp(result.x).reshape(effective.shape)
+    new_high = high * np.mean(fitted_effective[1, :]) / np.mean(effective[1, :])
+    new_scaling = fitted_effective / np.array([[low], [new_high]])
+
+
+    return {'scaling': new_scaling,
+            'rates': {'low': low, 'high': new_high},
+            'target': target,
+            'initial': initial,
+            'fitted': fitted,
+            'initial_loss': partner_count_loss(initial, target),
+            'fitted_loss': partner_count_loss(fitted, target),
+            'n_evals': result.nfev}
+
+
+#%% FUN simulate_partner_counts()
+#
+#
+# Run the partnership dynamics on their own and count up the number of
+# partners everybody had over the last year.
+#
+# The population and network are sampled afresh from the seed, so the same
+# seed gives the same population whatever rates are used.
+#
+#
+# INPUT
+#   job = tuple of
+#       prt_parameters = the behavioural tables from prt.setup_data()
+#       rates = the effective partnership rates, row: risk, column: age group
+#       scenario = the population scenario to simulate
+#       seed = the random seed
+#       n_days = the number of days to run for
+#
+# OUTPUT
+#   the number of people in each age group (row) with each number of
+#   partners over the last year (column)
+#
+#
+def simulate_partner_counts(job):
+
+
+    # Set up the rates
+    prt_parameters, rates, scenario, seed, n_days = job
+    prt_parameters = dict(prt_parameters)
+    prt_parameters['p_new_partner_scaling'] = rates
+    prt_parameters = prt.set_partner_rates(prt_parameters, 1, 1)
+
+
+    # Generate a population and start its network off at equilibrium
+    np.random.seed(seed)
+    meta = pop.generate_population(pop.setup_data(scenario, 'parallel'))
+    partner_graph = pg.PartnershipGraph(meta)
+    meta, partner_graph = eq.sample_equilibrium(prt_parameters, meta, partner_graph, 0)
+
+
+    # Run partnership dynamics
+    for t in range(0, n_days):
+        meta, partner_graph = prt.update_partnerships(prt_parameters, meta, partner_graph, t)
+
+
+    # Count up the number of partners over the year up to the last day simulated
+    return pstat.partner_count_distribution(meta, partner_graph, n_days - 1).sum(axis = 1)
+
+
+#%% FUN partner_count_loss()
+#
+#
+# Chi-squared distance between the simulated and target proportions of each
+# age group with each number of partners, summed over the age groups.
+#
+#
+def partner_count_loss(simulated, target):
+    return float(np.sum((simulated - target)**2 / target))
+
+
+#%% FUN write_fit()
+#
+#
+# Write out the output of fit_partnership_rates() as candidate versions of
+# partnership_rates_scaling.csv and partnership_rates.csv, along with a
+# report of the fit. The candidates need to be copied into the data
+# directory by hand to be used.
+#
+#
+# INPUT
+#   fit = the output of fit_partnership_rates()
+#   save_dir = the directory to write to
+#   data_dir = the directory the column names are taken from
+#
+#
+def write_fit(fit, save_dir = 'simulations/partnership_rates', data_dir = 'data'):
+
+
+    # Make sure the directory is there
+    os.makedirs(save_dir, exist_ok = True)
+
+
+    # Candidate scalings and rates
+    columns = pd.read_csv(data_dir + '/partnership_rates_scaling.csv').columns
+    pd.DataFrame(fit['scaling'], columns = columns).round(4).to_csv(save_dir + '/partnership_rates_scaling.csv', index = False)
+    pd.DataFrame({'low': [fit['rates']['low']], 'high': [round(fit['rates']['high'], 4)]}).to_csv(save_dir + '/partnership_rates.csv', index = False)
+
+
+    # Report the fit for every age group and number of partners
+    age_groups = pd.read_csv(data_dir + '/calibration_partnership_rates.csv').columns
+    report = pd.DataFrame({'age_group': np.repeat(age_groups, len(BINS)),
+                           'n_partners': np.tile(BINS, len(age_groups)),
+                           'target': fit['target'].flatten(),
+                           'initial': fit['initial'].flatten(),
+                           'fitted': fit['fitted'].flatten()})
+    report.round(4).to_csv(save_dir + '/fit_report.csv', index = False)
+
+
+    # Summary of the fit
+    with open(save_dir + '/fit_report.txt', 'w') as f:
+        f.write('Sets of rates tried: ' + str(fit['n_evals']) + '\n')
+        f.write('Loss before fitting: ' + str(round(fit['initial_loss'], 5)) + '\n')
+        f.write('Loss after fitting: ' + str(round(fit['fitted_loss'], 5)) + '\n')
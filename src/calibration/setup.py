@@ -24,13 +24,21 @@ import time
 import src.demographic.generate_population as pop
 import src.demographic.population_dynamics as demo
 import src.partners.partners as prt
+import src.partners.partnership_graph as pg
 import src.calibration.setup as setup
 import src.infections.ng as ng
+import src.infections.events as ev
+import src.infections.states as st
+import src.demographic.schema as schema
 
 
 run_mode = 'parallel'
 
 
+# Order of the sexual acts in the compiled transmission tables
+ACTS = ['anal', 'oral', 'kiss', 'rim', 'sex']
+
+
 #%% FUN parse_population_data()
 #
 #
@@ -53,23 +61,29 @@ def parse_population_data(scenario = 'default', set = 0, run_mode = run_mode):
 
 
     # Read in the population metadata dataframe
-    meta = pd.read_feather('simulations/partnerships/scenario_' + str(scenario) + '/population_' + str(set) + '_meta.ftr')
+    meta = schema.apply(pd.read_feather('simulations/partnerships/scenario_' + str(scenario) + '/population_' + str(set) + '_meta.ftr'))
 
 
     # Check that the duration exposed is correct in meta
     sim_parameters = pd.read_csv('data/param.csv')
-    meta.loc[meta.site0 == 1, 'site0_t0'] = sim_parameters.partner_burn_in[0] + sim_parameters.init_duration_exposed[0] * np.random.random(sum(meta.site0 == 1))
-    meta.loc[meta.site1 == 1, 'site1_t0'] = sim_parameters.partner_burn_in[0] + sim_parameters.init_duration_exposed[0] * np.random.random(sum(meta.site1 == 1))
-    meta.loc[meta.site2 == 1, 'site2_t0'] = sim_parameters.partner_burn_in[0] + sim_parameters.init_duration_exposed[0] * np.random.random(sum(meta.site2 == 1))
+    meta.loc[st.infected_at(meta, 0), 'site0_t0'] = sim_parameters.partner_burn_in[0] + sim_parameters.init_duration_exposed[0] * np.random.random(sum(st.infected_at(meta, 0)))
+    meta.loc[st.infected_at(meta, 1), 'site1_t0'] = sim_parameters.partner_burn_in[0] + sim_parameters.init_duration_exposed[0] * np.random.random(sum(st.infected_at(meta, 1)))
+    meta.loc[st.infected_at(meta, 2), 'site2_t0'] = sim_parameters.partner_burn_in[0] + sim_parameters.init_duration_exposed[0] * np.random.random(sum(st.infected_at(meta, 2)))
 
 
-    # Read in the simulated partnership data arrays
-    partner_expire = np.load('simulations/partnerships/scenario_' + str(scenario) + '/population_' + str(set) + '_expire.npy')
-    partner_matrix = np.load('simulations/partnerships/scenario_' + str(scenario) + '/population_' + str(set) + '_matrix.npy')
+    # Read in the simulated partnership network
+    file_name = 'simulations/partnerships/scenario_' + str(scenario) + '/population_' + str(set)
+    if os.path.exists(file_name + '_graph.npz'):
+        partner_graph = pg.load_graph(meta, file_name + '_graph.npz')
+    else:
+        # Fall back on the older dense partnership arrays
+        partner_expire = np.load(file_name + '_expire.npy')
+        partner_matrix = np.load(file_name + '_matrix.npy')
+        partner_graph = pg.from_dense(meta, partner_matrix, partner_expire)
 
 
     # Return data
-    return meta, partner_expire, partner_matrix
+    return meta, partner_graph
 
 
 #%% FUN parse_default_parameters()
@@ -151,6 +165,10 @@ def parse_default_parameters():
                   'trans_rim': trans_rim}
 
 
+    # Compile the transmission probabilities into lookup tables
+    parameters = compile_transmission(parameters)
+
+
     # Return the parameters in dictionary form
     return parameters
 
@@ -279,10 +297,54 @@ def parse_custom_parameters(parameters, parameter_no):
                   'trans_rim': trans_rim}
 
 
+    # Compile the transmission probabilities into lookup tables
+    parameters = compile_transmission(parameters)
+
+
     # Return the parameters in dictionary form
     return parameters
 
 
+#%% FUN compile_transmission()
+#
+#
+# Compile the act and site-to-site transmission probabilities into lookup
+# tables, so the transmission probabilities of a whole batch of partnerships
+# can be looked up at once.
+#
+#
+# INPUT
+#   parameters = dictionary with p_anal, ..., p_sex and trans_anal, ..., trans_sex
+#
+# OUTPUT
+#   parameters, with
+#       act_prob = the probability of each act at [g0, g1, risk_sum, act],
+#                  where risk_sum is the number of high-risk partners
+#       act_trans = the site-to-site transmission probabilities of each act
+#                   at [act, from site, to site]
+#
+#
+def compile_transmission(parameters):
+
+
+    # Stack up the acts
+    p_act = np.stack([parameters['p_' + act] for act in ACTS], axis = -1)
+    trans = np.stack([parameters['trans_' + act] for act in ACTS])
+
+
+    # Scale the act probabilities up with the number of high-risk partners
+    risk = 1 + np.arange(0, 3)
+    act_prob = np.minimum(risk[None, None, :, None] * p_act[:, :, None, :], 1)
+
+
+    # Store
+    parameters.update({'act_prob': act_prob,
+                       'act_trans': trans})
+
+
+    return parameters
+
+
 #%% FUN parse_parameters()
 #
 #
@@ -388,11 +450,19 @@ def run_one_simulation(scenario, parameter_no):
     pop_parameters = pop.setup_data(scenario, run_mode)
 
 
+    # Parse partnership behaviour parameters
+    prt_parameters = prt.setup_data()
+
+
     # Parse simulated population
     # Pass this function the scenario number and which simulated population to use
     # Will default back to scenario 1 and population 0 if none selected
     population_no = random.randint(0, sim_parameters.n_populations[0]-1)
-    meta, partner_expire, partner_matrix = setup.parse_population_data(scenario, population_no)
+    meta, partner_graph = setup.parse_population_data(scenario, population_no)
+
+
+    # Queue up everybody's infection events
+    events = ev.InfectionEvents(meta, partner_graph)
 
 
     # Check to see if this dataset has been run to completion
@@ -424,15 +494,19 @@ def run_one_simulation(scenario, parameter_no):
 
 
             # Update population
-            meta, partner_matrix, partner_expire = demo.update_population(pop_parameters, inf_parameters, meta, partner_matrix, partner_expire, t)
+            meta, partner_graph = demo.update_population(pop_parameters, prt_parameters, inf_parameters, meta, partner_graph, t)
 
 
             # Update partnerships
-            meta, partner_matrix, partner_expire = prt.update_partnerships(meta, partner_matrix, partner_expire, t)
+            meta, partner_graph = prt.update_partnerships(prt_parameters, meta, partner_graph, t)
 
 
             # Update infections
-            meta = ng.update_infections(inf_parameters, meta, partner_matrix, t)
+            meta = ng.update_infections(inf_parameters, meta, partner_graph, t, events)
+
+
+            # Catch any drift in the column types
+            meta = schema.check(meta)
 
 
             # Dump simulation output
@@ -452,9 +526,9 @@ def run_one_simulation(scenario, parameter_no):
                   'meta': meta,
                   'out_dir': out_dir,
                   'parameter_no': parameter_no,
-                  'partner_expire': partner_expire,
-                  'partner_matrix': partner_matrix,
+                  'partner_graph': partner_graph,
                   'pop_parameters': pop_parameters,
+                  'prt_parameters': prt_parameters,
                   'population_no': population_no,
                   'scenario': scenario,
                   'sim_parameters': sim_parameters,
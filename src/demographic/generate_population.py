@@ -18,6 +18,11 @@ import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 
 
+# My modules
+import src.infections.states as st
+import src.demographic.schema as schema
+
+
 # Read in parameters
 sim_parameters = pd.read_csv("data/param.csv")
 scenario_global = sim_parameters.scenario[0]
@@ -140,6 +145,7 @@ def generate_population(pop_parameters,
 
     ## SET INFECTION STATUS
     meta_init = initilise_infections(meta_init, prop_infected, t)
+    meta_init = schema.apply(meta_init)
 
 
     # End it
@@ -147,18 +153,6 @@ def generate_population(pop_parameters,
 
 
 
-#%% FUN initilise_partner_matrix()
-def initilise_partner_matrix(pop_parameters):
-    out = np.zeros((pop_parameters['n'], pop_parameters['n']))
-    return out
-
-
-#%% FUN initilise_partner_durations()
-def initilise_partner_duration(pop_parameters):
-    out =  float("inf") * np.ones((pop_parameters['n'], pop_parameters['n']))
-    return out
-
-
 #%%  HELPER initilise_meta()
 #
 #
@@ -176,10 +170,8 @@ def initilise_meta(n):
                                    "risk",                 # Infection risk level
                                    "partner",              # The indivdual's long-term partner
                                    "counter",              # Counter of how many partners they've had
-                                   "state",                # Their current infection state (S,I,R)
-                                   "site0",                # Binary 0/1 are they infected at anatomical site 0
-                                   "site1",                # Binary 0/1 are they infected at anatomical site 1
-                                   "site2",                # Binary 0/1 are they infected at anatomical site 2
+                                   "state",                # Their current infection state (code from src/infections/states.py)
+                                   "sites",                # Bitmask of the anatomical sites they are infected at
                                    "site0_t0",             # The simulation time that they became infected at site 0
                                    "site1_t0",             # The simulation time that they became infected at site 1
                                    "site2_t0",             # The simulation time that they became infected at site 0
@@ -190,34 +182,12 @@ def initilise_meta(n):
                                    'site1_symptoms',
                                    'site2_symptoms',
                                    "treatment_threshold",  # Threshold in [0,1] indicating when they'll get treatment
+                                   "treatment_time",       # Simulation time that they'll seek treatment (nan until worked out)
                                    "recovery_time",        # Simulation time that they get treatment
                                    'import_time'])         # Simulation time that they were imported
 
 
-    # Set variable types
-    meta_init.gender.astype("int64")
-    meta_init.age.astype("float64")
-    meta_init.age_group.astype("int64")
-    meta_init.orientation.astype("int64")
-    meta_init.risk.astype("int64")
-    meta_init.partner.astype("int64")
-    meta_init.counter.astype("int64")
-    meta_init.state.astype("category")
-    meta_init.site0.astype("int64")
-    meta_init.site1.astype("int64")
-    meta_init.site2.astype("int64")
-    meta_init.site0_t0.astype("float64")
-    meta_init.site1_t0.astype("float64")
-    meta_init.site2_t0.astype("float64")
-    meta_init.site0_t1.astype("float64")
-    meta_init.site1_t1.astype("float64")
-    meta_init.site2_t1.astype("float64")
-    meta_init.site0_symptoms.astype('bool')
-    meta_init.site1_symptoms.astype('bool')
-    meta_init.site2_symptoms.astype('bool')
-    meta_init.treatment_threshold.astype("float64")
-    meta_init.recovery_time.astype("float64")
-    meta_init.import_time.astype("float64")
+    # Variable types are set by schema.apply() once the population is generated
 
 
     # Set default values
@@ -228,10 +198,8 @@ def initilise_meta(n):
     meta_init.loc[:, 'risk'] = np.random.random(n)
     meta_init.loc[:, 'partner'] = -1
     meta_init.loc[:, 'counter'] = 0
-    meta_init.loc[:, 'state'] = 'S'
-    meta_init.loc[:, 'site0'] = 0
-    meta_init.loc[:, 'site1'] = 0
-    meta_init.loc[:, 'site2'] = 0
+    meta_init.loc[:, 'state'] = st.S
+    meta_init.loc[:, 'sites'] = 0
     meta_init.loc[:, 'site0_t0'] = float("inf")
     meta_init.loc[:, 'site1_t0'] = float("inf")
     meta_init.loc[:, 'site2_t0'] = float("inf")
@@ -242,6 +210,7 @@ def initilise_meta(n):
     meta_init.loc[:, 'site1_symptoms'] = False
     meta_init.loc[:, 'site2_symptoms'] = False
     meta_init.loc[:, 'treatment_threshold'] = np.random.random(n)
+    meta_init.loc[:, 'treatment_time'] = float("nan")
     meta_init.loc[:, 'recovery_time'] = float("inf")
     meta_init.loc[:, 'import_time'] = 0
 
@@ -399,7 +368,7 @@ def initilise_infections(meta_init, prop_infected, t):
 
     # Choose people at random to infect
     infected = meta_init.treatment_threshold < prop_infected
-    meta_init.loc[infected, 'state'] = 'E'
+    meta_init.loc[infected, 'state'] = st.E
 
 
     # Choose one site of infection for these individuals
@@ -410,9 +379,9 @@ def initilise_infections(meta_init, prop_infected, t):
 
 
     # Set infection status
-    meta_init.loc[site0, 'site0'] = 1
-    meta_init.loc[site1, 'site1'] = 1
-    meta_init.loc[site2, 'site2'] = 1
+    meta_init.loc[site0, 'sites'] = st.SITE_BITS[0]
+    meta_init.loc[site1, 'sites'] = st.SITE_BITS[1]
+    meta_init.loc[site2, 'sites'] = st.SITE_BITS[2]
 
 
     # Set the time of infection to the end of the burn in period
@@ -20,6 +20,9 @@ import copy
 import src.demographic.generate_population as pop
 import src.partners.partners as prt
 import src.infections.ng as ng
+import src.infections.states as st
+import src.infections.streams as rs
+import src.demographic.schema as schema
 
 
 # Parse general simulation parameters
@@ -32,23 +35,27 @@ sim_parameters = pd.read_csv('data/param.csv')
 # Function to implement all of the population dynamics
 #
 #
-def update_population(pop_parameters, inf_parameters, meta, partner_matrix, partner_expire, t):
+def update_population(pop_parameters, prt_parameters, inf_parameters, meta, partner_graph, t):
 
 
     # Mobility dynamics
-    meta, partner_matrix, partner_expire = mobility(pop_parameters, inf_parameters, meta, partner_matrix, partner_expire, t)
+    meta, partner_graph = mobility(pop_parameters, prt_parameters, inf_parameters, meta, partner_graph, t)
 
 
     # Make people older by a day
     meta.loc[:, 'age'] = meta.loc[:, 'age'] + (1/365)
-    meta.loc[:, 'age_group'] = np.floor((meta.age - 15)/5)
+    meta.loc[:, 'age_group'] = np.minimum(np.floor((meta.age - 15)/5), 3).astype(np.int8)
+
+
+    # Move anybody who has changed age group in the partner index
+    partner_graph.update_people(meta)
 
 
     # Update demographic indexing
     pop_parameters = update_demographic_compartments(pop_parameters, meta)
 
 
-    return meta, partner_matrix, partner_expire
+    return meta, partner_graph
 
 
 #%% FUN mobility()
@@ -59,8 +66,12 @@ def update_population(pop_parameters, inf_parameters, meta, partner_matrix, part
 # The imported case is infectious at one site and immediately joins a short
 # term relationship at random.
 #
+# If a vaccination campaign is running, pop_parameters['campaign'], it works
+# out when anybody new will be vaccinated and takes anybody leaving out of
+# its count of the number vaccinated.
+#
 #
-def mobility(pop_parameters, inf_parameters, meta, partner_matrix, partner_expire, t):
+def mobility(pop_parameters, prt_parameters, inf_parameters, meta, partner_graph, t):
 
 
     # Make things a little easier
@@ -70,6 +81,7 @@ def mobility(pop_parameters, inf_parameters, meta, partner_matrix, partner_expir
 
     # Iterate over all age and gender combinations
     array_in = []
+    debut_in = []
     list_out = []
     for gender in [0, 1]:
 
@@ -84,12 +96,12 @@ def mobility(pop_parameters, inf_parameters, meta, partner_matrix, partner_expir
 
             # Sample the number of new people to come in
             n_cohort = sum(lookup['GA' + str(gender) + str(age_group)])
-            n_new = np.random.poisson(max(1, target[age_group] - n_cohort) * inf_parameters['infection']['pop_annual_turnover_rate'][0])
+            n_new = rs.stream('mobility').poisson(max(1, target[age_group] - n_cohort) * inf_parameters['infection']['pop_annual_turnover_rate'][0])
 
 
             # If this is the 16 y/o group, add in some more in
             if age_group == 0:
-                n_debut = np.random.poisson(target[age_group]/(4*365))
+                n_debut = rs.stream('mobility').poisson(target[age_group]/(4*365))
             else:
                 n_debut = 0
 
@@ -108,11 +120,13 @@ def mobility(pop_parameters, inf_parameters, meta, partner_matrix, partner_expir
                 array_in = temp
             elif len(temp) > 0:
                 array_in = array_in.append(temp).reset_index(drop = True)
+            if len(temp) > 0:
+                debut_in.append((np.arange(len(temp)) <= n_debut) & (n_debut > 0))
 
 
             # Sample a list of people to leave
-            n_out = np.random.poisson(max(1, n_cohort - target[age_group]) * inf_parameters['infection']['pop_annual_turnover_rate'][0])
-            list_out = list_out + ([] if n_out == 0 else np.random.choice(meta.index[lookup['GA' + str(gender) + str(age_group)]], n_out).tolist())
+            n_out = rs.stream('mobility').poisson(max(1, n_cohort - target[age_group]) * inf_parameters['infection']['pop_annual_turnover_rate'][0])
+            list_out = list_out + ([] if n_out == 0 else rs.stream('mobility').choice(meta.index[lookup['GA' + str(gender) + str(age_group)]], n_out).tolist())
 
 
             # Identify anybody over 36 to also leave
@@ -122,11 +136,11 @@ def mobility(pop_parameters, inf_parameters, meta, partner_matrix, partner_expir
     # Change some attributes of the imports
     if len(array_in) > 0:
         # Change infectious people to already be infectious upon entering the population
-        infected = array_in.state == 'E'
-        site0 = array_in.site0 == int(1)
-        site1 = array_in.site1 == int(1)
-        site2 = array_in.site2 == int(1)
-        array_in.loc[infected, 'state'] = 'I'
+        infected = array_in.state == st.E
+        site0 = st.infected_at(array_in, 0)
+        site1 = st.infected_at(array_in, 1)
+        site2 = st.infected_at(array_in, 2)
+        array_in.loc[infected, 'state'] = st.I
         array_in.loc[(infected) & (site0), 'site0_t0'] = t
         array_in.loc[(infected) & (site1), 'site1_t0'] = t
         array_in.loc[(infected) & (site2), 'site2_t0'] = t
@@ -134,21 +148,32 @@ def mobility(pop_parameters, inf_parameters, meta, partner_matrix, partner_expir
         array_in.loc[(infected) & (site1), 'site1_t1'] = t + ng.duration_urethral(inf_parameters, array_in.loc[(infected) & (site1), ])
         array_in.loc[(infected) & (site2), 'site2_t1'] = t + ng.duration_pharyngeal(inf_parameters, array_in.loc[(infected) & (site2), ])
         array_in.loc[:, 'import_time'] = t
+        array_in.loc[:, 'treatment_time'] = float('nan')
+
+
+        # Work out when they'll be vaccinated if there's a campaign running
+        if 'campaign' in pop_parameters:
+            array_in = pop_parameters['campaign'].enter(array_in, np.concatenate(debut_in), t)
 
 
         # Update the meta-population data
-        meta, partner_matrix, partner_expire = add_to_meta(meta, partner_matrix, partner_expire, array_in, t)
+        meta, partner_graph = add_to_meta(prt_parameters, meta, partner_graph, array_in, t)
 
 
     # Take some people out if needed
     if len(list_out) > 0:
 
 
+        # Take them out of the campaign's count
+        if 'campaign' in pop_parameters:
+            pop_parameters['campaign'].leave(meta, list_out)
+
+
         # Update partner indicies in meta
-        meta, partner_matrix, partner_expire = remove_from_meta(meta, partner_matrix, partner_expire, list_out)
+        meta, partner_graph = remove_from_meta(meta, partner_graph, list_out, t)
 
 
-    return meta, partner_matrix, partner_expire
+    return meta, partner_graph
 
 
 
@@ -262,7 +287,7 @@ def sample_from_imports(imports, age, gender, n_sample):
 
     # Select a few rows from the imports sample cohort at random
     cohort = str(gender) + str(age)
-    temp = np.random.choice(imports[cohort].index, n_sample)
+    temp = rs.stream('mobility').choice(imports[cohort].index, n_sample)
     temp = imports[cohort].loc[temp, :]
     temp = temp.reset_index(drop = True)
 
@@ -274,39 +299,27 @@ def sample_from_imports(imports, age, gender, n_sample):
 #
 #
 # Function which adds a new person into the meta dataframe and the
-# associated matrices
+# partnership network
 #
 #
-def add_to_meta(meta, partner_matrix, partner_expire, new_person, t):
+def add_to_meta(prt_parameters, meta, partner_graph, new_person, t):
 
 
     # Put the new person into the meta-population
-    meta = meta.append(new_person).reset_index(drop = True)
+    meta = schema.apply(meta.append(new_person).reset_index(drop = True))
     pop_tot = len(meta)
     n_new = len(new_person)
 
 
-    # Put the new person into the partner matrix
-    # new_col = np.zeros((pop_tot-n_new, n_new))
-    # new_row = np.zeros((n_new, pop_tot))
-    # partner_matrix = np.hstack((partner_matrix, new_col))
-    # partner_matrix = np.vstack((partner_matrix, new_row))
-    partner_matrix = add_to_array(partner_matrix, pop_tot, 0)
-
-
-    # Put the new person into the partner duration matrix
-    # new_col = float('inf') * np.ones((pop_tot-n_new, n_new))
-    # new_row = float('inf') * np.ones((n_new, pop_tot))
-    # partner_expire = np.hstack((partner_expire, new_col))
-    # partner_expire = np.vstack((partner_expire, new_row))
-    partner_expire = add_to_array(partner_expire, pop_tot, float('inf'))
+    # Put the new person into the partnership network
+    partner_graph.add_people(meta)
 
 
     # Test to see if they want a partner
-    new_cases = new_person.index[new_person.state == 'I']
+    new_cases = new_person.index[new_person.state == st.I]
     for i in new_cases:
         ii = pop_tot - (n_new-(i+1)) - 1
-        jj = prt.find_partner(meta, partner_matrix, ii)
+        jj = prt.find_partner(prt_parameters, meta, partner_graph, ii)
 
 
         # Check somebody was found
@@ -314,33 +327,18 @@ def add_to_meta(meta, partner_matrix, partner_expire, new_person, t):
 
 
             # Sample a duration
-            duration = prt.relationship_duration(meta, ii, jj, 1)
-
-
-            # Update partnership array
-            partner_matrix[ii, jj] = 1
-            partner_matrix[jj, ii] = 1
+            duration = prt.relationship_duration(prt_parameters, meta, ii, jj, 1)
 
 
-            # Update partnership duration matrix
-            partner_expire[ii, jj] = t + duration
-            partner_expire[jj, ii] = t + duration
+            # Update partnership network
+            partner_graph.add(ii, jj, t + duration, 1, t)
 
 
-    return meta, partner_matrix, partner_expire
+    return meta, partner_graph
 
 
 #%% HELPER remove_from_meta()
-def remove_from_meta(meta, partner_matrix, partner_expire, leave):
-
-
-    # Take them out of the population
-    # partner_matrix = np.delete(partner_matrix, leave, 0)
-    # partner_matrix = np.delete(partner_matrix, leave, 1)
-    # partner_expire = np.delete(partner_expire, leave, 0)
-    # partner_expire = np.delete(partner_expire, leave, 1)
-    partner_matrix = delete_from_array(partner_matrix, leave, len(meta))
-    partner_expire = delete_from_array(partner_expire, leave, len(meta))
+def remove_from_meta(meta, partner_graph, leave, t):
 
 
     # Terminate long term relationships with these guys
@@ -348,71 +346,22 @@ def remove_from_meta(meta, partner_matrix, partner_expire, leave):
 
 
     # Take them out of meta
-    meta = meta.drop(leave, 0).reset_index()
+    meta = meta.drop(leave, 0).reset_index(drop = True)
 
 
-    # Isolate how the indicies have changed
-    old_index = meta['index']
-    new_index = meta.index
+    # Take them out of the partnership network and find out how the indicies have changed
+    new_index = partner_graph.remove_people(leave, t)
 
 
     # Adjust the partnership indicies in meta
-    old_partners = meta.partner[meta.partner > -1]
-    for ii in old_partners.index:
-        meta.loc[ii, 'partner'] = new_index[old_index == old_partners[ii]]
-    meta = meta.drop('index', axis = 1)
-
-
-    return meta, partner_matrix, partner_expire
-
-
-#%% HELPER delete_from_array()
-#
-#
-# Helper function to delete a row and column from an array
-#
-#
-def delete_from_array(a, leave, n):
-
-
-    # Drop those entries
-    # a = a[keep, :][:, keep]
-
-
-    # Shuffle unwanted rows and columns to the end of the array but don't delete them
-    keep = list(set(range(0, n)) - set(leave))
-    permutation = np.array(keep + leave)
-    a = a[permutation, :][:, permutation]
-
-
-    return a
-
-
-def add_to_array(a, tot_needed, values):
-
-
-    # Check first that there isn't already an empty row and column lying around
-    to_add = tot_needed - len(a)
-
-
-    # If more rows are needed then do a vstack/hstack
-    if to_add > 0:
-
-
-        # Put the new person into the partner matrix
-        new_rows = values * np.ones((to_add, len(a)))
-        new_cols = values * np.ones((tot_needed, to_add))
-
-        a = np.vstack((a, new_rows))
-        a = np.hstack((a, new_cols))
-
-
-    return a
-
-
-
-
+    partner = meta.partner.to_numpy(dtype = int)
+    partnered = partner > -1
+    partner[partnered] = new_index[partner[partnered]]
+    meta.loc[:, 'partner'] = partner.astype(np.int32)
 
 
+    # Update the partner index for anybody left single
+    partner_graph.update_people(meta)
 
 
+    return meta, partner_graph
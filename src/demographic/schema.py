@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Schema of the population dataframe, meta
+
+Every column of meta has a compact dtype: float32 for simulation times,
+int8 for codes and small categories, int32 for row indices and counters
+and bool for flags. The state and sites columns use the encoding in
+src/infections/states.py. age is kept as float64 because it is bumped by
+1/365 every day and float32 would drift.
+
+The schema is applied when a population is generated, when one is read in
+from feather and whenever rows are appended to it. Writing into meta with
+.loc can quietly widen a column, for example writing float64 times into a
+float32 column, and mixing in rows without a column fills it with nan and
+turns it into objects. check() is the hook which catches this. It casts
+anything which can be put back without losing information, with a warning
+so the drift can be traced back to the write which caused it, and raises
+an error on anything else. With strict = True any drift is an error.
+
+The vaccination columns and vaccine modifiers are only there in
+vaccination runs, so columns are only checked if meta has them.
+
+INDEX
+    apply: cast meta to the schema
+    check: catch any columns which have drifted from the schema
+"""
+
+
+#%% SETUP Load Libraries
+import warnings
+import numpy as np
+
+
+# My modules
+import src.infections.states as st
+
+
+# The dtype of every column of meta
+SCHEMA = {'gender': 'int8',
+          'age': 'float64',
+          'age_group': 'int8',
+          'orientation': 'int8',
+          'risk': 'int8',
+          'partner': 'int32',
+          'counter': 'int32',
+          'state': 'int8',
+          'sites': 'uint8',
+          'site0_t0': 'float32',
+          'site1_t0': 'float32',
+          'site2_t0': 'float32',
+          'site0_t1': 'float32',
+          'site1_t1': 'float32',
+          'site2_t1': 'float32',
+          'site0_symptoms': 'bool',
+          'site1_symptoms': 'bool',
+          'site2_symptoms': 'bool',
+          'treatment_threshold': 'float32',
+          'treatment_time': 'float32',
+          'recovery_time': 'float32',
+          'import_time': 'int32',
+          'vaccinated': 'bool',
+          'vaccination_t0': 'float32',
+          'vaccination_t1': 'float32',
+          'booster_t0': 'float32',
+          'vaccination_time': 'float32',
+          'site0_trans_mod': 'float32',
+          'site1_trans_mod': 'float32',
+          'site2_trans_mod': 'float32',
+          'site0_symp_mod': 'float32',
+          'site1_symp_mod': 'float32',
+          'site2_symp_mod': 'float32',
+          'site0_duration_mod': 'float32',
+          'site1_duration_mod': 'float32',
+          'site2_duration_mod': 'float32'}
+
+
+#%% FUN apply()
+#
+#
+# Cast meta to the schema, converting it from the old string states and site
+# columns first if needed.
+#
+# Columns which can't be cast yet, like flags which are nan for people who
+# have just been appended, are left for check() to pick up later on.
+#
+#
+def apply(meta):
+
+
+    # Make sure states and sites are encoded
+    meta = st.encode(meta)
+
+
+    # Cast whatever can be cast
+    for c, dtype in SCHEMA.items():
+        if (c in meta.columns) and (meta[c].dtype != dtype):
+            cast = _cast(meta[c], dtype)
+            if cast is not None:
+                meta[c] = cast
+
+
+    return meta
+
+
+#%% FUN check()
+#
+#
+# Validation hook for dtype drift, called once per time step before meta is
+# saved.
+#
+#
+# INPUT
+#   meta
+#   strict = raise an error on any drift rather than casting it back
+#
+# OUTPUT
+#   meta with every column back on the schema
+#
+#
+def check(meta, strict = False):
+
+
+    # Find the columns which have drifted
+    drift = [c for c, dtype in SCHEMA.items() if (c in meta.columns) and (meta[c].dtype != dtype)]
+    if strict and (len(drift) > 0):
+        raise TypeError('Columns of meta have drifted from the schema: ' + \
+                        ', '.join(c + ' (' + str(meta[c].dtype) + ', not ' + SCHEMA[c] + ')' for c in drift))
+
+
+    # Put them back if nothing is lost
+    if len(drift) > 0:
+        warnings.warn('Casting columns of meta back to the schema: ' + \
+                      ', '.join(c + ' (' + str(meta[c].dtype) + ', not ' + SCHEMA[c] + ')' for c in drift))
+    lost = []
+    for c in drift:
+        cast = _cast(meta[c], SCHEMA[c])
+        if cast is None:
+            lost.append(c)
+        else:
+            meta[c] = cast
+    if len(lost) > 0:
+        raise TypeError('Columns of meta no longer fit the schema: ' + \
+                        ', '.join(c + ' (' + str(meta[c].dtype) + ', not ' + SCHEMA[c] + ')' for c in lost))
+
+
+    return meta
+
+
+#%% HELPER _cast()
+#
+#
+# Cast a column to a dtype, or return None if that would lose information.
+# Anything numeric can be cast to a float. Integers and flags have to come
+# back exactly, with no missing values.
+#
+#
+def _cast(column, dtype):
+
+
+    # Try the cast
+    dtype = np.dtype(dtype)
+    try:
+        with np.errstate(invalid = 'ignore', over = 'ignore'):
+            cast = column.astype(dtype)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+    # Check nothing was lost
+    if dtype.kind != 'f':
+        if column.isna().any() or not np.all(cast.to_numpy() == column.to_numpy()):
+            return None
+
+
+    return cast
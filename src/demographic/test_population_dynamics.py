@@ -20,6 +20,8 @@ import time
 # My modules
 import src.demographic.generate_population as pop
 import src.demographic.population_dynamics as demo
+import src.partners.partners as prt
+import src.partners.partnership_graph as pg
 import src.calibration.setup as setup
 
 
@@ -35,6 +37,10 @@ population_no = 0
 pop_parameters = pop.setup_data(scenario, run_mode)
 
 
+# Parse partnership behaviour parameters
+prt_parameters = prt.setup_data()
+
+
 # Parse infection parameters
 # Pass this function which numbered parameter set you want to use
 # Will default back to the baseline parameter set
@@ -46,8 +52,7 @@ meta = pd.read_feather('simulations/populations/scenario_' + str(scenario) + '/p
 
 
 # Initilise partnership data
-partner_matrix = pop.initilise_partner_matrix(pop_parameters)
-partner_expire = pop.initilise_partner_duration(pop_parameters)
+partner_graph = pg.PartnershipGraph(meta)
 
 
 # Initilise importation data
@@ -83,7 +88,7 @@ for t in tqdm.tqdm(tt):
 
 
     # Update population
-    meta, partner_matrix, partner_expire = demo.update_population(pop_parameters, inf_parameters, meta, partner_matrix, partner_expire, t)
+    meta, partner_graph = demo.update_population(pop_parameters, prt_parameters, inf_parameters, meta, partner_graph, t)
 
 
     # How many are in each compartment?
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Queue of scheduled infection events
+
+Rather than scanning the whole of meta every day for the few people whose
+latent period, infection, treatment-conferred immunity or vaccine has just
+come to an end, or who seeks treatment or is due a vaccine, the times in
+
+    site0_t0, site1_t0, site2_t0    - the end of the latent period at each site
+    site0_t1, site1_t1, site2_t1    - the end of the infection at each site
+    treatment_time                  - when somebody seeks treatment
+    recovery_time                   - the end of treatment-conferred immunity
+    vaccination_t1                  - the end of vaccine-conferred immunity
+    vaccination_time                - when somebody is due to be vaccinated
+    booster_t0                      - when somebody is due a booster
+
+are put into a queue as they are set, bucketed by the day on which they
+will be acted on. Each day only the events in that day's buckets are looked
+at.
+
+People are tracked by their PartnershipGraph person_id, so the queue doesn't
+need to be told when meta is renumbered. Events are never taken out of the
+queue when plans change, for example when treatment clears an infection
+early. Instead each event remembers the time it was scheduled for, and it
+is thrown away when it comes up if that time is no longer in meta. Times
+are kept at float32, the precision meta stores them at (see
+src/demographic/schema.py), so that a time reads back the same whether or
+not its column has been cast back since it was set. Anybody
+who joins meta without going through the queue, like imported cases, is
+picked up the next time the queue is read.
+
+INDEX
+    InfectionEvents: the event queue
+    due: the people with events due today, with or without a queue
+"""
+
+
+#%% SETUP Load Libraries
+import numpy as np
+import heapq
+
+
+# Columns of meta tracked by the queue and when each is acted on
+#   after = on the first day after the time
+#   on = on the first day at or after the time
+COLUMNS = {'site0_t0': 'after',
+           'site1_t0': 'after',
+           'site2_t0': 'after',
+           'site0_t1': 'on',
+           'site1_t1': 'on',
+           'site2_t1': 'on',
+           'treatment_time': 'on',
+           'recovery_time': 'after',
+           'vaccination_t1': 'after',
+           'vaccination_time': 'on',
+           'booster_t0': 'on'}
+
+
+#%% CLASS InfectionEvents
+#
+#
+# Time-bucketed queue of the times in COLUMNS.
+#
+# Anything which sets one of these times should call schedule() afterwards
+# so that the new time is picked up.
+#
+# Attributes
+#   partner_graph = the PartnershipGraph, used to look up person_ids
+#   buckets = dictionary for each column of dictionaries mapping each day to
+#             a list of (person_ids, times) scheduled for that day
+#   days = heap of the days with buckets for each column
+#   n_seen = everybody with a person_id below this has been scheduled
+#
+#
+class InfectionEvents:
+
+
+    def __init__(self, meta, partner_graph):
+        self.partner_graph = partner_graph
+        self.buckets = {c: {} for c in COLUMNS}
+        self.days = {c: [] for c in COLUMNS}
+        self.n_seen = 0
+        self.catch_up(meta)
+
+
+    #%% METHOD schedule()
+    # Put the times in some columns of meta for the given people into the queue
+    def schedule(self, meta, columns, people):
+
+
+        # Look up who they are
+        people = np.asarray(people, dtype = int)
+        person_id = self.partner_graph.person_id[people]
+
+
+        # Go through each of the columns they've had set
+        for c in columns:
+            if c not in meta.columns:
+                continue
+
+
+            # Pull out the times that are set, at the precision meta keeps them
+            times = meta[c].to_numpy(dtype = np.float32)[people]
+            use = np.isfinite(times)
+            ids, times = person_id[use], times[use]
+            days = (np.floor(times) + 1 if COLUMNS[c] == 'after' else np.ceil(times)).astype(int)
+
+
+            # Put them into the buckets for their days
+            for d in np.unique(days):
+                d = int(d)
+                if d not in self.buckets[c]:
+                    self.buckets[c][d] = []
+                    heapq.heappush(self.days[c], d)
+                self.buckets[c][d].append((ids[days == d], times[days == d]))
+
+
+    #%% METHOD catch_up()
+    # Schedule everybody who has joined meta since the last time
+    def catch_up(self, meta):
+        new = np.flatnonzero(self.partner_graph.person_id >= self.n_seen)
+        self.n_seen = self.partner_graph.next_id
+        self.schedule(meta, COLUMNS, new)
+
+
+    #%% METHOD pop()
+    # Take all the events in some columns which are due by day t out of the
+    # queue and return the rows of the people they are still valid for
+    def pop(self, meta, t, columns):
+
+
+        # Make sure anybody new is in there
+        self.catch_up(meta)
+        person_id = self.partner_graph.person_id
+
+
+        # Empty out the buckets of each column up to today
+        due = {}
+        for c in columns:
+            ids, times = [np.zeros(0, dtype = int)], [np.zeros(0, dtype = np.float32)]
+            while (len(self.days[c]) > 0) and (self.days[c][0] <= t):
+                for i, x in self.buckets[c].pop(heapq.heappop(self.days[c])):
+                    ids.append(i)
+                    times.append(x)
+            ids, times = np.concatenate(ids), np.concatenate(times)
+            if len(ids) == 0:
+                due[c] = ids
+                continue
+
+
+            # Drop anybody who has left or whose plans have changed
+            rows = np.minimum(np.searchsorted(person_id, ids), len(person_id) - 1)
+            valid = (person_id[rows] == ids)
+            valid[valid] = meta[c].to_numpy(dtype = np.float32)[rows[valid]] == times[valid]
+            due[c] = np.unique(rows[valid])
+
+
+        return due
+
+
+#%% FUN due()
+#
+#
+# Work out who has an event due on day t in each of the given columns.
+#
+# With a queue only the people with events in the queue are looked at,
+# otherwise everybody in meta is checked.
+#
+#
+# INPUT
+#   meta, t
+#   columns = list of columns from COLUMNS
+#   events = the InfectionEvents queue, or None to check everybody
+#
+# OUTPUT
+#   dictionary with the rows of meta with events due in each column
+#
+#
+def due(meta, t, columns, events = None):
+
+
+    # Either pull people out of the queue or check everybody
+    if events is not None:
+        return events.pop(meta, t, columns)
+    else:
+        due = {}
+        for c in columns:
+            times = meta[c].to_numpy(dtype = float)
+            due[c] = np.flatnonzero(times < t if COLUMNS[c] == 'after' else times <= t)
+        return due
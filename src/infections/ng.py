@@ -14,25 +14,35 @@ import pandas as pd
 import scipy.stats as sp
 
 
+# My modules
+import src.infections.events as ev
+import src.infections.states as st
+import src.infections.streams as rs
+import src.infections.transitions as tr
+
+
 #%% FUN update_infections()
 #
 #
 # Function to update the state of infections
 #
+# If an InfectionEvents queue is given, only the people with events due
+# today are progressed, otherwise everybody is checked.
 #
-def update_infections(inf_parameters, meta, partner_matrix, t):
+#
+def update_infections(inf_parameters, meta, partner_graph, t, events = None):
 
 
     # Implement a transmission event
-    meta = new_infections(inf_parameters, meta, partner_matrix, t)
+    meta = new_infections(inf_parameters, meta, partner_graph, t, events = events)
 
 
     # Update infectious states
-    meta = progress_state_of_infection(meta, t)
+    meta = progress_state_of_infection(meta, t, events)
 
 
     # Implement treatment
-    meta = seek_treatment(inf_parameters, meta, partner_matrix, t)
+    meta = seek_treatment(inf_parameters, meta, partner_graph, t, events)
 
 
     return meta
@@ -64,11 +74,11 @@ def update_infections(inf_parameters, meta, partner_matrix, t):
 #
 #    mean_rectal
 #    var_rectal
-#    symptomatic_rectal
+#    symptoms_rectal
 #
 #    mean_urethral
 #    var_urethral
-#    symptomatic_urethral - 1x2 list, columns correspond to gender
+#    symptoms_urethral - 1x2 list, columns correspond to gender
 #
 #    mean_phar
 #    var_rectal
@@ -82,10 +92,10 @@ def duration_rectal(inf_parameters, infectee):
 
 
     # Simulate duration of natural infection
-    duration = np.random.gamma(inf_parameters['infection'].mean_rectal[infectee.gender] / \
-                               inf_parameters['infection'].var_rectal[infectee.gender], \
-                               inf_parameters['infection'].var_rectal[infectee.gender],
-                               len(infectee))
+    duration = rs.stream('durations').gamma(inf_parameters['infection'].mean_rectal[infectee.gender] / \
+                                            inf_parameters['infection'].var_rectal[infectee.gender], \
+                                            inf_parameters['infection'].var_rectal[infectee.gender],
+                                            len(infectee))
 
 
     # Return duration
@@ -97,10 +107,10 @@ def duration_urethral(inf_parameters, infectee):
 
 
     # Simulate duration of natural infection
-    duration = np.random.gamma(inf_parameters['infection'].mean_urethral[infectee.gender] / \
-                               inf_parameters['infection'].var_urethral[infectee.gender], \
-                               inf_parameters['infection'].var_urethral[infectee.gender],
-                               len(infectee))
+    duration = rs.stream('durations').gamma(inf_parameters['infection'].mean_urethral[infectee.gender] / \
+                                            inf_parameters['infection'].var_urethral[infectee.gender], \
+                                            inf_parameters['infection'].var_urethral[infectee.gender],
+                                            len(infectee))
 
 
     # Return duration
@@ -112,10 +122,10 @@ def duration_pharyngeal(inf_parameters, infectee):
 
 
     # Simulate duration of natural infection
-    duration = np.random.gamma(inf_parameters['infection'].mean_pharyngeal[infectee.gender] / \
-                               inf_parameters['infection'].var_pharyngeal[infectee.gender], \
-                               inf_parameters['infection'].var_pharyngeal[infectee.gender],
-                               len(infectee))
+    duration = rs.stream('durations').gamma(inf_parameters['infection'].mean_pharyngeal[infectee.gender] / \
+                                            inf_parameters['infection'].var_pharyngeal[infectee.gender], \
+                                            inf_parameters['infection'].var_pharyngeal[infectee.gender],
+                                            len(infectee))
 
     # Return duration
     return duration
@@ -126,22 +136,146 @@ def duration_treatment_immunity(parameters, treat):
 
 
     # All treatment results results in a Gamma distributed immune period
-    duration = np.random.gamma(parameters['infection'].immunity_mean[0]/ \
-                               parameters['infection'].immunity_var[0], \
-                               parameters['infection'].immunity_var[0], len(treat))
+    duration = rs.stream('durations').gamma(parameters['infection'].immunity_mean[0]/ \
+                                            parameters['infection'].immunity_var[0], \
+                                            parameters['infection'].immunity_var[0], len(treat))
 
 
     # Return duration
     return duration
 
 
+#%% FUN treatment_delay()
+#
+#
+# Time from the end of the latent period at a symptomatic site until somebody
+# seeks treatment. This is when the Gamma CDF of the time since the end of
+# the latent period reaches their treatment_threshold.
+#
+#
+def treatment_delay(parameters, threshold):
+
+
+    # Invert the Gamma CDF at their threshold
+    delay = sp.gamma.ppf(threshold, \
+                         parameters['infection'].treatment_mean[0]/parameters['infection'].treatment_var[0], \
+                         parameters['infection'].treatment_var[0])
+
+
+    return delay
+
+
+#%% FUN treatment_time()
+#
+#
+# Time at which people will seek treatment given their current infections,
+# which is the delay after the first of their symptomatic sites leaves its
+# latent period. Anybody with no symptomatic sites gets inf.
+#
+#
+# INPUT
+#   parameters, meta
+#   people = rows of meta to work out treatment times for
+#
+# OUTPUT
+#   array of treatment times
+#
+#
+def treatment_time(parameters, meta, people):
+
+
+    # Pull out the sites which are symptomatic
+    people = np.asarray(people, dtype = int)
+    t0 = meta[["site0_t0", "site1_t0", "site2_t0"]].to_numpy(dtype = float)[people]
+    symptoms = meta[["site0_symptoms", "site1_symptoms", "site2_symptoms"]].to_numpy()[people] == True
+
+
+    # Add the delay to the first of them
+    start = np.min(np.where(symptoms, t0, float("inf")), axis = 1)
+    time = start + treatment_delay(parameters, meta.treatment_threshold.to_numpy(dtype = float)[people])
+
+
+    return time
+
+
+#%% FUN set_treatment_time()
+#
+#
+# Store the treatment times of some people in meta and put them into the
+# InfectionEvents queue if given. The times are worked out by
+# treatment_time_fun(parameters, meta, people), treatment_time() unless
+# another treatment model is being used.
+#
+#
+def set_treatment_time(parameters, meta, people, events = None, treatment_time_fun = treatment_time):
+
+
+    # Store their treatment times
+    people = np.asarray(people, dtype = int)
+    if len(people) == 0:
+        return meta
+    meta.loc[people, "treatment_time"] = np.asarray(treatment_time_fun(parameters, meta, people), dtype = np.float32)
+
+
+    # Schedule their treatment
+    if events is not None:
+        events.schedule(meta, ["treatment_time"], people)
+
+
+    return meta
+
+
+#%% FUN treatment_due()
+#
+#
+# Work out who seeks treatment on day t.
+#
+# Treatment times are set whenever somebody picks up a new infection, so
+# they can only come up early if one of their symptomatic sites has since
+# cleared up on its own. The times which come up are checked against their
+# current infections and moved back if needed. Anybody without a treatment
+# time yet, like imports, gets one first.
+#
+#
+# INPUT
+#   parameters, meta, t
+#   events = the InfectionEvents queue, or None to check everybody
+#   treatment_time_fun = works out treatment times, as in set_treatment_time()
+#
+# OUTPUT
+#   meta
+#   treat = rows of meta who seek treatment today
+#
+#
+def treatment_due(parameters, meta, t, events = None, treatment_time_fun = treatment_time):
+
+
+    # Work out treatment times for anybody who doesn't have one
+    if "treatment_time" not in meta.columns:
+        meta["treatment_time"] = np.full(len(meta), np.nan, dtype = np.float32)
+    new = np.flatnonzero(meta.treatment_time.isna().to_numpy())
+    meta = set_treatment_time(parameters, meta, new, events, treatment_time_fun)
+
+
+    # Check that the times which have come up still hold
+    due = ev.due(meta, t, ["treatment_time"], events)["treatment_time"]
+    time = treatment_time_fun(parameters, meta, due)
+    treat = due[time <= t]
+
+
+    # Move the rest back
+    meta = set_treatment_time(parameters, meta, due[time > t], events, treatment_time_fun)
+
+
+    return meta, treat
+
+
 #%% FUN latent_period()
 def latent_period(inf_parameters, infectee):
 
 
     # Just using a constant latent period for now
-    out = inf_parameters['infection'].latent_period[infectee.gender]
-    out = np.repeat(out, len(infectee))
+    out = inf_parameters['infection'].latent_period.to_numpy()[infectee.gender.to_numpy(dtype = int)]
 
 
     return out
@@ -150,25 +284,39 @@ def latent_period(inf_parameters, infectee):
 #%% FUN transmission_probability()
 #
 #
-# Compute the site-specific transmission probabilities
+# Compute the site-specific transmission probabilities across a set of
+# partnerships between infectors i and their partners j.
+#
+# Each sexual act takes place with probability (1 + number of high-risk
+# partners) x p_act(gender of i, gender of j), and the transmission
+# probabilities of all the acts that take place are added up. These are
+# looked up in the tables from setup.compile_transmission().
+#
+#
+# INPUT
+#   i, j = arrays of the infectors and their partners
+#
+# OUTPUT
+#   trans_prob = array with the transmission probability from site a of
+#                person i to site b of person j at [partnership, a, b]
 #
 #
 def transmission_probability(inf_parameters, vax_parameters, meta, i, j):
 
 
     # Pull out some indicies for convenience
-    g0 = int(meta.at[i, "gender"])
-    g1 = int(meta.at[j, "gender"])
-    risk = 1 + meta.at[i, "risk"] + meta.at[j, "risk"]
+    g0 = meta.gender.to_numpy(dtype = int)[i]
+    g1 = meta.gender.to_numpy(dtype = int)[j]
+    risk = meta.risk.to_numpy(dtype = int)[i] + meta.risk.to_numpy(dtype = int)[j]
+
 
+    # Decide which acts take place
+    p_act = inf_parameters['act_prob'][g0, g1, risk]
+    acts = rs.stream('acts').random(p_act.shape) < p_act
 
-    # Compose the transition probability matrix
-    trans_prob = \
-        float(np.random.random(1) < risk * inf_parameters['p_anal'][g0, g1]) * inf_parameters['trans_anal'] + \
-        float(np.random.random(1) < risk * inf_parameters['p_oral'][g0, g1]) * inf_parameters['trans_oral'] + \
-        float(np.random.random(1) < risk * inf_parameters['p_kiss'][g0, g1]) * inf_parameters['trans_kiss'] + \
-        float(np.random.random(1) < risk * inf_parameters['p_rim'][g0, g1]) * inf_parameters['trans_rim'] + \
-        float(np.random.random(1) < risk * inf_parameters['p_sex'][g0, g1]) * inf_parameters['trans_sex']
+
+    # Add up the transmission probabilities of those acts
+    trans_prob = np.tensordot(acts, inf_parameters['act_trans'], axes = 1)
 
 
     return trans_prob
@@ -180,7 +328,7 @@ def transmission_probability(inf_parameters, vax_parameters, meta, i, j):
 def symptoms_rectal(inf_parameters,
                     vax_parameters,
                     meta, i, j):
-    prob = np.random.random() < inf_parameters['infection'].symptoms_rectal[meta.gender.iloc[j]]
+    prob = rs.stream('symptoms').random(len(j)) < inf_parameters['infection'].symptoms_rectal.to_numpy()[meta.gender.to_numpy(dtype = int)[j]]
     return prob
 
 
@@ -190,7 +338,7 @@ def symptoms_rectal(inf_parameters,
 def symptoms_pharynx(inf_parameters,
                      vax_parameters,
                      meta, i, j):
-    prob = np.random.random() < inf_parameters['infection'].symptoms_pharyngeal[meta.gender.iloc[j]]
+    prob = rs.stream('symptoms').random(len(j)) < inf_parameters['infection'].symptoms_pharyngeal.to_numpy()[meta.gender.to_numpy(dtype = int)[j]]
     return prob
 
 
@@ -200,7 +348,7 @@ def symptoms_pharynx(inf_parameters,
 def symptoms_urethra(inf_parameters,
                      vax_parameters,
                      meta, i, j):
-    prob = np.random.random() < inf_parameters['infection'].symptoms_urethral[meta.gender.iloc[j]]
+    prob = rs.stream('symptoms').random(len(j)) < inf_parameters['infection'].symptoms_urethral.to_numpy()[meta.gender.to_numpy(dtype = int)[j]]
     return prob
 
 
@@ -233,31 +381,47 @@ duration_baseline = {'site0': duration_baseline_site0,
 # sex i (0=F, 1=M) engaging in that particular act with an individual of sex j.
 #
 #
-
-#
-#
-# Decision tree:
-#
-#    1. Find all individuals in the population who have at least 1 partner
-#        and are infections.
+# All of the partnerships are dealt with at once:
 #
-#    2. For a given person i, look at all their partners j and check that:
-#        a. Individual j is not immune
-#        b. Individual j is not infected at all 3 sites
+#    1. Find all partnerships between somebody who is infectious and a
+#        partner j who:
+#        a. Is not immune
+#        b. Is not infected at all 3 sites
 #
-#    3. Given an infectious individual i and a potentially infectable partner j
-#        use the act-specific probabilities to determine whether or not a
-#        particular sexual act takes place.
+#    2. For every one of these partnerships, use the act-specific
+#        probabilities to determine whether or not a particular sexual act
+#        takes place.
 #
-#    4. Given a range of sexual acts, use the site-specific probabilities to
+#    3. Given the sexual acts, use the site-specific probabilities to
 #        determine which sites are to be infected.
 #
+#    4. Drop any infections at sites which are already infected or exposed,
+#        and if somebody is infected at the same site by more than one
+#        partner then keep the first.
+#
 #    5. Seed those sites with an infection. They will not become infectious
 #        until the latent period is over.
 #
 #
+# The hooks are called once for all the partnerships, or all the new
+# infections at a site, with arrays of infectors i and partners j:
+#    trans_prob_fun(inf_parameters, vax_parameters, meta, i, j) returns the
+#        transmission probabilities as in transmission_probability()
+#    symptoms_prob[site](inf_parameters, vax_parameters, meta, i, j) returns
+#        whether each new infection is symptomatic
+#    duration_mod[site](vax_parameters, meta, j) returns a multiplier on the
+#        duration of each new infection
+#    treatment_time_fun(inf_parameters, meta, j) returns the time each
+#        newly infected person will seek treatment, as in treatment_time()
+#
+#
+# The treatment times of anybody newly infected are worked out with
+# set_treatment_time(). Any new infection and treatment times are put into
+# the InfectionEvents queue if given.
+#
+#
 # INPUT
-#   meta, partner_matrix, t
+#   meta, partner_graph, t
 #   p_anal, The probability of a given sexual act (Act-specific probabilities)
 #   p_oral,
 #   p_kiss,
@@ -273,170 +437,178 @@ duration_baseline = {'site0': duration_baseline_site0,
 #   meta
 #
 #
-def new_infections(inf_parameters, meta, partner_matrix, t,
-                   susceptible_states = ['S', 'E', 'I'],
+def new_infections(inf_parameters, meta, partner_graph, t,
+                   susceptible_states = [st.S, st.E, st.I],
                    trans_prob_fun = transmission_probability,
                    vax_parameters = [],
                    symptoms_prob = symptoms_baseline,
-                   duration_mod = duration_baseline):
-
+                   duration_mod = duration_baseline,
+                   events = None,
+                   treatment_time_fun = treatment_time):
 
-    # Determine whether or not any new infections could possibly occur
-    infectors = meta[(meta["state"] == "I") & (np.sum(partner_matrix, axis = 1) > 0)]
 
+    # Look at every partnership both ways round
+    edge_i, edge_j, _, _ = partner_graph.edges()
+    i = np.append(edge_i, edge_j)
+    j = np.append(edge_j, edge_i)
 
-    # Iterate over all infectors
-    for i in infectors.index:
 
+    # Keep those between an infector and a partner who could be infected
+    sites = st.site_matrix(meta)
+    infector = (meta.state == st.I).to_numpy()
+    susceptible = np.isin(meta.state.to_numpy(), st.code(susceptible_states)) & (meta.sites.to_numpy() != st.ALL_SITES)
+    keep = infector[i] & susceptible[j]
+    i = i[keep]
+    j = j[keep]
 
-        # Extract all partners of the infector
-        partners = np.asarray(np.where(partner_matrix[i,:] == 1))
 
+    # Go through the infectors in order
+    order = np.argsort(i, kind = 'stable')
+    i = i[order]
+    j = j[order]
+    if len(i) == 0:
+        return meta
 
-        # Remove partners who are either immune or already infected at all sites
-        partner_susceptible = meta.loc[partners[0,:], 'state'].isin(susceptible_states)
-        partner_site = (meta.loc[partners[0,:], "site0"] == 1) & \
-                       (meta.loc[partners[0,:], "site1"] == 1) & \
-                       (meta.loc[partners[0,:], "site2"] == 1)
-        partners = partners[0, partner_susceptible & (~partner_site)]
 
+    # Determine if any transmissions have occured this iteration
+    M = sites[i, :, None] * trans_prob_fun(inf_parameters, vax_parameters, meta, i, j)
+    U = rs.stream('transmission').random(M.shape)
+    N = np.any(U < M, axis = 1)
 
-        # Iterate over all partnerships with potential for transmission
-        for j in partners:
 
+    # Make sure any new infections don't overlap with current infections
+    exposures = meta[["site0_t0", "site1_t0", "site2_t0"]].to_numpy(dtype = float) < float("inf")
+    N = N & ~((sites[j, :] == 1) | exposures[j, :])
 
-            # Pull out some indices for convenience
-            trans_prob = trans_prob_fun(inf_parameters, vax_parameters, meta, i, j)
 
+    # Seed new infections at each site
+    durations = [duration_rectal, duration_urethral, duration_pharyngeal]
+    for k in range(0, 3):
 
-            # Determine if any transmissions have occured this iteration
-            sites = np.array(meta.loc[i, ["site0", "site1", "site2"]])
-            M = sites * np.transpose(trans_prob)
-            U = np.random.random((3, 3))
-            N = np.sum(U < M, axis=1) > 0
-            print(M, U, N)
-            new_inf = np.flatnonzero(N)
 
+        # Only infect each person once at each site
+        infectee, first = np.unique(j[N[:, k]], return_index = True)
+        infector = i[N[:, k]][first]
+        if len(infectee) == 0:
+            continue
 
-            # Make sure any new infections don't overlap with current infections
-            infectee = meta.loc[j,:]
-            sites = infectee[["site0", "site1", "site2"]] == 1
-            exposures = infectee[["site0_t0", "site1_t0", "site2_t0"]] < float("inf")
-            old_inf = np.where(sites.to_numpy() | exposures.to_numpy())
-            new_inf = new_inf[~np.isin(new_inf, old_inf)]
 
+        # Set duration of latent period (assumed to be the same for all sites)
+        site = "site" + str(k)
+        end_latent = t + latent_period(inf_parameters, meta.loc[infectee, :])
+        meta.loc[infectee, site + "_t0"] = np.asarray(end_latent, dtype = np.float32)
 
-            # Seed new infections
-            if len(new_inf) > 0:
 
+        # Set site-specific infection parameters
+        duration = durations[k](inf_parameters, meta.loc[infectee, :])
+        meta.loc[infectee, site + "_t1"] = (end_latent + np.asarray(duration_mod[site](vax_parameters, meta, infectee)) * np.asarray(duration)).astype(np.float32)
+        meta.loc[infectee, site + "_symptoms"] = np.asarray(symptoms_prob[site](inf_parameters, vax_parameters, meta, infector, infectee))
 
-                # Update state of infectee
-                meta.at[j, 'state'] = ('E' if infectee.state == 'S' else infectee.state)
 
+        # Schedule when they'll progress
+        if events is not None:
+            events.schedule(meta, [site + "_t0", site + "_t1"], infectee)
 
-                # Set infection parameters for the new cases
-                for k in new_inf:
 
+    # Update state of infectees
+    exposed = np.zeros(len(meta), dtype = bool)
+    exposed[j[np.any(N, axis = 1)]] = True
+    meta.loc[exposed & (meta.state == st.S).to_numpy(), "state"] = st.E
 
-                    # Set duration of latent period (assumed to be the same for all sites)
-                    end_latent = t + latent_period(inf_parameters, infectee)
-                    meta.at[j, "site" + str(int(k)) + "_t0"] = end_latent
 
-
-                    # Set site-specific infection parameters
-                    if k == 0:
-
-                        # Infection at rectum
-                        meta.at[j, "site0_t1"] = end_latent + duration_mod['site0'](vax_parameters, meta, j) * duration_rectal(inf_parameters, infectee)
-                        meta.at[j, 'site0_symptoms'] = symptoms_prob['site0'](inf_parameters, vax_parameters, meta, i, j)
-                    elif k == 1:
-
-                        # Infection at pharynx
-                        meta.at[j, "site1_t1"] = end_latent + duration_mod['site1'](vax_parameters, meta, j) * duration_urethral(inf_parameters, infectee)
-                        meta.at[j, 'site1_symptoms'] = symptoms_prob['site1'](inf_parameters, vax_parameters, meta, i, j)
-                    else:
-
-                        # Infection at urethra
-                        meta.at[j, "site2_t1"] = end_latent + duration_mod['site2'](vax_parameters, meta, j) * duration_pharyngeal(inf_parameters, infectee)
-                        meta.at[j, 'site2_symptoms'] = symptoms_prob['site2'](inf_parameters, vax_parameters, meta, i, j)
+    # Work out when they'll seek treatment
+    meta = set_treatment_time(inf_parameters, meta, np.flatnonzero(exposed), events, treatment_time_fun)
 
 
     # Return meta
     return meta
 
 
+#%% VAR PROGRESSION
+# TRANSITIONS BETWEEN INFECTION STATES
+#
+#
+# The transitions run each day by progress_state_of_infection(), in order,
+# see src/infections/transitions.py:
+#
+#   siteK_infectious = the latent period at site K ends
+#   siteK_clears = the infection at site K clears up on its own
+#   natural_recovery = anybody left without an infected site is susceptible
+#   immunity_wanes = treatment-conferred immunity runs out
+#
+#
+def site_infectious(k):
+    site, bit = 'site' + str(k), st.SITE_BITS[k]
+    return {'name': site + '_infectious',
+            'timer': site + '_t0',
+            'when': lambda x, rows: (x['sites'][rows] & bit) == 0,
+            'set': {'state': st.I,
+                    'sites': lambda x, rows, t, parameters: x['sites'][rows] | bit}}
+
+
+def site_clears(k):
+    site, bit = 'site' + str(k), st.SITE_BITS[k]
+    return {'name': site + '_clears',
+            'timer': site + '_t1',
+            'set': {'sites': lambda x, rows, t, parameters: x['sites'][rows] & ~bit,
+                    site + '_t0': float('inf'),
+                    site + '_t1': float('inf'),
+                    site + '_symptoms': False}}
+
+
+PROGRESSION = [site_infectious(0), site_infectious(1), site_infectious(2),
+               site_clears(0), site_clears(1), site_clears(2),
+               {'name': 'natural_recovery',
+                'timer': ['site0_t1', 'site1_t1', 'site2_t1'],
+                'when': lambda x, rows: x['sites'][rows] == 0,
+                'set': {'state': st.S}},
+               {'name': 'immunity_wanes',
+                'timer': 'recovery_time',
+                'set': {'state': st.S,
+                        'recovery_time': float('inf')}}]
+
+
+#%% VAR TREATMENT
+# Treatment clears all infections and confers immunity for a while. This is
+# triggered by seek_treatment() rather than by a timer.
+TREATMENT = [{'name': 'treatment',
+              'timer': None,
+              'set': {'state': st.T,
+                      'recovery_time': lambda x, rows, t, parameters: t + duration_treatment_immunity(parameters, rows),
+                      'sites': 0,
+                      'site0_t0': float('inf'),
+                      'site1_t0': float('inf'),
+                      'site2_t0': float('inf'),
+                      'site0_t1': float('inf'),
+                      'site1_t1': float('inf'),
+                      'site2_t1': float('inf'),
+                      'site0_symptoms': False,
+                      'site1_symptoms': False,
+                      'site2_symptoms': False,
+                      'treatment_time': float('inf')}}]
+
+
 #%% FUN progress_state_of_infection()
 # PROGRESS THE STATE OF INFECTION
 #
 #
 # Simply checks the duration of each compartment and progresses the
-# individual if the duration is up.
+# individual if the duration is up, using the transitions in PROGRESSION.
+#
+# With an InfectionEvents queue only the people with events due today are
+# looked at, otherwise everybody is checked.
 #
 #
 # INPUT
 #   meta, t
+#   events = the InfectionEvents queue, or None
 #
 # OUTPUT
 #   meta
 #
 #
-def progress_state_of_infection(meta, t):
-
-
-    # Test for new rectal infections
-    infectious = (meta["site0_t0"] < t) & (meta["site0"] == 0)
-    meta.loc[infectious, "state"] = "I"
-    meta.loc[infectious, "site0"] = 1
-
-
-    # Test for new urethral infections
-    infectious = (meta["site1_t0"] < t) & (meta["site1"] == 0)
-    meta.loc[infectious, "state"] = "I"
-    meta.loc[infectious, "site1"] = 1
-
-
-    # Test for new pharyngeal infections
-    infectious = (meta["site2_t0"] < t) & (meta["site2"] == 0)
-    meta.loc[infectious, "state"] = "I"
-    meta.loc[infectious, "site2"] = 1
-
-
-    # Remove expired rectal infections
-    recovery0 = meta["site0_t1"] <= t
-    meta.at[recovery0, "site0"] = 0
-    meta.at[recovery0, "site0_t0"] = float("inf")
-    meta.at[recovery0, "site0_t1"] = float("inf")
-    meta.at[recovery0, 'site0_symptoms'] = False
-
-
-    # Remove expired urethral infections
-    recovery1 = meta["site1_t1"] <= t
-    meta.at[recovery1, "site1"] = 0
-    meta.at[recovery1, "site1_t0"] = float("inf")
-    meta.at[recovery1, "site1_t1"] = float("inf")
-    meta.at[recovery1, 'site1_symptoms'] = False
-
-
-    # Remove expired pharengynal infections
-    recovery2 = meta["site2_t1"] <= t
-    meta.at[recovery2, "site2"] = 0
-    meta.at[recovery2, "site2_t0"] = float("inf")
-    meta.at[recovery2, "site2_t1"] = float("inf")
-    meta.at[recovery2, 'site2_symptoms'] = False
-
-
-    # Check if anybody has achieved a natural recovery
-    natural_recovery = ((recovery0 | recovery1) | recovery2) & (meta.site0==0) & (meta.site1==0) & (meta.site2==0)
-    meta.at[natural_recovery, 'state'] = 'S'
-
-
-    # Remove treatment-conferred immunity
-    waned_immunity = meta["recovery_time"] < t
-    meta.loc[waned_immunity, "state"] = "S"
-    meta.loc[waned_immunity, "recovery_time"] = float("inf")
-
-
-    return meta
+def progress_state_of_infection(meta, t, events = None):
+    return tr.step(meta, t, PROGRESSION, events = events)
 
 
 #%% FUN seek_treatment()
@@ -445,6 +617,7 @@ def progress_state_of_infection(meta, t):
 #
 # Time until treatment
 #    Gamma distributed with specified mean and variance.
+#    Worked out when somebody is infected, see treatment_due().
 #    Upon treatment, the indivdual's parter will also be treated.
 #    Immunity is conferred for a specied period.
 #
@@ -460,42 +633,19 @@ def progress_state_of_infection(meta, t):
 #    immune_mean
 #    immune_var
 #
+#    events = the InfectionEvents queue to take treatment times from and put
+#             the end of immunity into, or None
+#
 #
 # OUTPUT
 #    meta
 #
 #
-def seek_treatment(parameters, meta, partner_matrix, t):
-
-
-    # Work out who is symptomatic
-    symp0 = meta.site0_symptoms == True
-    symp1 = meta.site1_symptoms == True
-    symp2 = meta.site2_symptoms == True
+def seek_treatment(parameters, meta, partner_graph, t, events = None):
 
 
-    # Work out their duration of infectiousness
-    dur0 = t - meta.loc[symp0, "site0_t0"]
-    dur1 = t - meta.loc[symp1, "site1_t0"]
-    dur2 = t - meta.loc[symp2, "site2_t0"]
-
-
-    # Work out whose infectious period has exceeded their tolerance
-    treat0 = sp.gamma.cdf(dur0, parameters['infection'].treatment_mean[0]/parameters['infection'].treatment_var[0], parameters['infection'].treatment_var[0]) >= meta.loc[symp0, "treatment_threshold"]
-    treat1 = sp.gamma.cdf(dur1, parameters['infection'].treatment_mean[0]/parameters['infection'].treatment_var[0], parameters['infection'].treatment_var[0]) >= meta.loc[symp1, "treatment_threshold"]
-    treat2 = sp.gamma.cdf(dur2, parameters['infection'].treatment_mean[0]/parameters['infection'].treatment_var[0], parameters['infection'].treatment_var[0]) >= meta.loc[symp2, "treatment_threshold"]
-
-
-    # Pull out their identifiers
-    treat0 = treat0.index[treat0]
-    treat1 = treat1.index[treat1]
-    treat2 = treat2.index[treat2]
-
-
-    # Combine these into one big list
-    treat = np.append(treat0, treat1)
-    treat = np.append(treat, treat2)
-    treat = np.unique(treat)
+    # Work out who seeks treatment today
+    meta, treat = treatment_due(parameters, meta, t, events)
 
 
     # Have their current long-term partners get treated as well
@@ -504,22 +654,8 @@ def seek_treatment(parameters, meta, partner_matrix, t):
     treat = np.append(treat, part[part>-1])
 
 
-    # Make amendments to meta
-    meta.loc[treat, "state"] = "T"
-    meta.loc[treat, "recovery_time"] = t + duration_treatment_immunity(parameters, treat)
-    meta.loc[treat, "site0"] = 0
-    meta.loc[treat, "site1"] = 0
-    meta.loc[treat, "site2"] = 0
-    meta.loc[treat, "site0_t0"] = float("inf")
-    meta.loc[treat, "site1_t0"] = float("inf")
-    meta.loc[treat, "site2_t0"] = float("inf")
-    meta.loc[treat, "site0_t1"] = float("inf")
-    meta.loc[treat, "site1_t1"] = float("inf")
-    meta.loc[treat, "site2_t1"] = float("inf")
-    meta.loc[treat, 'site0_symptoms'] = False
-    meta.loc[treat, 'site1_symptoms'] = False
-    meta.loc[treat, 'site2_symptoms'] = False
-
+    # Make amendments to meta and schedule the end of their immunity
+    meta = tr.step(meta, t, TREATMENT, parameters, events, {'treatment': treat})
 
 
     # Return duration
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Compact encoding of infection states and infected sites in meta
+
+The infection state of each person is stored in the state column as an int8
+code rather than a string, and the sites they are infected at are stored
+together as the bits of a single uint8 column, sites:
+
+    bit 0 (1) = infected at site 0
+    bit 1 (2) = infected at site 1
+    bit 2 (4) = infected at site 2
+
+so that comparisons and counts are integer operations, and checking whether
+somebody is infected at all three sites is a single comparison with
+ALL_SITES.
+
+Populations and simulation output saved before this change use the string
+states and the site0, site1 and site2 columns. encode() converts these as
+they are read in, and decode() converts back for plotting or for anything
+that still wants the string labels.
+
+INDEX
+    code: convert state labels into codes
+    label: convert state codes into labels
+    site_matrix: the sites column as one 0/1 column per site
+    infected_at: who is infected at a site
+    set_site: infect or clear a site
+    encode: convert meta to the compact encoding
+    decode: convert meta back to string states and site columns
+"""
+
+
+#%% SETUP Load Libraries
+import numpy as np
+
+
+# Infection states
+S, E, I, R, T, V = 0, 1, 2, 3, 4, 5
+LABELS = np.array(['S', 'E', 'I', 'R', 'T', 'V'])
+CODES = {s: k for k, s in enumerate(LABELS)}
+
+
+# Bit for each site and all of them together
+SITE_BITS = np.array([1, 2, 4], dtype = np.uint8)
+ALL_SITES = 7
+
+
+#%% FUN code()
+#
+#
+# Convert a state label, or list of them, into codes. Anything which is
+# already a code is passed straight through.
+#
+#
+def code(states):
+    if np.ndim(states) == 0:
+        return CODES[states] if isinstance(states, str) else int(states)
+    return np.array([code(s) for s in states], dtype = np.int8)
+
+
+#%% FUN label()
+#
+#
+# Convert an array of state codes into their labels.
+#
+#
+def label(states):
+    return LABELS[np.asarray(states, dtype = int)]
+
+
+#%% FUN site_matrix()
+#
+#
+# Expand the sites column into an array with 1 at [row, k] if the row is
+# infected at site k and 0 otherwise.
+#
+#
+def site_matrix(meta):
+    return ((meta.sites.to_numpy(dtype = np.uint8)[:, None] & SITE_BITS[None, :]) > 0).astype(int)
+
+
+#%% FUN infected_at()
+#
+#
+# Boolean array of who is infected at site k.
+#
+#
+def infected_at(meta, k):
+    return (meta.sites.to_numpy(dtype = np.uint8) & SITE_BITS[k]) > 0
+
+
+#%% FUN set_site()
+#
+#
+# Infect (infected = True) or clear (infected = False) site k for some rows
+# of meta.
+#
+#
+def set_site(meta, rows, k, infected):
+    rows = np.asarray(rows, dtype = int)
+    if len(rows) > 0:
+        sites = meta.sites.to_numpy(dtype = np.uint8)[rows]
+        meta.loc[rows, 'sites'] = (sites | SITE_BITS[k]) if infected else (sites & ~SITE_BITS[k])
+    return meta
+
+
+#%% FUN encode()
+#
+#
+# Convert a meta with string states and site0, site1 and site2 columns into
+# the compact encoding. Anything already encoded is left as it is.
+#
+#
+# INPUT
+#   meta = the population dataframe, in either encoding
+#
+# OUTPUT
+#   meta with an int8 state column and a uint8 sites column
+#
+#
+def encode(meta):
+
+
+    # Convert the state labels
+    if meta.state.dtype == object:
+        meta['state'] = code(meta.state.to_numpy())
+    else:
+        meta['state'] = meta.state.to_numpy(dtype = np.int8)
+
+
+    # Combine the sites into one column in place of the old ones
+    if 'sites' not in meta.columns:
+        sites = np.zeros(len(meta), dtype = np.uint8)
+        for k in range(0, 3):
+            sites[meta['site' + str(k)].to_numpy(dtype = int) == 1] |= SITE_BITS[k]
+        loc = meta.columns.get_loc('site0')
+        meta = meta.drop(columns = ['site0', 'site1', 'site2'])
+        meta.insert(loc, 'sites', sites)
+    else:
+        meta['sites'] = meta.sites.to_numpy(dtype = np.uint8)
+
+
+    return meta
+
+
+#%% FUN decode()
+#
+#
+# Make a copy of meta with string states and site0, site1 and site2 columns,
+# for plotting or for anything that expects the old layout.
+#
+#
+def decode(meta):
+
+
+    # Convert the state codes
+    meta = meta.copy()
+    meta['state'] = label(meta.state)
+
+
+    # Split the sites back out
+    sites = site_matrix(meta)
+    loc = meta.columns.get_loc('sites')
+    meta = meta.drop(columns = ['sites'])
+    for k in range(0, 3):
+        meta.insert(loc + k, 'site' + str(k), sites[:, k])
+
+
+    return meta
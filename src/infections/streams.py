@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Named random number streams
+
+Each kind of random event in a simulation draws from its own stream:
+
+    partners        - who looks for a partner, who they pair up with and
+                      how long the partnership lasts
+    acts            - whether partners have sex, and which acts, each day
+    transmission    - whether an act passes on the infection
+    symptoms        - whether a new infection is symptomatic
+    durations       - latent periods, infection durations and
+                      treatment-conferred immunity
+    mobility        - who leaves and joins the population
+    vaccination     - who is vaccinated, whether it works and how long for
+
+so that two runs started from the same seed use the same random numbers for
+the same things, even when one of them also draws random numbers for a
+vaccine. This gives common random numbers for comparing a vaccine scenario
+to its baseline: the two stay in step until the vaccine changes what
+happens, and the difference between them has far less noise than the
+difference between independent runs.
+
+Until seed() is called every stream is the global np.random, so
+simulations seeded with np.random.seed() are the same as they've always
+been. reset() goes back to this.
+
+INDEX
+    seed: sets up the streams from a seed
+    reset: goes back to drawing everything from np.random
+    stream: the stream to draw from for some kind of random event
+"""
+
+
+#%% SETUP Load Libraries
+import numpy as np
+import zlib
+
+
+# The kinds of random event with their own stream
+STREAMS = ['partners', 'acts', 'transmission', 'symptoms', 'durations', 'mobility', 'vaccination']
+
+
+# The streams only used by vaccine scenarios
+VACCINE_STREAMS = ['vaccination']
+
+
+# The seeded streams, empty when drawing from np.random
+_STREAMS = {}
+
+
+#%% FUN seed()
+#
+#
+# Set up a RandomState for each stream. Each one is seeded from the seed and
+# the name of the stream, so the streams are independent of each other and
+# of the order they are listed in.
+#
+#
+# INPUT
+#   seed = the seed, shared across the streams
+#
+#
+def seed(seed):
+    for name in STREAMS:
+        _STREAMS[name] = np.random.RandomState([int(seed), zlib.crc32(name.encode())])
+
+
+#%% FUN reset()
+#
+#
+# Go back to drawing everything from np.random.
+#
+#
+def reset():
+    _STREAMS.clear()
+
+
+#%% FUN stream()
+#
+#
+# The stream to draw from for a kind of random event, either a RandomState
+# or np.random itself, which have the same methods.
+#
+#
+# INPUT
+#   name = one of STREAMS
+#
+#
+def stream(name):
+    if name not in STREAMS:
+        raise ValueError('Unknown random number stream ' + name)
+    return _STREAMS.get(name, np.random)
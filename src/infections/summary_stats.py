@@ -1,85 +1,69 @@
 # -*- coding: utf-8 -*-
 
 
+#%% SETUP Load Libraries
+import numpy as np
+
+
+# My modules
+import src.infections.states as st
+
+
+# The states counted in columns 3 to 5 of the tallies by group
+GROUP_STATES = [st.R, st.S, st.E]
+
+
+#%% FUN update_infections_by_group()
+#
+#
+# Count the number infected at each site and the number in R, S and E for
+# each age group and risk level on day t. Everybody is counted into all of
+# the groups at once, with one bincount over age group, risk and state and
+# another over age group, risk and infected site.
+#
+#
 def update_infections_by_group(meta, t, i0lt, i0ht, i1lt, i1ht, i2lt, i2ht, i3lt, i3ht):
-    i0lt[t, 0] = sum((meta.age_group == 0) & (meta.risk == 0) & (meta.site0 == 1))
-    i0lt[t, 1] = sum((meta.age_group == 0) & (meta.risk == 0) & (meta.site1 == 1))
-    i0lt[t, 2] = sum((meta.age_group == 0) & (meta.risk == 0) & (meta.site2 == 1))
-    i0lt[t, 3] = sum((meta.age_group == 0) & (meta.risk == 0) & (meta.state == "R"))
-    i0lt[t, 4] = sum((meta.age_group == 0) & (meta.risk == 0) & (meta.state == "S"))
-    i0lt[t, 5] = sum((meta.age_group == 0) & (meta.risk == 0) & (meta.state == "E"))
-    #i0lt[t, 6] = sum((meta.age_group == 0) & (meta.risk == 0) & (meta.state == "T"))
-
-    i0ht[t, 0] = sum((meta.age_group == 0) & (meta.risk == 1) & (meta.site0 == 1))
-    i0ht[t, 1] = sum((meta.age_group == 0) & (meta.risk == 1) & (meta.site1 == 1))
-    i0ht[t, 2] = sum((meta.age_group == 0) & (meta.risk == 1) & (meta.site2 == 1))
-    i0ht[t, 3] = sum((meta.age_group == 0) & (meta.risk == 1) & (meta.state == "R"))
-    i0ht[t, 4] = sum((meta.age_group == 0) & (meta.risk == 1) & (meta.state == "S"))
-    i0ht[t, 5] = sum((meta.age_group == 0) & (meta.risk == 1) & (meta.state == "E"))
-    #i0ht[t, 6] = sum((meta.age_group == 0) & (meta.risk == 1) & (meta.state == "T"))
-
-
-    i1lt[t, 0] = sum((meta.age_group == 1) & (meta.risk == 0) & (meta.site0 == 1))
-    i1lt[t, 1] = sum((meta.age_group == 1) & (meta.risk == 0) & (meta.site1 == 1))
-    i1lt[t, 2] = sum((meta.age_group == 1) & (meta.risk == 0) & (meta.site2 == 1))
-    i1lt[t, 3] = sum((meta.age_group == 1) & (meta.risk == 0) & (meta.state == "R"))
-    i1lt[t, 4] = sum((meta.age_group == 1) & (meta.risk == 0) & (meta.state == "S"))
-    i1lt[t, 5] = sum((meta.age_group == 1) & (meta.risk == 0) & (meta.state == "E"))
-    #i1lt[t, 6] = sum((meta.age_group == 1) & (meta.risk == 0) & (meta.state == "T"))
-
-    i1ht[t, 0] = sum((meta.age_group == 1) & (meta.risk == 1) & (meta.site0 == 1))
-    i1ht[t, 1] = sum((meta.age_group == 1) & (meta.risk == 1) & (meta.site1 == 1))
-    i1ht[t, 2] = sum((meta.age_group == 1) & (meta.risk == 1) & (meta.site2 == 1))
-    i1ht[t, 3] = sum((meta.age_group == 1) & (meta.risk == 1) & (meta.state == "R"))
-    i1ht[t, 4] = sum((meta.age_group == 1) & (meta.risk == 1) & (meta.state == "S"))
-    i1ht[t, 5] = sum((meta.age_group == 1) & (meta.risk == 1) & (meta.state == "E"))
-    #i1ht[t, 6] = sum((meta.age_group == 1) & (meta.risk == 1) & (meta.state == "T"))
-
-
-    i2lt[t, 0] = sum((meta.age_group == 2) & (meta.risk == 0) & (meta.site0 == 1))
-    i2lt[t, 1] = sum((meta.age_group == 2) & (meta.risk == 0) & (meta.site1 == 1))
-    i2lt[t, 2] = sum((meta.age_group == 2) & (meta.risk == 0) & (meta.site2 == 1))
-    i2lt[t, 3] = sum((meta.age_group == 2) & (meta.risk == 0) & (meta.state == "R"))
-    i2lt[t, 4] = sum((meta.age_group == 2) & (meta.risk == 0) & (meta.state == "S"))
-    i2lt[t, 5] = sum((meta.age_group == 2) & (meta.risk == 0) & (meta.state == "E"))
-    #i2lt[t, 6] = sum((meta.age_group == 2) & (meta.risk == 0) & (meta.state == "T"))
-
-    i2ht[t, 0] = sum((meta.age_group == 2) & (meta.risk == 1) & (meta.site0 == 1))
-    i2ht[t, 1] = sum((meta.age_group == 2) & (meta.risk == 1) & (meta.site1 == 1))
-    i2ht[t, 2] = sum((meta.age_group == 2) & (meta.risk == 1) & (meta.site2 == 1))
-    i2ht[t, 3] = sum((meta.age_group == 2) & (meta.risk == 1) & (meta.state == "R"))
-    i2ht[t, 4] = sum((meta.age_group == 2) & (meta.risk == 1) & (meta.state == "S"))
-    i2ht[t, 5] = sum((meta.age_group == 2) & (meta.risk == 1) & (meta.state == "E"))
-    #i2ht[t, 6] = sum((meta.age_group == 2) & (meta.risk == 1) & (meta.state == "T"))
-
-
-    i3lt[t, 0] = sum((meta.age_group == 3) & (meta.risk == 0) & (meta.site0 == 1))
-    i3lt[t, 1] = sum((meta.age_group == 3) & (meta.risk == 0) & (meta.site1 == 1))
-    i3lt[t, 2] = sum((meta.age_group == 3) & (meta.risk == 0) & (meta.site2 == 1))
-    i3lt[t, 3] = sum((meta.age_group == 3) & (meta.risk == 0) & (meta.state == "R"))
-    i3lt[t, 4] = sum((meta.age_group == 3) & (meta.risk == 0) & (meta.state == "S"))
-    i3lt[t, 5] = sum((meta.age_group == 3) & (meta.risk == 0) & (meta.state == "E"))
-    #i3lt[t, 6] = sum((meta.age_group == 3) & (meta.risk == 0) & (meta.state == "T"))
-
-    i3ht[t, 0] = sum((meta.age_group == 3) & (meta.risk == 1) & (meta.site0 == 1))
-    i3ht[t, 1] = sum((meta.age_group == 3) & (meta.risk == 1) & (meta.site1 == 1))
-    i3ht[t, 2] = sum((meta.age_group == 3) & (meta.risk == 1) & (meta.site2 == 1))
-    i3ht[t, 3] = sum((meta.age_group == 3) & (meta.risk == 1) & (meta.state == "R"))
-    i3ht[t, 4] = sum((meta.age_group == 3) & (meta.risk == 1) & (meta.state == "S"))
-    i3ht[t, 5] = sum((meta.age_group == 3) & (meta.risk == 1) & (meta.state == "E"))
-    #i3ht[t, 6] = sum((meta.age_group == 3) & (meta.risk == 1) & (meta.state == "T"))
+
+
+    # Work out everybody's group, with the low and high risk of each age group
+    # next to each other
+    group = 2 * meta.age_group.to_numpy(dtype = int) + meta.risk.to_numpy(dtype = int)
+
+
+    # Count them up by state and by infected site
+    n_states = len(st.LABELS)
+    by_state = np.bincount(n_states * group + meta.state.to_numpy(dtype = int), minlength = 8 * n_states)[0:8 * n_states].reshape(8, n_states)
+    sites = st.site_matrix(meta) > 0
+    site_index = 3 * group[:, None] + np.arange(0, 3)[None, :]
+    by_site = np.bincount(site_index[sites], minlength = 8 * 3)[0:8 * 3].reshape(8, 3)
+
+
+    # Put them into the tallies
+    for g, tally in enumerate([i0lt, i0ht, i1lt, i1ht, i2lt, i2ht, i3lt, i3ht]):
+        tally[t, 0:3] = by_site[g]
+        tally[t, 3:6] = by_state[g, GROUP_STATES]
+
 
     return i0lt, i0ht, i1lt, i1ht, i2lt, i2ht, i3lt, i3ht
 
 
+#%% FUN update_prevalence()
+#
+#
+# Count the number in each state and infected at each site on day t.
+#
+#
 def update_prevalence(meta, t, yt):
+
+
+    # Count them up
+    by_state = np.bincount(meta.state.to_numpy(dtype = int), minlength = len(st.LABELS))
+    by_site = np.count_nonzero(st.site_matrix(meta), axis = 0)
+
+
     # Update plot vector
-    yt.at[t, "S"] = sum(meta["state"]=="S")
-    yt.at[t, "E"] = sum(meta["state"]=="E")
-    yt.at[t, "I"] = sum(meta["state"]=="I")
-    yt.at[t, "R"] = sum(meta["state"]=="R")
-    yt.at[t, "T"] = sum(meta["state"]=="T")
-    yt.at[t, "site0"] = sum(meta["site0"] == 1)
-    yt.at[t, "site1"] = sum(meta["site1"] == 1)
-    yt.at[t, "site2"] = sum(meta["site2"] == 1)
-    return yt
\ No newline at end of file
+    for s in ['S', 'E', 'I', 'R', 'T']:
+        yt.at[t, s] = by_state[st.CODES[s]]
+    for k in range(0, 3):
+        yt.at[t, 'site' + str(k)] = by_site[k]
+    return yt
@@ -16,10 +16,14 @@ import matplotlib.pyplot as plt
 from tqdm import tqdm
 
 
-import src.demographic.goanna as pop
+import src.demographic.generate_population as pop
+import src.demographic.goanna as survey
 import src.partners.partners as prt
+import src.partners.partnership_graph as pg
+import src.partners.partnership_log as plog
 import src.infections.ng as ng
 import src.treatment.simple as trt
+import src.calibration.setup as setup
 
 import src.partners.summary_stats as pstat
 import src.infections.summary_stats as istat
@@ -28,24 +32,23 @@ import src.infections.summary_stats as istat
 #%% Set up meta-population
 
 
-# Set population size
-n = 3000
-
-
 # Set the length of the burn-in period
 burn_in = 365
 
 
 # Create meta-population
-meta = pop.goanna(n, burn_in)
+scenario = 3
+meta = pop.generate_population(pop.setup_data(scenario, 'serial'), t = burn_in)
+n = len(meta)
 
 
-# Create partnership matrix
-partner_matrix = np.zeros((n,n))
+# Parse infection parameters
+inf_parameters = setup.parse_parameters('default', scenario)
 
 
-# Create partnership duration matrix
-partner_expire = float("inf") * np.ones((n, n))
+# Create the partnership network, keeping a log of all the partnerships
+prt_parameters = prt.setup_data()
+partner_graph = pg.PartnershipGraph(meta, plog.PartnershipLog())
 
 
 #%% Test Partnership aquisition rates
@@ -67,20 +70,12 @@ p3lt = np.zeros((n_days, 5))
 
 
 # Tracking the cumulative number of partners
-xt = np.zeros((n_days, 4))
 g0t = np.zeros((n_days, 4))
 g1t = np.zeros((n_days, 4))
 g2t = np.zeros((n_days, 4))
 g3t = np.zeros((n_days, 4))
 
 
-# Tracking partnership durations
-d0t = []
-d1t = []
-d2t = []
-d3t = []
-
-
 # Tracking the infection process
 yt = pd.DataFrame(columns = ["S", "I", "R", "single", "partnered", "site0", "site1", "site2", "E"])
 
@@ -96,70 +91,19 @@ i3lt = np.zeros((n_days, 6))
 i3ht = np.zeros((n_days, 6))
 
 
-
-
-
-
-# 0(rectal) 1(ural) 2(pharyngeal)
-p00 = 0
-p01 = 0.233
-p02 = 0.354
-p10 = 0.867
-p11 = 0.9
-p12 = 0.886
-p20 = 0.719
-p21 = 0.157
-p22 = 0.292
-trans_anal = np.array([[0,   p01, 0],
-                       [p10, 0,   0],
-                       [0,   0,   0]])
-trans_oral = np.array([[0,   0,   0],
-                       [0,   0, p12],
-                       [0, p21,   0]])
-trans_kiss = np.array([[0,   0,   0],
-                       [0,   0,   0],
-                       [0,   0, p22]])
-trans_rim = np.array([[0,   0, p02],
-                      [0,   0,   0],
-                      [p20, 0,   0]])
-trans_sex = np.array([[0,   0,   0],
-                      [0, p11,   0],
-                      [0,   0,   0]])
-
-
-# Probabilities of specific acts
-p_anal = np.array([[0.8, 0.1],
-                   [0,   0]])
-p_oral = np.array([[0.7, 0.5],
-                   [0.7, 0.9]])
-p_kiss = np.array([[1, 1],
-                   [1, 1]])
-p_rim =  np.array([[0.1, 0.1],
-                   [0.1, 0.1]])
-p_sex =  np.array([[0,   0.8],
-                   [0.8, 0.3]])
-
-
-
-
 # Iterate over all time points
 for t in tqdm(range(0, n_days)):
 
 
     # Create a new relationships
-    meta, partner_matrix, partner_expire, d0ti, d1ti, d2ti, d3ti = prt.new_partnership(meta, partner_matrix, partner_expire, n, t)
-
-    d0t.append(d0ti)
-    d1t.append(d1ti)
-    d2t.append(d2ti)
-    d3t.append(d3ti)
+    meta, partner_graph, _, _, _, _ = prt.new_partnership(prt_parameters, meta, partner_graph, t)
 
     # Iterate over all partnerships
     if t > burn_in:
 
 
         # Seed new infections
-        meta = ng.new_infections(meta, partner_matrix, t, p_anal, p_oral, p_kiss, p_rim, p_sex, trans_anal, trans_oral, trans_kiss, trans_rim, trans_sex)
+        meta = ng.new_infections(inf_parameters, meta, partner_graph, t, treatment_time_fun = trt.treatment_time)
 
 
         # Progress the state of infections
@@ -167,11 +111,11 @@ for t in tqdm(range(0, n_days)):
 
 
         # Allow people to seek treatment
-        meta = trt.seek_treatment(meta, partner_matrix, t)
+        meta = trt.seek_treatment(inf_parameters, meta, partner_graph, t)
 
 
     # Identify and remove expired relationships
-    meta, partner_matrix, partner_expire = prt.old_partnerships(meta, partner_matrix, partner_expire, t)
+    meta, partner_graph = prt.old_partnerships(meta, partner_graph, t)
 
 
     # Update summary stats on prevalence
@@ -179,10 +123,24 @@ for t in tqdm(range(0, n_days)):
     i0lt, i0ht, i1lt, i1ht, i2lt, i2ht, i3lt, i3ht = istat.update_infections_by_group(meta, t, i0lt, i0ht, i1lt, i1ht, i2lt, i2ht, i3lt, i3ht)
 
 
-    # Update summary stats on the number of annual partners
-    xt, g0t, g1t, g2t, g3t = pstat.update_cumulative_partners(meta, partner_matrix, partner_expire, t, n, xt, g0t, g1t, g2t, g3t)
-    p0ht, p0lt, p1ht, p1lt, p2ht, p2lt, p3ht, p3lt = pstat.update_partnership_types(meta, partner_matrix, t, p0ht, p0lt, p1ht, p1lt, p2ht, p2lt, p3ht, p3lt)
-    if t == burn_in: meta.counter = np.sum(partner_matrix, axis=1)
+    # Update summary stats on partnership types
+    p0ht, p0lt, p1ht, p1lt, p2ht, p2lt, p3ht, p3lt = pstat.update_partnership_types(meta, partner_graph, t, p0ht, p0lt, p1ht, p1lt, p2ht, p2lt, p3ht, p3lt)
+
+
+# Count the number of partners everybody had over the year up to each day
+# from the partnership log, nobody comes or goes so person_id is the index
+history = plog.LogIndex(partner_graph.log, partner_graph)
+for t in range(0, n_days):
+    n_partners = history.n_partners(max(0, t - 364), t, n)
+    for a, gt in enumerate([g0t, g1t, g2t, g3t]):
+        gt[t, :] = np.bincount(np.digitize(n_partners[meta.age_group == a], [1, 2, 5]), minlength = 4)
+meta.counter = n_partners
+
+
+# Pull the partnership durations by age group out of the log
+ended = history.t_end < float("inf")
+age_group = meta.age_group.to_numpy()[history.i]
+d0t, d1t, d2t, d3t = [list((history.t_end - history.t_start)[ended & (age_group == a)]) for a in range(0, 4)]
 
 
 
@@ -337,10 +295,10 @@ ax[0].plot(range(0, n_days), g0t[:,1], label = "1", color = "red")
 ax[0].plot(range(0, n_days), g0t[:,2], label = "2-4", color = "green")
 ax[0].plot(range(0, n_days), g0t[:,3], label = "5 more", color = "purple")
 weight = sum(g0t[0,:])
-ax[0].axhline(weight*pop.partner_prob_raw[0,0], color = "blue", linestyle = "--")
-ax[0].axhline(weight*pop.partner_prob_raw[0,1], color = "red", linestyle = "--")
-ax[0].axhline(weight*pop.partner_prob_raw[0,2], color= "green", linestyle = "--")
-ax[0].axhline(weight*pop.partner_prob_raw[0,3], color = "purple", linestyle = "--")
+ax[0].axhline(weight*survey.partner_prob_raw[0,0], color = "blue", linestyle = "--")
+ax[0].axhline(weight*survey.partner_prob_raw[0,1], color = "red", linestyle = "--")
+ax[0].axhline(weight*survey.partner_prob_raw[0,2], color= "green", linestyle = "--")
+ax[0].axhline(weight*survey.partner_prob_raw[0,3], color = "purple", linestyle = "--")
 ax[0].set_xlim([burn_in, n_days])
 ax[0].legend(loc = "upper right")
 ax[0].set_title("Comparison of 12-month partner count to GOANNA data")
@@ -352,10 +310,10 @@ ax[1].plot(range(0, n_days), g1t[:,1], label = "1", color = "red")
 ax[1].plot(range(0, n_days), g1t[:,2], label = "2-4", color = "green")
 ax[1].plot(range(0, n_days), g1t[:,3], label = "5 more", color = "purple")
 weight = sum(g1t[0,:])
-ax[1].axhline(weight*pop.partner_prob_raw[1,0], color = "blue", linestyle = "--")
-ax[1].axhline(weight*pop.partner_prob_raw[1,1], color = "red", linestyle = "--")
-ax[1].axhline(weight*pop.partner_prob_raw[1,2], color= "green", linestyle = "--")
-ax[1].axhline(weight*pop.partner_prob_raw[1,3], color = "purple", linestyle = "--")
+ax[1].axhline(weight*survey.partner_prob_raw[1,0], color = "blue", linestyle = "--")
+ax[1].axhline(weight*survey.partner_prob_raw[1,1], color = "red", linestyle = "--")
+ax[1].axhline(weight*survey.partner_prob_raw[1,2], color= "green", linestyle = "--")
+ax[1].axhline(weight*survey.partner_prob_raw[1,3], color = "purple", linestyle = "--")
 ax[1].set_xlim([burn_in, n_days])
 
 
@@ -365,10 +323,10 @@ ax[2].plot(range(0, n_days), g2t[:,1], label = "1", color = "red")
 ax[2].plot(range(0, n_days), g2t[:,2], label = "2-4", color = "green")
 ax[2].plot(range(0, n_days), g2t[:,3], label = "5 more", color = "purple")
 weight = sum(g2t[0,:])
-ax[2].axhline(weight*pop.partner_prob_raw[2,0], color = "blue", linestyle = "--")
-ax[2].axhline(weight*pop.partner_prob_raw[2,1], color = "red", linestyle = "--")
-ax[2].axhline(weight*pop.partner_prob_raw[2,2], color= "green", linestyle = "--")
-ax[2].axhline(weight*pop.partner_prob_raw[2,3], color = "purple", linestyle = "--")
+ax[2].axhline(weight*survey.partner_prob_raw[2,0], color = "blue", linestyle = "--")
+ax[2].axhline(weight*survey.partner_prob_raw[2,1], color = "red", linestyle = "--")
+ax[2].axhline(weight*survey.partner_prob_raw[2,2], color= "green", linestyle = "--")
+ax[2].axhline(weight*survey.partner_prob_raw[2,3], color = "purple", linestyle = "--")
 ax[2].set_xlim([burn_in, n_days])
 
 
@@ -378,10 +336,10 @@ ax[3].plot(range(0, n_days), g3t[:,1], label = "1", color = "red")
 ax[3].plot(range(0, n_days), g3t[:,2], label = "2-4", color = "green")
 ax[3].plot(range(0, n_days), g3t[:,3], label = "5 more", color = "purple")
 weight = sum(g3t[0,:])
-ax[3].axhline(weight*pop.partner_prob_raw[3,0], color = "blue", linestyle = "--")
-ax[3].axhline(weight*pop.partner_prob_raw[3,1], color = "red", linestyle = "--")
-ax[3].axhline(weight*pop.partner_prob_raw[3,2], color= "green", linestyle = "--")
-ax[3].axhline(weight*pop.partner_prob_raw[3,3], color = "purple", linestyle = "--")
+ax[3].axhline(weight*survey.partner_prob_raw[3,0], color = "blue", linestyle = "--")
+ax[3].axhline(weight*survey.partner_prob_raw[3,1], color = "red", linestyle = "--")
+ax[3].axhline(weight*survey.partner_prob_raw[3,2], color= "green", linestyle = "--")
+ax[3].axhline(weight*survey.partner_prob_raw[3,3], color = "purple", linestyle = "--")
 ax[3].set_xlim([burn_in, n_days])
 
 
@@ -394,13 +352,13 @@ fig.suptitle("Comparison of Simulated Partnership Rates to Observed Data")
 
 labs = ["0", "1", "2-4", "5 or more"]
 sim = g0t[len(g0t)-1,:]/sum(g0t[0,:])
-goanna = pop.partner_prob_raw[0,:]
+goanna = survey.partner_prob_raw[0,:]
 
 x = np.arange(len(labs))
 width = 0.35
 
 ax[0].bar(x-width/2, g0t[len(g0t)-1,:]/sum(g0t[0,:]), width, label = "Simulated")
-ax[0].bar(x+width/2, pop.partner_prob_raw[0,:], width, label = "GOANNA")
+ax[0].bar(x+width/2, survey.partner_prob_raw[0,:], width, label = "GOANNA")
 ax[0].set_xticks(x)
 ax[0].set_xticklabels(labs)
 ax[0].set_title("Age 16-20")
@@ -408,21 +366,21 @@ ax[0].set_ylabel("Proportion")
 ax[0].legend()
 
 ax[1].bar(x-width/2, g1t[len(g1t)-1,:]/sum(g1t[0,:]), width, label = "Simulated")
-ax[1].bar(x+width/2, pop.partner_prob_raw[1,:], width, label = "GOANNA")
+ax[1].bar(x+width/2, survey.partner_prob_raw[1,:], width, label = "GOANNA")
 ax[1].set_xticks(x)
 ax[1].set_xticklabels(labs)
 ax[1].set_title("Age 21-24")
 ax[1].set_ylabel("Proportion")
 
 ax[2].bar(x-width/2, g2t[len(g2t)-1,:]/sum(g2t[0,:]), width, label = "Simulated")
-ax[2].bar(x+width/2, pop.partner_prob_raw[2,:], width, label = "GOANNA")
+ax[2].bar(x+width/2, survey.partner_prob_raw[2,:], width, label = "GOANNA")
 ax[2].set_xticks(x)
 ax[2].set_xticklabels(labs)
 ax[2].set_title("Age 25-29")
 ax[2].set_ylabel("Proportion")
 
 ax[3].bar(x-width/2, g3t[len(g3t)-1,:]/sum(g3t[0,:]), width, label = "Simulated")
-ax[3].bar(x+width/2, pop.partner_prob_raw[3,:], width, label = "GOANNA")
+ax[3].bar(x+width/2, survey.partner_prob_raw[3,:], width, label = "GOANNA")
 ax[3].set_xticks(x)
 ax[3].set_xticklabels(labs)
 ax[3].set_xlabel("Number of sexual partners in last 12 months")
@@ -433,11 +391,7 @@ ax[3].set_ylabel("Proportion")
 #%% GRAPH OF PARTNER DURATION
 
 
-# Unnest the duration lists
-d0t = [item for sublist in d0t for item in sublist]
-d1t = [item for sublist in d1t for item in sublist]
-d2t = [item for sublist in d2t for item in sublist]
-d3t = [item for sublist in d3t for item in sublist]
+# Cap the durations
 max_val = 1000
 d0t_plot = [val if val < max_val else max_val for val in d0t]
 d1t_plot = [val if val < max_val else max_val for val in d1t]
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Script for checking that the InfectionEvents queue only changes how the
+people with something due are found, not what happens to them: run the same
+simulation, with the same seed, once checking everybody every day and once
+with the queue, and check that meta comes out the same. Each day meta is
+also held strictly to its schema, so any write which widens a column fails.
+"""
+
+
+#%% SETUP Modules
+
+
+# Standard modules
+import copy
+import numpy as np
+
+
+# My modules
+import src.demographic.generate_population as pop
+import src.demographic.population_dynamics as demo
+import src.demographic.schema as schema
+import src.partners.partners as prt
+import src.partners.partnership_graph as pg
+import src.calibration.setup as setup
+import src.infections.ng as ng
+import src.infections.events as ev
+import src.infections.streams as rs
+
+
+scenario = 3
+n_burn_in = 100
+n_days = 365
+seed = 10
+
+
+#%% FUN run()
+#
+#
+# Run the population, partnerships and infections from the end of the burn
+# in, with or without the event queue.
+#
+#
+def run(pop_parameters, prt_parameters, inf_parameters, meta, partner_graph, use_events):
+
+
+    # Start from the same place with the same random numbers
+    pop_parameters = copy.deepcopy(pop_parameters)
+    meta = meta.copy()
+    partner_graph = copy.deepcopy(partner_graph)
+    events = ev.InfectionEvents(meta, partner_graph) if use_events else None
+    np.random.seed(seed)
+    rs.seed(seed)
+
+
+    # Run it
+    for t in range(n_burn_in, n_burn_in + n_days):
+        meta, partner_graph = demo.update_population(pop_parameters, prt_parameters, inf_parameters, meta, partner_graph, t)
+        meta, partner_graph = prt.update_partnerships(prt_parameters, meta, partner_graph, t)
+        meta = ng.update_infections(inf_parameters, meta, partner_graph, t, events)
+        meta = schema.check(meta, strict = True)
+
+
+    return meta
+
+
+if __name__ == '__main__':
+
+
+    #%% SETUP Population
+
+
+    np.random.seed(seed)
+    pop_parameters = pop.setup_data(scenario, 'serial')
+    prt_parameters = prt.setup_data()
+    inf_parameters = setup.parse_parameters('default', scenario)
+    meta = pop.generate_population(pop_parameters)
+    partner_graph = pg.PartnershipGraph(meta)
+    pop_parameters = demo.initilise_demographic_dynamics(pop_parameters, inf_parameters, meta)
+    for t in range(0, n_burn_in):
+        meta, partner_graph = prt.update_partnerships(prt_parameters, meta, partner_graph, t)
+
+
+    #%% RUN With and without the queue
+
+
+    meta_scan = run(pop_parameters, prt_parameters, inf_parameters, meta, partner_graph, False)
+    meta_events = run(pop_parameters, prt_parameters, inf_parameters, meta, partner_graph, True)
+    print('Infected at the end: ' + str(np.sum(meta_scan.sites.to_numpy() > 0)))
+
+
+    # Exactly the same people in exactly the same state
+    assert meta_scan.equals(meta_events)
+    print('Runs with and without InfectionEvents agree')
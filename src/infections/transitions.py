@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Table-driven changes of infection state
+
+Changes of state, like the end of the latent period at a site, recovery,
+treatment or a vaccine wearing off, are declared as a list of transitions.
+Each transition is a dictionary with
+
+    name = what it is, used to trigger it by hand and to pick it out of a
+           table when building a new one
+    timer = the column of meta, or list of columns, whose times set it off,
+            or None if it is triggered by hand
+    when = optional condition on who it applies to, a function of
+           (x, rows) returning a boolean array over rows
+    set = dictionary of the new value of each column, which is either a
+          constant or a function of (x, rows, t, parameters)
+
+where x holds the columns of meta as arrays. step() works out who is due
+for every timer in a table in one go, using the InfectionEvents queue if
+given, runs through the transitions in order on the arrays and then writes
+each changed column back into meta once. Transitions see the changes made
+by the ones before them, so a table behaves like the same updates written
+out one after another.
+
+Any new times written into columns tracked by the queue are scheduled.
+
+INDEX
+    step: run a table of transitions
+"""
+
+
+#%% SETUP Load Libraries
+import numpy as np
+
+
+# My modules
+import src.infections.events as ev
+
+
+#%% FUN step()
+#
+#
+# Run a table of transitions on day t.
+#
+#
+# INPUT
+#   meta, t
+#   transitions = the table of transitions
+#   parameters = passed on to any functions in the table
+#   events = the InfectionEvents queue, or None to check everybody
+#   triggered = dictionary of the rows of meta to apply each transition
+#               without a timer to, by name. Rows are used as given, so
+#               anybody in there twice gets any random values drawn twice.
+#   counts = optional dictionary to add the number of people each
+#            transition is applied to into, by name
+#
+# OUTPUT
+#   meta
+#
+#
+def step(meta, t, transitions, parameters = None, events = None, triggered = {}, counts = None):
+
+
+    # Work out who is due for every timer at once
+    timers = []
+    for transition in transitions:
+        for c in _timers(transition):
+            if c not in timers:
+                timers.append(c)
+    due = ev.due(meta, t, timers, events) if len(timers) > 0 else {}
+
+
+    # Run through the transitions in order
+    x = _Columns(meta)
+    written = {}
+    for transition in transitions:
+
+
+        # Work out who it applies to
+        if transition['timer'] is None:
+            rows = np.asarray(triggered.get(transition['name'], []), dtype = int)
+        else:
+            rows = np.unique(np.concatenate([due[c] for c in _timers(transition)])).astype(int)
+        if ('when' in transition) and (len(rows) > 0):
+            rows = rows[transition['when'](x, rows)]
+        if len(rows) == 0:
+            continue
+        if counts is not None:
+            counts[transition['name']] = counts.get(transition['name'], 0) + len(rows)
+
+
+        # Update their columns
+        for c, value in transition['set'].items():
+            x[c][rows] = value(x, rows, t, parameters) if callable(value) else value
+            written[c] = written.get(c, []) + [rows]
+
+
+    # Write the changed columns back into meta
+    for c in written:
+        meta[c] = x[c]
+
+
+    # Schedule any new times
+    if events is not None:
+        for c, rows in written.items():
+            rows = np.unique(np.concatenate(rows))
+            if (c in ev.COLUMNS) and np.any(np.isfinite(x[c][rows])):
+                events.schedule(meta, [c], rows)
+
+
+    return meta
+
+
+#%% HELPER _timers()
+#
+#
+# The timer columns of a transition as a list.
+#
+#
+def _timers(transition):
+    timer = transition['timer']
+    if timer is None:
+        return []
+    return [timer] if isinstance(timer, str) else list(timer)
+
+
+#%% HELPER _Columns
+#
+#
+# Columns of meta as arrays, copied out the first time each one is needed.
+#
+#
+class _Columns(dict):
+
+
+    def __init__(self, meta):
+        super().__init__()
+        self.meta = meta
+
+
+    def __missing__(self, c):
+        self[c] = self.meta[c].to_numpy(copy = True)
+        return self[c]
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Burn in of the partnership network
+
+Runs the partnership dynamics from an empty network until the summary
+series from summary_stats.update_partnership_types() have settled down,
+rather than for a fixed number of days.
+
+Every so often each partnership type in each age and risk group is checked
+for stationarity by comparing its means over the two most recent windows
+of days, allowing for both the noise in each mean (estimated by batch
+means) and a small tolerance. Series with fewer than min_count people on
+average are too noisy to say anything about and are left out, and as so
+many series are checked at once each has to pass a stricter test. Burn in
+stops once every series has passed a number of checks in a row, subject to
+a minimum length.
+
+INDEX
+    burn_in_partnerships: runs the burn in and works out when to stop
+    is_stationary: checks if a set of summary series has settled down
+"""
+
+
+#%% SETUP Load Libraries
+import numpy as np
+
+
+# My modules
+import src.partners.partners as prt
+import src.partners.summary_stats as pstat
+
+
+#%% FUN burn_in_partnerships()
+#
+#
+# Run the partnership dynamics until the network reaches equilibrium.
+#
+#
+# INPUT
+#   prt_parameters, meta, partner_graph
+#   max_days = the longest the burn in can go on for
+#   min_days = the shortest the burn in can be
+#   window = the number of days in each of the windows being compared
+#   check_every = how many days between stationarity checks
+#   n_checks = how many checks in a row need to be passed
+#   min_count = the average number of people a series needs to be checked
+#   z = the critical value for each series, higher than usual as there are
+#       up to forty series being checked at once
+#
+# OUTPUT
+#   meta, partner_graph
+#   burn_in = the number of days that were run
+#   series = list of the tracked series p0ht, p0lt, ..., p3lt up to burn_in
+#
+#
+def burn_in_partnerships(prt_parameters, meta, partner_graph, max_days, min_days = 365,
+                         window = 100, check_every = 50, n_checks = 3, min_count = 20, z = 4):
+
+
+    # Initilise the summary series
+    series = list(pstat.initilise_partner_number_tracking(max_days)[0:8])
+
+
+    # Run Partnership Dynamics
+    passed = 0
+    t = -1
+    for t in range(0, max_days):
+        meta, partner_graph, _, _, _, _ = prt.new_partnership(prt_parameters, meta, partner_graph, t)
+        meta, partner_graph = prt.old_partnerships(meta, partner_graph, t)
+        series = list(pstat.update_partnership_types(meta, partner_graph, t, *series))
+
+
+        # Check whether each partnership type in each group has settled down
+        if ((t + 1) % check_every == 0) & ((t + 1) >= 2 * window):
+            groups = np.concatenate(series, axis = 1)[0:(t + 1), :]
+            passed = (passed + 1 if is_stationary(groups, window, z, min_count = min_count) else 0)
+            if (passed >= n_checks) & ((t + 1) >= min_days):
+                break
+
+
+    # Trim the series down to the days that were run
+    burn_in = t + 1
+    series = [s[0:burn_in, :] for s in series]
+
+
+    return meta, partner_graph, burn_in, series
+
+
+#%% FUN is_stationary()
+#
+#
+# Compare the mean of each series over the last two windows of days.
+#
+# The difference in means is compared to its standard error, which is
+# estimated from the means of n_batches batches within each window. As the
+# long-term partnerships give autocorrelation over much longer timescales
+# than a window, the batch means standard error can be too small once
+# things have settled, so series whose means differ by less than rel_tol of
+# their size, or abs_tol people, also pass. Series averaging fewer than
+# min_count people over the two windows aren't checked.
+#
+#
+# INPUT
+#   series = array with one row per day and one column per series
+#   window = the number of days in each window
+#   z = the critical value for the difference in means
+#   n_batches = the number of batches in each window
+#   rel_tol, abs_tol = relative and absolute tolerances on the difference
+#   min_count = the average size a series needs to be checked
+#
+# OUTPUT
+#   True if every series checked passes
+#
+#
+def is_stationary(series, window, z = 3, n_batches = 5, rel_tol = 0.1, abs_tol = 1, min_count = 0):
+
+
+    # Pull out the two windows and split them into batches
+    batch = window // n_batches
+    old = series[-2*window:-window, :][0:(n_batches * batch), :].reshape(n_batches, batch, -1).mean(axis = 1)
+    new = series[-window:, :][0:(n_batches * batch), :].reshape(n_batches, batch, -1).mean(axis = 1)
+
+
+    # Compare the means to their batch means standard errors
+    diff = np.abs(old.mean(axis = 0) - new.mean(axis = 0))
+    se = np.sqrt(old.var(axis = 0, ddof = 1)/n_batches + new.var(axis = 0, ddof = 1)/n_batches)
+
+
+    # Work out the tolerance on each series
+    size = (old.mean(axis = 0) + new.mean(axis = 0))/2
+    tolerance = np.maximum(z * se, np.maximum(rel_tol * size, abs_tol))
+
+
+    return bool(np.all((diff <= tolerance) | (size < min_count)))
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""
+Index of the people who are available as partners
+
+Rather than filtering all of meta each time somebody looks for a partner,
+everybody is kept in a bucket keyed by
+
+    (gender, orientation, age_group, risk, long-term partnered)
+
+and the buckets are updated as people's attributes change. Looking for a
+partner then reduces to picking somebody at random from a handful of buckets.
+
+INDEX
+    CandidateIndex: the bucketed index of potential partners
+    bucket_codes: works out which bucket each person belongs in
+    bucket_risk: works out the risk group of the people in a bucket
+    bucket_attributes: works out all of the attributes of the people in a bucket
+    target_codes: works out which buckets a given person would partner from
+    target_code_array: target_codes for a whole array of people at once
+"""
+
+
+#%% SETUP Load Libraries
+import numpy as np
+
+
+# My modules
+import src.infections.streams as rs
+
+
+# Size of each of the attributes used to index the buckets
+N_GENDER = 2
+N_ORIENTATION = 3
+N_AGE_GROUP = 4
+N_RISK = 2
+N_LONG_TERM = 2
+N_BUCKETS = N_GENDER * N_ORIENTATION * N_AGE_GROUP * N_RISK * N_LONG_TERM
+
+
+# Compatible (gender, orientation) pairs for each (gender, orientation) as in
+# target_codes(), padded out with -1
+TARGET_PAIRS = -np.ones((N_GENDER, N_ORIENTATION, 4, 2), dtype = int)
+for g in range(0, N_GENDER):
+    TARGET_PAIRS[g, 0, 0:2] = [(1 - g, 0), (1 - g, 2)]
+    TARGET_PAIRS[g, 1, 0:2] = [(g, 1), (g, 2)]
+    TARGET_PAIRS[g, 2, 0:4] = [(g, 1), (g, 2), (1 - g, 0), (1 - g, 2)]
+
+
+#%% FUN bucket_code()
+#
+#
+# Encode a combination of attributes as a single bucket number
+#
+#
+def bucket_code(gender, orientation, age_group, risk, long_term):
+    return (((gender * N_ORIENTATION + orientation) * N_AGE_GROUP + age_group) * N_RISK + risk) * N_LONG_TERM + long_term
+
+
+#%% FUN bucket_codes()
+#
+#
+# Work out which bucket each person in meta belongs to
+#
+#
+# INPUT
+#   meta = the population array
+#   people = the indices of the people to compute codes for (default everyone)
+#
+# OUTPUT
+#   an array with the bucket code of each person
+#
+#
+def bucket_codes(meta, people = None):
+
+
+    # Default to everybody
+    if people is None:
+        people = np.arange(len(meta))
+
+
+    # Pull out their attributes, only converting the rows needed
+    gender = meta.gender.to_numpy()[people].astype(int)
+    orientation = meta.orientation.to_numpy()[people].astype(int)
+    age_group = np.minimum(meta.age_group.to_numpy()[people].astype(int), N_AGE_GROUP - 1)
+    risk = meta.risk.to_numpy()[people].astype(int)
+    long_term = (meta.partner.to_numpy()[people].astype(int) != -1).astype(int)
+
+
+    return bucket_code(gender, orientation, age_group, risk, long_term)
+
+
+#%% FUN bucket_risk()
+#
+#
+# Decode the risk group from a bucket code
+#
+#
+def bucket_risk(code):
+    return (code // N_LONG_TERM) % N_RISK
+
+
+#%% FUN bucket_attributes()
+#
+#
+# Decode all of the attributes from a bucket code
+#
+#
+# OUTPUT
+#   gender, orientation, age_group, risk, long_term
+#
+#
+def bucket_attributes(code):
+    long_term = code % N_LONG_TERM
+    risk = (code // N_LONG_TERM) % N_RISK
+    age_group = (code // (N_LONG_TERM * N_RISK)) % N_AGE_GROUP
+    orientation = (code // (N_LONG_TERM * N_RISK * N_AGE_GROUP)) % N_ORIENTATION
+    gender = code // (N_LONG_TERM * N_RISK * N_AGE_GROUP * N_ORIENTATION)
+    return gender, orientation, age_group, risk, long_term
+
+
+#%% FUN target_codes()
+#
+#
+# Work out the buckets that a bachelor would look for a partner in.
+#
+# The pairs of gender and orientation they are compatible with are:
+#   heterosexual: heterosexuals or bisexuals of the opposite gender
+#   homosexual: homosexuals or bisexuals of the same gender
+#   bisexual: anyone but a heterosexual of the same gender or a
+#             homosexual of the opposite gender
+#
+#
+# INPUT
+#   gender, orientation = attributes of the bachelor
+#   age_group, risk, long_term = the kind of partner they are looking for
+#
+# OUTPUT
+#   list of bucket codes
+#
+#
+def target_codes(gender, orientation, age_group, risk, long_term):
+
+
+    # Work out the compatible gender/orientation pairs
+    if orientation == 0:
+        pairs = [(1 - gender, 0), (1 - gender, 2)]
+    elif orientation == 1:
+        pairs = [(gender, 1), (gender, 2)]
+    else:
+        pairs = [(gender, 1), (gender, 2), (1 - gender, 0), (1 - gender, 2)]
+
+
+    return [bucket_code(g, o, age_group, risk, long_term) for g, o in pairs]
+
+
+#%% FUN target_code_array()
+#
+#
+# Vectorised version of target_codes() for an array of bachelors.
+#
+# Everybody has at most four compatible gender/orientation pairs, so the
+# output is padded out to four columns with -1.
+#
+#
+# INPUT
+#   gender, orientation = arrays of attributes of the bachelors
+#   age_group, risk, long_term = arrays of the kind of partner they are looking for
+#
+# OUTPUT
+#   an array of bucket codes with one row per bachelor
+#
+#
+def target_code_array(gender, orientation, age_group, risk, long_term):
+
+
+    # Look up the compatible gender/orientation pairs
+    pairs = TARGET_PAIRS[gender, orientation]
+    valid = pairs[:, :, 0] != -1
+
+
+    # Encode them along with the rest of the attributes
+    codes = bucket_code(pairs[:, :, 0], pairs[:, :, 1], age_group[:, None], risk[:, None], long_term[:, None])
+    codes[~valid] = -1
+
+
+    return codes
+
+
+#%% CLASS CandidateIndex
+#
+#
+# Maintains everybody in meta in a bucket keyed by their bucket code.
+#
+# Each bucket is a list of people, and the position of each person within
+# their bucket is tracked so they can be moved between buckets in O(1).
+#
+# The index must be kept in step with meta:
+#   update() after any change to gender, orientation, age_group, risk or partner
+#   extend() after rows are appended to meta
+#   remove() after rows are dropped from meta
+#
+#
+class CandidateIndex:
+
+
+    def __init__(self, meta):
+        self.codes = bucket_codes(meta)
+        self.rebuild()
+
+
+    #%% METHOD rebuild()
+    # Reconstruct all of the buckets from the bucket codes
+    def rebuild(self):
+
+
+        # Sort people into their buckets
+        order = np.argsort(self.codes, kind = 'stable')
+        bounds = np.searchsorted(self.codes[order], np.arange(N_BUCKETS + 1))
+
+
+        # Store the buckets and where everybody sits within them
+        self.buckets = []
+        self.position = np.zeros(len(self.codes), dtype = int)
+        for b in range(0, N_BUCKETS):
+            members = order[bounds[b]:bounds[b+1]]
+            self.buckets.append(members.tolist())
+            self.position[members] = np.arange(len(members))
+
+
+    #%% METHOD update()
+    # Move anybody whose attributes have changed into their new bucket and
+    # return who they were
+    def update(self, meta, people = None):
+
+
+        # Default to checking everybody
+        if people is None:
+            people = np.arange(len(self.codes))
+        people = np.unique(np.asarray(people, dtype = int))
+
+
+        # Work out who has changed bucket
+        new_codes = bucket_codes(meta, people)
+        changed = new_codes != self.codes[people]
+
+
+        # Shift them over
+        for i, code in zip(people[changed], new_codes[changed]):
+            self._take_out(i)
+            self._put_in(i, code)
+
+
+        return people[changed]
+
+
+    #%% METHOD extend()
+    # Add any new rows at the end of meta into the index
+    def extend(self, meta):
+
+
+        # Identify the new rows
+        n_old = len(self.codes)
+        new = np.arange(n_old, len(meta))
+        new_codes = bucket_codes(meta, new)
+
+
+        # Make room for them and put them into their buckets
+        self.codes = np.append(self.codes, new_codes)
+        self.position = np.append(self.position, np.zeros(len(new), dtype = int))
+        for i, code in zip(new, new_codes):
+            self._put_in(i, code)
+
+
+    #%% METHOD remove()
+    # Take people out of the index and shuffle everybody else's indices down
+    # in the same way as meta.drop(leave).reset_index()
+    def remove(self, leave):
+        keep = np.ones(len(self.codes), dtype = bool)
+        keep[np.asarray(leave, dtype = int)] = False
+        self.codes = self.codes[keep]
+        self.rebuild()
+
+
+    #%% METHOD size()
+    # The total number of people in a list of buckets
+    def size(self, codes):
+        return sum(len(self.buckets[b]) for b in codes)
+
+
+    #%% METHOD sample()
+    # Pick somebody uniformly at random from a list of buckets, excluding
+    # anybody in the exclude list. Returns -1 if nobody is available.
+    def sample(self, codes, exclude):
+
+
+        # Count the number of people who could be chosen
+        exclude = set(int(i) for i in exclude)
+        n_total = self.size(codes)
+        n_excluded = sum(1 for i in exclude if self.codes[i] in codes)
+        if n_total - n_excluded <= 0:
+            return -1
+
+
+        # Pick somebody at random until they aren't excluded
+        while True:
+            k = rs.stream('partners').randint(n_total)
+            for b in codes:
+                if k < len(self.buckets[b]):
+                    break
+                k = k - len(self.buckets[b])
+            j = self.buckets[b][k]
+            if j not in exclude:
+                return j
+
+
+    #%% METHOD sample_array()
+    # Pick one person uniformly at random from each row of an array of bucket
+    # codes (padded with -1) in a single pass. Nobody is excluded, so the
+    # caller has to check the draws. Returns -1 for any empty pools.
+    def sample_array(self, codes):
+
+
+        # For just a few draws it's quicker to do them one at a time than to
+        # flatten out all the buckets
+        if len(codes) < 8:
+            return np.array([self.sample(row[row != -1].tolist(), []) for row in codes], dtype = int)
+
+
+        # Flatten out the buckets
+        sizes = np.array([len(b) for b in self.buckets])
+        start = np.cumsum(sizes) - sizes
+        flat = np.concatenate([np.array(b, dtype = int) for b in self.buckets])
+
+
+        # Work out the size of each pool
+        valid = codes != -1
+        pool_sizes = np.where(valid, sizes[np.maximum(codes, 0)], 0)
+        cum_sizes = np.cumsum(pool_sizes, axis = 1)
+        total = cum_sizes[:, -1]
+
+
+        # Draw a position in each pool and work out which bucket that falls in
+        rows = np.arange(len(codes))
+        k = np.floor(rs.stream('partners').random(len(codes)) * total).astype(int)
+        col = np.minimum(np.sum(k[:, None] >= cum_sizes, axis = 1), codes.shape[1] - 1)
+        offset = k - (cum_sizes[rows, col] - pool_sizes[rows, col])
+
+
+        # Look up who that is
+        picks = -np.ones(len(codes), dtype = int)
+        found = total > 0
+        picks[found] = flat[start[codes[rows[found], col[found]]] + offset[found]]
+
+
+        return picks
+
+
+    #%% HELPER _take_out()
+    def _take_out(self, i):
+        bucket = self.buckets[self.codes[i]]
+        last = bucket[-1]
+        bucket[self.position[i]] = last
+        self.position[last] = self.position[i]
+        bucket.pop()
+
+
+    #%% HELPER _put_in()
+    def _put_in(self, i, code):
+        self.codes[i] = code
+        self.position[i] = len(self.buckets[code])
+        self.buckets[code].append(i)
@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""
+Direct sampler for an equilibrium partnership network
+
+Rather than running the partnership dynamics from an empty network until
+they settle down, the network is drawn straight from an approximation to
+their stationary distribution.
+
+Everybody is put into a class by (gender, orientation, age_group, risk), as
+in the CandidateIndex, and the partnership process is summarised by the
+rate at which seekers in one class pair up with people in another. In
+equilibrium each person alternates between being single and being in a
+long-term relationship, so the proportion of each class who are single
+solves a fixed point between
+
+    the rate at which singles enter long-term relationships, which depends
+        on how many singles there are to partner with, and
+    the expected duration of a long-term relationship.
+
+Given the solution, long-term pairs are drawn between the classes in
+proportion to (formation rate) x (mean duration), and short-term
+partnerships likewise, allowing for them being ended early when either
+partner enters a long-term relationship. Every partnership is given a
+residual duration drawn from the forward-recurrence distribution of its
+duration distribution, as if observed at a random point in its life.
+
+The approximation ignores the redrawing of partners who are already taken
+and conflicts between partnerships formed on the same day, so it is worth
+checking against a full burn in with compare_to_burn_in() whenever the
+behavioural data change.
+
+INDEX
+    sample_equilibrium: samples a partnership network at equilibrium
+    equilibrium_rates: solves for the equilibrium partnership rates
+    residual_durations: samples forward-recurrence times of partnerships
+    compare_to_burn_in: compares sampled networks to burnt in ones
+"""
+
+
+#%% SETUP Load Libraries
+import numpy as np
+
+
+# My modules
+import src.partners.candidates as cnd
+import src.partners.partnership_graph as pg
+import src.partners.burn_in as burn
+import src.partners.summary_stats as pstat
+
+
+# Number of classes of people, as in the CandidateIndex without the long-term status
+N_CLASSES = cnd.N_BUCKETS // cnd.N_LONG_TERM
+
+
+#%% FUN sample_equilibrium()
+#
+#
+# Sample a partnership network from the equilibrium of the partnership
+# dynamics, as an alternative to burn_in_partnerships().
+#
+# Anybody who already has partners in partner_graph keeps them, so this
+# would normally be run on an empty network.
+#
+#
+# INPUT
+#   prt_parameters = the behavioural tables from setup_data()
+#   meta = the population array
+#   partner_graph = the PartnershipGraph, up to date with meta
+#   t = the time the network is sampled at, expiry times are t + residual
+#   n_redraws = how many times to try drawing each short-term partner
+#
+# OUTPUT
+#   meta, partner_graph
+#
+#
+def sample_equilibrium(prt_parameters, meta, partner_graph, t = 0, n_redraws = 10):
+
+
+    # Solve for the equilibrium
+    rates = equilibrium_rates(prt_parameters, meta)
+    classes = cnd.bucket_codes(meta) // cnd.N_LONG_TERM
+
+
+    ###########################
+    ##  LONG-TERM PARTNERS  ##
+    ###########################
+
+
+    # Expected number of long-term pairs between each pair of classes
+    n_pairs = np.triu(rates['long_pairs'] + rates['long_pairs'].T - np.diag(np.diag(rates['long_pairs'])))
+    n_pairs = np.floor(n_pairs + np.random.random(n_pairs.shape)).astype(int)
+
+
+    # Shuffle the singles in each class
+    single = meta.partner.to_numpy(dtype = int) == -1
+    pool = [list(np.random.permutation(np.flatnonzero(single & (classes == c)))) for c in range(0, N_CLASSES)]
+
+
+    # Pair people up, going through the pairs of classes in a random order
+    pairs = []
+    for k in np.random.permutation(np.flatnonzero(n_pairs)):
+        a, c = np.unravel_index(k, n_pairs.shape)
+        for _ in range(0, n_pairs[a, c]):
+            if (len(pool[a]) == 0) | (len(pool[c]) < (2 if a == c else 1)):
+                break
+            pairs.append([pool[a].pop(), pool[c].pop()])
+    pairs = np.array(pairs, dtype = int).reshape(-1, 2)
+
+
+    # Add them in
+    risk = meta.risk.to_numpy(dtype = int)
+    expire = t + residual_durations(prt_parameters, risk[pairs[:, 0]] + risk[pairs[:, 1]], 0)
+    meta.loc[pairs[:, 0], 'partner'] = pairs[:, 1].astype(np.int32)
+    meta.loc[pairs[:, 1], 'partner'] = pairs[:, 0].astype(np.int32)
+    for k in range(0, len(pairs)):
+        partner_graph.add(pairs[k, 0], pairs[k, 1], expire[k], pg.LONG_TERM)
+    partner_graph.update_people(meta, pairs.flatten())
+
+
+    ############################
+    ##  SHORT-TERM PARTNERS  ##
+    ############################
+
+
+    # Group everybody by class and partnership status
+    status = (meta.partner.to_numpy(dtype = int) != -1).astype(int)
+    group = 2 * classes + status
+    order = np.argsort(group, kind = 'stable')
+    size = np.bincount(group, minlength = 2 * N_CLASSES)
+    start = np.cumsum(size) - size
+
+
+    # Work out the short-term partnership rates given who ended up single,
+    # so that nobody looks for partners in a group that's empty
+    n = np.bincount(classes, minlength = N_CLASSES)
+    single = np.divide(size[0::2], n, out = np.ones(N_CLASSES), where = n > 0)
+    short_pairs = equilibrium_rates(prt_parameters, meta, single)['short_pairs']
+
+
+    # Draw the number of partnerships from each group to each other group
+    counts = np.random.poisson(short_pairs.reshape(2 * N_CLASSES, 2 * N_CLASSES))
+    ga, gc = np.nonzero(counts)
+    ga, gc = np.repeat(ga, counts[ga, gc]), np.repeat(gc, counts[ga, gc])
+
+
+    # Pick somebody at random from each group
+    ii = order[start[ga] + np.floor(np.random.random(len(ga)) * size[ga]).astype(int)]
+    jj = order[start[gc] + np.floor(np.random.random(len(gc)) * size[gc]).astype(int)]
+
+
+    # Add them in, redrawing anybody who drew themselves or an existing
+    # partner as in match_partners()
+    expire = t + residual_durations(prt_parameters, risk[ii] + risk[jj], 1)
+    for k in range(0, len(ii)):
+        i, j = ii[k], jj[k]
+        for _ in range(0, n_redraws):
+            if (i != j) and (j not in partner_graph.adjacency[i]):
+                partner_graph.add(i, j, expire[k], pg.SHORT_TERM)
+                break
+            j = order[start[gc[k]] + np.random.randint(size[gc[k]])]
+
+
+    return meta, partner_graph
+
+
+#%% FUN equilibrium_rates()
+#
+#
+# Solve for the equilibrium of the partnership process between classes.
+#
+# Seekers in class a with partnership status x look for partners each day
+# with probability q[a, x] from prob_partnership() and pick somebody at
+# random from the people of the age group, risk group and partnership
+# status they're after who are compatible with their gender and
+# orientation, exactly as in match_partners(). This gives the daily rate
+#
+#     flow[a, x, c, y] = N[a, x] q[a, x] P(c, y | a)
+#
+# at which partnerships form between people in (a, x) and (c, y), where
+# N[a, x] is the number of people in class a with status x. A new pair of
+# singles enters a long-term relationship with probability p_long, so the
+# long-term hazard h[c] of each single in class c and the proportion of
+# class c who are single s[c] satisfy
+#
+#     s[c] = 1 / (1 + h[c] E[D])
+#
+# where E[D] is the mean duration of their long-term relationships. This is
+# iterated from everybody being single until it converges.
+#
+#
+# INPUT
+#   prt_parameters = the behavioural tables from setup_data()
+#   meta = the population array
+#   single = the proportion of each class who are single, if this is given
+#            the rates are worked out for it rather than the equilibrium
+#   tol = the tolerance on the proportion single
+#   max_iter = the maximum number of iterations
+#
+# OUTPUT
+#   dictionary of
+#       single = the proportion of each class who are single
+#       hazard = the daily hazard of each single entering a long-term relationship
+#       long_pairs = expected number of long-term pairs formed by seekers
+#                    in one class (row) with singles in another (column)
+#       short_pairs = expected number of short-term partnerships formed by
+#                     seekers in one class and status with people in another,
+#                     as an array indexed by [a, x, c, y]
+#
+#
+def equilibrium_rates(prt_parameters, meta, single = None, tol = 1e-8, max_iter = 1000):
+
+
+    # Attributes of each class
+    code = np.arange(0, N_CLASSES)
+    risk = code % cnd.N_RISK
+    age_group = (code // cnd.N_RISK) % cnd.N_AGE_GROUP
+    orientation = (code // (cnd.N_RISK * cnd.N_AGE_GROUP)) % cnd.N_ORIENTATION
+    gender = code // (cnd.N_RISK * cnd.N_AGE_GROUP * cnd.N_ORIENTATION)
+    n = np.bincount(cnd.bucket_codes(meta) // cnd.N_LONG_TERM, minlength = N_CLASSES).astype(float)
+
+
+    # Which classes each class looks for partners in
+    targets = cnd.target_code_array(gender, orientation, age_group, risk, np.zeros(N_CLASSES, dtype = int))
+    compatible = np.zeros((N_CLASSES, N_CLASSES), dtype = bool)
+    for a in range(0, N_CLASSES):
+        target_pairs = [(tc // cnd.N_LONG_TERM) // (cnd.N_RISK * cnd.N_AGE_GROUP) for tc in targets[a, targets[a, :] != -1]]
+        compatible[a, :] = np.isin(code // (cnd.N_RISK * cnd.N_AGE_GROUP), target_pairs)
+
+
+    # Probability that a seeker in class a goes after the age group, risk
+    # group and partnership status of class c
+    p_age = np.diff(prt_parameters['age_cdf'], axis = 1, prepend = 0)
+    p_risk = np.where(risk[None, :] == 1, prt_parameters['p_risky'][risk][:, None], 1 - prt_parameters['p_risky'][risk][:, None])
+    p_status = np.column_stack((1 - prt_parameters['p_cheat'][risk], prt_parameters['p_cheat'][risk]))
+    p_target = compatible * p_age[age_group[:, None], age_group[None, :]] * p_risk
+
+
+    # The partnership formation probabilities by status
+    q = prt_parameters['p_new_partner'][risk, age_group][:, None] * np.column_stack((np.ones(N_CLASSES), prt_parameters['p_cheat'][risk]))
+
+
+    # Probability of a pair of singles being long term and how long it lasts.
+    # Partnerships are only ended at the start of the day after they expire,
+    # so on average they're around for an extra half day.
+    p_long = prt_parameters['p_long_term'][age_group[:, None], risk[:, None] + risk[None, :]]
+    shape, scale = prt_parameters['duration_params']['long']
+    mean_long = (shape * scale + 0.5)[risk[:, None] + risk[None, :]]
+
+
+    # Iterate on the proportion single, unless it's been given
+    fixed = single is not None
+    single = (np.ones(N_CLASSES) if single is None else np.asarray(single, dtype = float))
+    for _ in range(0, 0 if fixed else max_iter):
+
+
+        # Expected time spent in long-term relationships for each single
+        long_flow = _flows(n, single, compatible, p_target, p_status, q)[:, 0, :, 0] * p_long
+        time_long = _per_single(n, single, long_flow * mean_long)
+
+
+        # Update the proportion single, with a bit of damping
+        new_single = 0.5 * single + 0.5 / (1 + time_long)
+        converged = np.max(np.abs(new_single - single)) < tol
+        single = new_single
+        if converged:
+            break
+
+
+    # Long-term pairs and the hazard of entering one at equilibrium
+    flow = _flows(n, single, compatible, p_target, p_status, q)
+    long_pairs = flow[:, 0, :, 0] * p_long * mean_long
+    hazard = _per_single(n, single, flow[:, 0, :, 0] * p_long)
+
+
+    # Short-term partnerships last until they expire or until a single
+    # partner enters a long-term relationship
+    p_short = np.ones((N_CLASSES, 2, N_CLASSES, 2))
+    p_short[:, 0, :, 0] = 1 - p_long
+    ended = hazard[:, None] * np.array([1, 0])[None, :]
+    mean_short = 1 / (1 / (prt_parameters['duration_params']['short'] + 0.5) + ended[:, :, None, None] + ended[None, None, :, :])
+    short_pairs = flow * p_short * mean_short
+
+
+    return {'single': single,
+            'hazard': hazard,
+            'long_pairs': long_pairs,
+            'short_pairs': short_pairs}
+
+
+#%% HELPER _per_single()
+# Total of a flow between singles in each class, per single in that class
+def _per_single(n, single, long_flow):
+    n_single = n * single
+    total = long_flow.sum(axis = 1) + long_flow.sum(axis = 0)
+    return np.divide(total, n_single, out = np.zeros(N_CLASSES), where = n_single > 0)
+
+
+#%% HELPER _flows()
+# Daily rate of new partnerships between each class and status, indexed by
+# [seeker class, seeker status, partner class, partner status]
+def _flows(n, single, compatible, p_target, p_status, q):
+
+
+    # Number of people of each class and status
+    n_status = n[:, None] * np.column_stack((single, 1 - single))
+
+
+    # The pool each seeker picks from is everybody compatible in the chosen
+    # age group, risk group and status
+    key = np.arange(0, N_CLASSES) % (cnd.N_RISK * cnd.N_AGE_GROUP)
+    same_key = key[:, None] == key[None, :]
+    pool = np.einsum('ad,cd,dy->acy', compatible.astype(float), same_key.astype(float), n_status)
+    share = np.divide(n_status[None, :, :], pool, out = np.zeros_like(pool), where = pool > 0)
+
+
+    # Chance of each seeker picking each person
+    p_pick = p_target[:, :, None] * p_status[:, None, :] * share
+
+
+    return n_status[:, :, None, None] * q[:, :, None, None] * p_pick[:, None, :, :]
+
+
+#%% FUN residual_durations()
+#
+#
+# Sample the time left in a set of partnerships observed at a random point
+# in their lives.
+#
+# This is the forward-recurrence time of the duration distributions in
+# relationship_durations(). For the exponential durations of short-term
+# relationships it is the same exponential distribution. For the Gamma(k, s)
+# durations of long-term relationships it is a uniform fraction of a length
+# biased draw, which is Gamma(k + 1, s).
+#
+#
+# INPUT
+#   prt_parameters = the behavioural tables from setup_data()
+#   risk_group = array of the relationship risk-group of each partnership
+#   is_short = {0=long term relationship, 1=short term relationship}
+#
+# OUTPUT
+#   the residual durations of the relationships
+#
+#
+def residual_durations(prt_parameters, risk_group, is_short):
+
+
+    # Short term relationships
+    duration_params = prt_parameters['duration_params']
+    if is_short == 1:
+        return np.random.exponential(duration_params['short'], len(risk_group))
+
+
+    # Long term relationships
+    length = np.random.gamma(duration_params['long'][0, risk_group] + 1, duration_params['long'][1, risk_group])
+    return np.random.random(len(risk_group)) * length
+
+
+#%% FUN compare_to_burn_in()
+#
+#
+# Validate sample_equilibrium() against burn_in_partnerships().
+#
+# Networks are built both ways on copies of the same population and the
+# number of people in each partnership type of update_partnership_types()
+# is recorded for each age and risk group.
+#
+#
+# INPUT
+#   prt_parameters = the behavioural tables from setup_data()
+#   meta = the population array, with nobody partnered
+#   n_days = the length of the full burn in
+#   n_samples = how many networks to build each way
+#
+# OUTPUT
+#   sampled, burnt_in = arrays of the number of people in each partnership
+#                       type, indexed by [sample, age and risk group, type]
+#                       with the groups in the order p0ht, p0lt, ..., p3lt
+#
+#
+def compare_to_burn_in(prt_parameters, meta, n_days, n_samples = 10):
+
+
+    # Count the number of people in each partnership type
+    def partnership_types(meta, partner_graph):
+        series = [np.zeros((1, 5)) for _ in range(0, 8)]
+        series = pstat.update_partnership_types(meta, partner_graph, 0, *series)
+        return np.vstack(series)
+
+
+    # Build the networks both ways
+    sampled = np.zeros((n_samples, 8, 5))
+    burnt_in = np.zeros((n_samples, 8, 5))
+    for k in range(0, n_samples):
+
+
+        # Direct sample
+        meta_k = meta.copy()
+        meta_k, partner_graph = sample_equilibrium(prt_parameters, meta_k, pg.PartnershipGraph(meta_k))
+        sampled[k, :, :] = partnership_types(meta_k, partner_graph)
+
+
+        # Full burn in
+        meta_k = meta.copy()
+        meta_k, partner_graph, _, _ = burn.burn_in_partnerships(prt_parameters, meta_k, pg.PartnershipGraph(meta_k), n_days, n_days)
+        burnt_in[k, :, :] = partnership_types(meta_k, partner_graph)
+
+
+    return sampled, burnt_in
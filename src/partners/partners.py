@@ -3,8 +3,16 @@
          Collection of functions for the remote communities model
 
 INDEX
+    continuous_partnerships: runs the continuous-time partnership process for a day
+    setup_data: reads in and compiles the behavioural data
+    set_partner_rates: changes the partnership formation rates
+    match_partners: decides who each of a group of people will partner with
     find_partner: decides who a given person will partner with
     choose_relationship: decides if a given relationship will be long or short
+    choose_relationships: decides if each of a set of relationships will be long or short
+    relationship_durations: samples the durations of a set of relationships
+    find_seekers: decides who will look for a new partner on a given day
+    seek_rate: the rate at which people look for partners in continuous time
 
 
 """
@@ -14,185 +22,272 @@ import numpy as np
 import pandas as pd
 
 
-#%% SETUP Read in Data
+# My modules
+import src.partners.candidates as cnd
+import src.infections.streams as rs
 
 
-# Setup distribution for the age-group to age-group preferences
+#%% FUN setup_data()
 #
 #
-# Probability matrix of age biasing of last sexual encounter
-# Data from Table 5-3 of the GOANNA study - characteristics of last sexual encounter
-# Read as: from (row) to (column)
-# State space: {16-19, 20-24, 25-29, >29}
-# Note that the <16 demographics are excluded as they aren't in the model
-# The rows only correspond to the 16-19, 20-24, 25-29 age groups
-# bias_age = np.array([[578, 130, 11],
-#                      [127, 487, 61],
-#                      [27, 243, 174],
-#                      [27, 243, 174]],
-#         dtype = "float")
+# Read in all of the behavioural data used for making partnerships and
+# compile it into NumPy arrays ready to be used in the simulation.
 #
+# The output is passed into the partnership functions as prt_parameters, so
+# any of the tables can be swapped out for a particular run. Partnership
+# rates can also be changed in-process with set_partner_rates().
 #
-# Update for latest GOANNA survey (Table 5.5)
-# bias_age = np.array([[221, 71, 7, 7],
-#                      [50, 208, 105, 105],
-#                      [9, 58, 198, 198],
-#                      [9, 58, 198, 198]],
-#         dtype = "float")
-# bias_age = bias_age/bias_age.sum(axis=1, keepdims = True)
-# bias_age = np.cumsum(bias_age, axis = 1)
 #
+# INPUT
+#   data_dir = the directory to read the data from
+#   partner_rates = overrides data/partnership_rates.csv if given, must have
+#                   a low and a high entry
 #
-# Read in distribution as csv
-bias_age = pd.read_csv('data/age_partnership_distribution.csv')
-
-
-# Setup distribution for the sex to age-group preferences
-#
+# OUTPUT
+#   prt_parameters = dictionary of behavioural tables
+#
+#
+def setup_data(data_dir = 'data', partner_rates = None):
+
+
+    # Setup distribution for the age-group to age-group preferences
+    #
+    #
+    # Probability matrix of age biasing of last sexual encounter
+    # Data from Table 5-3 of the GOANNA study - characteristics of last sexual encounter
+    # Read as: from (row) to (column)
+    # State space: {16-19, 20-24, 25-29, >29}
+    # Note that the <16 demographics are excluded as they aren't in the model
+    # The rows only correspond to the 16-19, 20-24, 25-29 age groups
+    # bias_age = np.array([[578, 130, 11],
+    #                      [127, 487, 61],
+    #                      [27, 243, 174],
+    #                      [27, 243, 174]],
+    #         dtype = "float")
+    #
+    #
+    # Update for latest GOANNA survey (Table 5.5)
+    # bias_age = np.array([[221, 71, 7, 7],
+    #                      [50, 208, 105, 105],
+    #                      [9, 58, 198, 198],
+    #                      [9, 58, 198, 198]],
+    #         dtype = "float")
+    # bias_age = bias_age/bias_age.sum(axis=1, keepdims = True)
+    # bias_age = np.cumsum(bias_age, axis = 1)
+    #
+    #
+    # Read in distribution as csv and store it as a CDF for each row
+    bias_age = pd.read_csv(data_dir + '/age_partnership_distribution.csv').to_numpy(dtype = float)
+    age_cdf = np.cumsum(bias_age, axis = 1)
+    age_cdf = age_cdf/age_cdf[:, -1:]
+
+
+    # Setup distribution for the sex to age-group preferences
+    #
+    #
+    # Probability distribution of sex age bias for last sexual encounter
+    # Data from Table 5-3 as above
+    # State space {0 (male), 1 (female)}
+    # Read as: from (row) to (column)
+    # bias_sex = np.array([[379, 313, 76, 76],
+    #                     [346, 546, 170, 170]])
+    #
+    #
+    # Update for latest GOANNA Survey (Table 5.4)
+    # bias_sex = np.array([[136, 132, 98, 98],
+    #                      [155, 229, 254, 254]])
+    # bias_sex = bias_sex/bias_sex.sum(axis=1, keepdims = True)
+    #
+    #
+    # This has been turned off
+
+
+    # Probabilities of partnering with another high-risk individual
+    #
+    #
+    # Probability distribution of taking a high-risk partner by risk-group
+    # Probabilties are made up
+    # Columns: 0 (low-risk), 1(high-risk)
+    # Row: the probability of taking a high-risk partner
+    # p_risky = np.array([0.05, 0.9])
+    #
+    #
+    p_risky = pd.read_csv(data_dir + '/probability_high_risk_partner.csv').to_numpy(dtype = float)[0, :]
+
+
+    # Probabilities of cheating
+    #
+    #
+    # Probability distribution of cheating by risk group
+    # Probabilities are made up
+    # Columns: 0 (low-risk), 1 (high risk)
+    # Row: the probability of cheating on a long-term partner
+    # p_cheat = np.array([0.05, 0.5])
+    #
+    #
+    p_cheat = pd.read_csv(data_dir + '/probability_cheat.csv').to_numpy(dtype = float)[0, :]
+
+
+    # Probabilities of entering a long-term relationship by age group
+    #
+    #
+    # Probability distribution of nature of sexual partnerships
+    # Data from Table 5-3 as above
+    # Read as: age group (row) and relationship (column)
+    # Relationship state space: {0 (long term), 1 (short term)}
+    # bias_relationship = np.array([[526, 264],
+    #                               [490, 234],
+    #                               [449, 150]])
+    #
+    #
+    # Updated for new GOANNA survey (Table 5.5)
+    # bias_relationship = np.array([[129, 174],
+    #                               [173, 187],
+    #                               [157, 109],
+    #                               [157, 109]])
+    # bias_relationship = bias_relationship/bias_relationship.sum(axis=1, keepdims = True)
+    #
+    #
+    bias_relationship = pd.read_csv(data_dir + '/probability_relationship.csv').to_numpy(dtype = float)
+
+
+    # Scaling of the probability of a long term relationship
+    #
+    #
+    # The probability of a long-term relationship by relationship risk-group
+    # The relationship risk-group defined as follows
+    #    0 = 0 x high-risk | 2 x low-risk
+    #    1 = 1 x high-risk | 1 x low-risk
+    #    2 = 2 x high-risk | 0 x low-risk
+    # Column: relationship risk-group
+    # aversion = [1, 0.4, 0.05]
+    #
+    #
+    aversion = pd.read_csv(data_dir + '/scaling_long_term_by_risk_group.csv').to_numpy(dtype = float)[0, :]
+
+
+    # Probability of a new relationship between two singles being long term
+    #
+    #
+    # Combines bias_relationship and aversion
+    # Row: age group, column: relationship risk-group
+    p_long_term = bias_relationship[:, 0, None] * aversion[None, :]
+
+
+    # Partnership duration parameters
+    #
+    #
+    # Parameters of sample distribution for long-term relationships
+    # Note that this is a Gamma distribution with seperate parameters for
+    # each relationship risk-group
+    # Row: parameter, column: relationship risk-group (see above)
+    # duration_params = {"long": np.array([[365/100, 2*30/10, 2*30/10, 2*30/10],
+    #                                      [100, 10, 10, 10]]),
+    #                    "short": 14}
+    #
+    #
+    partner_durations = pd.read_csv(data_dir + '/partnership_durations.csv')
+    duration_params = {'long': np.array([4 * [partner_durations.long_mean[0]/partner_durations.long_var[0]],
+                                         4 * [partner_durations.long_var[0]]]),
+                       'short': partner_durations.short[0]}
+
+
+    # Put it all together
+    prt_parameters = {'age_cdf': age_cdf,
+                      'p_risky': p_risky,
+                      'p_cheat': p_cheat,
+                      'p_long_term': p_long_term,
+                      'p_new_partner_scaling': pd.read_csv(data_dir + '/partnership_rates_scaling.csv').to_numpy(dtype = float),
+                      'duration_params': duration_params}
+
+
+    # Partnership formation rates
+    #
+    #
+    # Probability of forming a new partnership
+    # Adjusted to agree with the GOANNA survey data
+    # Row: risk level, column: age-group
+    #
+    #
+    # p_new_partner = np.array([(2/2) * (1/365) * np.array([1, 1, 0.9, 0.9]),
+    #                           (50/2) * (1/365) * np.array([1.1, 1.1, 1, 1])])
+    #
+    #
+    if partner_rates is None:
+        partner_rates = pd.read_csv(data_dir + '/partnership_rates.csv').loc[0, :]
+    prt_parameters = set_partner_rates(prt_parameters, partner_rates['low'], partner_rates['high'])
+
+
+    return prt_parameters
+
+
+#%% FUN set_partner_rates()
+#
+#
+# Set the partnership formation rates of the low and high-risk groups and
+# recompute the daily probability of forming a new partnership.
 #
-# Probability distribution of sex age bias for last sexual encounter
-# Data from Table 5-3 as above
-# State space {0 (male), 1 (female)}
-# Read as: from (row) to (column)
-# bias_sex = np.array([[379, 313, 76, 76],
-#                     [346, 546, 170, 170]])
 #
+# INPUT
+#   prt_parameters = the output of setup_data()
+#   low, high = the partnership rates of the two risk groups
 #
-# Update for latest GOANNA Survey (Table 5.4)
-# bias_sex = np.array([[136, 132, 98, 98],
-#                      [155, 229, 254, 254]])
-# bias_sex = bias_sex/bias_sex.sum(axis=1, keepdims = True)
+# OUTPUT
+#   prt_parameters
 #
 #
-# This has been turned off
+def set_partner_rates(prt_parameters, low, high):
 
 
-# Probabilities of partnering with another high-risk individual
-#
-#
-# Probability distribution of taking a high-risk partner by risk-group
-# Probabilties are made up
-# Columns: 0 (low-risk), 1(high-risk)
-# Row: the probability of taking a high-risk partner
-# p_risky = np.array([0.05, 0.9])
-#
-#
-p_risky = pd.read_csv('data/probability_high_risk_partner.csv')
-
+    # Scale the age-group adjustments by the rates
+    p_new_partner = (1/365) * prt_parameters['p_new_partner_scaling'].copy()
+    p_new_partner[0, :] = low * p_new_partner[0, :]
+    p_new_partner[1, :] = high * p_new_partner[1, :]
 
-# Probabilities of cheating
-#
-#
-# Probability distribution of cheating by risk group
-# Probabilities are made up
-# Columns: 0 (low-risk), 1 (high risk)
-# Row: the probability of cheating on a long-term partner
-# p_cheat = np.array([0.05, 0.5])
-#
-#
-p_cheat = pd.read_csv('data/probability_cheat.csv')
 
+    # Store
+    prt_parameters.update({'partner_rates': {'low': low, 'high': high},
+                           'p_new_partner': p_new_partner})
 
-# Probabilities of entering a long-term relationship by age group
-#
-#
-# Probability distribution of nature of sexual partnerships
-# Data from Table 5-3 as above
-# Read as: age group (row) and relationship (column)
-# Relationship state space: {0 (long term), 1 (short term)}
-# bias_relationship = np.array([[526, 264],
-#                               [490, 234],
-#                               [449, 150]])
-#
-#
-# Updated for new GOANNA survey (Table 5.5)
-# bias_relationship = np.array([[129, 174],
-#                               [173, 187],
-#                               [157, 109],
-#                               [157, 109]])
-# bias_relationship = bias_relationship/bias_relationship.sum(axis=1, keepdims = True)
-#
-#
-bias_relationship = pd.read_csv('data/probability_relationship.csv')
 
+    return prt_parameters
 
-# Scaling of the probability of a long term relationship
-#
-#
-# The probability of a long-term relationship by relationship risk-group
-# The relationship risk-group defined as follows
-#    0 = 0 x high-risk | 2 x low-risk
-#    1 = 1 x high-risk | 1 x low-risk
-#    2 = 2 x high-risk | 0 x low-risk
-# Column: relationship risk-group
-# aversion = [1, 0.4, 0.05]
-#
-#
-aversion = pd.read_csv('data/scaling_long_term_by_risk_group.csv')
 
-
-# Partnership formation rates
-#
+#%% FUN update_partnerships()
 #
-# Probability of forming a new partnership
-# Adjusted to agree with the GOANNA survey data
-# Row: risk level, column: age-group
 #
+# Function to update all partnership dynamics in the model
 #
-# p_new_partner = np.array([(2/2) * (1/365) * np.array([1, 1, 0.9, 0.9]),
-#                           (50/2) * (1/365) * np.array([1.1, 1.1, 1, 1])])
+# Two engines are available:
+#   daily = partnerships are formed once a day by new_partnership() and
+#           ended by old_partnerships()
+#   continuous = the continuous-time process in continuous_partnerships()
 #
 #
-partner_rates = pd.read_csv('data/partnership_rates.csv')
-p_new_partner = pd.read_csv('data/partnership_rates_scaling.csv')
-p_new_partner = (1/365) * p_new_partner
-p_new_partner.loc[0, :] = partner_rates.low[0] * p_new_partner.loc[0, :]
-p_new_partner.loc[1, :] = partner_rates.high[0] * p_new_partner.loc[1, :]
+def update_partnerships(prt_parameters, meta, partner_graph, t, engine = 'daily'):
 
 
-# Partnership duration parameters
-#
-#
-# Parameters of sample distribution for long-term relationships
-# Note that this is a Gamma distribution with seperate parameters for
-# each relationship risk-group
-# Row: parameter, column: relationship risk-group (see above)
-# duration_params = {"long": np.array([[365/100, 2*30/10, 2*30/10, 2*30/10],
-#                                      [100, 10, 10, 10]]),
-#                    "short": 14}
-#
-#
-partner_durations = pd.read_csv('data/partnership_durations.csv')
-duration_params = {'long': np.array([4 * [partner_durations.long_mean[0]/partner_durations.long_var[0]],
-                                     4 * [partner_durations.long_var[0]]]),
-                   'short': partner_durations.short[0]}
-
-
-#%% FUN update_partnerships()
-#
-#
-# Function to update all partnership dynamics in the model
-#
-#
-def update_partnerships(meta, partner_matrix, partner_expire, t):
+    # Run the continuous-time process if asked
+    if engine == 'continuous':
+        return continuous_partnerships(prt_parameters, meta, partner_graph, t)
 
 
     # Update partnership network
-    meta, partner_matrix, partner_expire, _, _, _, _ = new_partnership(meta, partner_matrix, partner_expire, t)
+    meta, partner_graph, _, _, _, _ = new_partnership(prt_parameters, meta, partner_graph, t)
 
 
     # Remove expired partnerships
-    meta, partner_matrix, partner_expire = old_partnerships(meta, partner_matrix, partner_expire, t)
+    meta, partner_graph = old_partnerships(meta, partner_graph, t)
 
 
-    return meta, partner_matrix, partner_expire
+    return meta, partner_graph
 
 
-#%% FUN find_partner()
+#%% FUN match_partners()
 #
 # FUNCTION FOR MAKING PARTNERSHIPS
 #
-# FIND A SEXUAL PARTNER FOR PERSON i FROM THE POOL OF ELIGABLE SINGLES IN meta
+# FIND SEXUAL PARTNERS FOR A GROUP OF BACHELORS FROM THE POOL OF ELIGABLE SINGLES IN meta
 #
 #
 # Decision tree is as follows:
@@ -216,140 +311,133 @@ def update_partnerships(meta, partner_matrix, partner_expire, t):
 #
 #   5. A partner is then selected at random from that pool.
 #
+# All of the bachelors are processed together. The age group, risk group and
+# cheating decisions are drawn in bulk and a partner is drawn for everybody
+# from the CandidateIndex held by the partnership network in one pass. Any
+# draws which land on the bachelor themselves or one of their current
+# partners are redrawn one at a time.
+#
+# Everybody is matched against the network as it stands at the start of the
+# day. Conflicts are resolved deterministically:
+#
+#   - if two bachelors draw each other, only the pair from the bachelor
+#       earlier in the list is kept
+#   - if two bachelors draw the same partner then both pairs are kept and
+#       the rest of the pipeline handles them in the order of the bachelors
+#
 #
 # INPUT
+#   prt_parameters = the behavioural tables from setup_data()
 #   meta = the population array
-#   i = the index of the bachelor
+#   partner_graph = the PartnershipGraph, up to date with meta
+#   bachelors = an array with the indices of the bachelors
 #
 # OUTPUT
-#   j = the index of their new partner.
+#   pairs = an array with one row (i, j) for each new pairing, in the order
+#           of the bachelors. Bachelors who couldn't find anybody are left out.
 #
 #
-def find_partner(meta, partner_matrix, bachelor_index):
-
-
-    ######################################################
-    ##  NARROW DOWN POPULATION TO AVAILABLE CANDIDATES  ##
-    ######################################################
-    # Pick out the bachelor
-    bachelor = meta.loc[bachelor_index,]
-
+def match_partners(prt_parameters, meta, partner_graph, bachelors):
 
-    # Pick out available partners
-    if bachelor["orientation"] == 0:
-        # Pick out partners for heterosexuals
-        # Could be a heterosexual or a bisexual but must be of the opposite gender
-        partners = meta[(meta["orientation"] != 1) &\
-                        (meta["gender"] != bachelor["gender"]) &\
-                        (partner_matrix[bachelor_index, 0:len(meta)]==0) &\
-                        (meta.index != bachelor_index)]
 
-
-    elif bachelor["orientation"] == 1:
-        # Pick out partners for homosexuals
-        # Could be a homosexual or a bisexual of the same gender
-        partners = meta[(meta["orientation"] != 0) &\
-                        (meta["gender"] == bachelor["gender"]) &\
-                        (partner_matrix[bachelor_index,0:len(meta)]==0) &\
-                        (meta.index != bachelor_index)]
-
-
-    else:
-        # Pick out partners for bisexuals
-        # Could be anyone but a hetero of the same sex or a homo of the other sex
-        partners = meta[~((meta["orientation"] == 0) & (meta["gender"] == bachelor["gender"])) &\
-                        ~((meta["orientation"] == 1) & (meta["gender"] != bachelor["gender"])) &\
-                        (partner_matrix[bachelor_index,0:len(meta)]==0) &\
-                        (meta.index != bachelor_index)]
+    # Pick out the bachelors, reading their attributes from the CandidateIndex
+    bachelors = np.asarray(bachelors, dtype = int)
+    n = len(bachelors)
+    gender, orientation, age_group, risk, _ = cnd.bucket_attributes(partner_graph.candidates.codes[bachelors])
 
 
     #############################################
     ##  DECIDE WHICH AGE GROUP TO PARTER WITH  ##
     #############################################
-    if len(partners) > 0:
 
 
-        # Pull out age biasing distribution
-        partner_dist = bias_age.iloc[int(bachelor["age_group"]),] #* bias_sex[int(bachelor["gender"])]
+    # Decide which age-group to partner with from the CDF of age distribution
+    u = rs.stream('partners').random(n)
+    partner_age_group = np.sum(prt_parameters['age_cdf'][age_group, :] < u[:, None], axis = 1)
 
 
-        # Check that there's a parter from each age group available
-        to_ignore = partners.groupby("age_group")["age_group"].count().reset_index(name = "count")
-        to_ignore = to_ignore[to_ignore["count"] == 0]
+    ###############################################
+    ##  DECIDE WHICH RISK GROUP TO PARTNER WITH  ##
+    ###############################################
 
 
-        # Make sure there are still some partners available
-        if len(to_ignore) < 3:
+    # High-risk or low-risk
+    partner_risk = (rs.stream('partners').random(n) < prt_parameters['p_risky'][risk]).astype(int)
 
 
-            # Some age groups may still be empty - set frequency of such
-            # groups to zero so it's impossible to end up choosing them
-            for j in to_ignore["age_group"]:
-                partner_dist[int(j)] = 0
+    ###################################################
+    ##  DECIDE WHICH PARTNER STATUS TO PARTNER WITH  ##
+    ###################################################
 
 
-            # Calculate CDF of age/gender distribution
-            partner_dist = np.cumsum(partner_dist)
-            partner_dist = partner_dist/max(partner_dist)
+    # Cheating with somebody in a long-term relationship or not
+    partner_long_term = (rs.stream('partners').random(n) < prt_parameters['p_cheat'][risk]).astype(int)
 
 
-            # Decide which age-group to partner with
-            partner_age_group = np.searchsorted(partner_dist, np.random.random())
-            partners = partners[partners["age_group"] == partner_age_group]
+    ######################
+    ##  FINAL DECISION  ##
+    ######################
 
 
-            ###############################################
-            ##  DECIDE WHICH RISK GROUP TO PARTNER WITH  ##
-            ###############################################
+    # Work out which buckets of candidates to choose from
+    codes = cnd.target_code_array(gender, orientation, partner_age_group, partner_risk, partner_long_term)
 
 
-            # Decide which risk-group to partner with
-            if np.random.random(1) < p_risky.iloc[0, int(bachelor["risk"])]:
+    # Now just choose one at random for everybody
+    partners = partner_graph.candidates.sample_array(codes)
 
-                # High-risk
-                partners = partners[partners["risk"] == 1]
 
-            else:
+    # Redraw anybody who picked themselves or somebody they're already partnered with
+    for k in range(0, n):
+        i = bachelors[k]
+        if (partners[k] == i) or (partners[k] in partner_graph.adjacency[i]):
+            exclude = np.append(partner_graph.partners(i), i)
+            partners[k] = partner_graph.candidates.sample(codes[k, codes[k,] != -1].tolist(), exclude)
 
-                # Low-risk
-                partners = partners[partners["risk"] == 0]
 
+    # Drop anybody who couldn't find a partner
+    pairs = np.column_stack((bachelors, partners))[partners != -1, :]
 
-            ###################################################
-            ##  DECIDE WHICH PARTNER STATUS TO PARTNER WITH  ##
-            ###################################################
 
+    # Only keep the first of any pairs who drew each other
+    if len(pairs) > 1:
+        _, first = np.unique(np.sort(pairs, axis = 1), axis = 0, return_index = True)
+        pairs = pairs[np.sort(first), :]
 
-            # Decide whether or not to cheat
-            if np.random.random(1) < p_cheat.iloc[0, int(bachelor["risk"])]:
 
-                # Cheating
-                partners = partners[partners["partner"] != -1]
+    # Return the new pairs
+    return pairs
 
-            else:
-                # Not cheating
-                partners = partners[partners["partner"] == -1]
 
-
-            ######################
-            ##  FINAL DECISION  ##
-            ######################
+#%% FUN find_partner()
+#
+# FUNCTION FOR MAKING A SINGLE PARTNERSHIP
+#
+# FIND A SEXUAL PARTNER FOR PERSON i FROM THE POOL OF ELIGABLE SINGLES IN meta
+#
+#
+# Runs match_partners() for just the one bachelor.
+#
+#
+# INPUT
+#   prt_parameters = the behavioural tables from setup_data()
+#   meta = the population array
+#   partner_graph = the PartnershipGraph, up to date with meta
+#   i = the index of the bachelor
+#
+# OUTPUT
+#   j = the index of their new partner, -1 if nobody was found.
+#
+#
+def find_partner(prt_parameters, meta, partner_graph, bachelor_index):
 
 
-            # Now just choose one at random
-            if len(partners) > 0:
-                partner = np.random.choice(partners.index, 1)
-                partner = int(partner)
-            else:
-                partner = -1
-        else:
-            partner = -1
-    else:
-        partner = -1
+    # Run the matching for one person
+    pairs = match_partners(prt_parameters, meta, partner_graph, [bachelor_index])
 
 
-    # Return the meta array but with the updated partner status
-    return partner
+    # Return the new partner
+    return -1 if len(pairs) == 0 else pairs[0, 1]
 
 
 
@@ -371,6 +459,7 @@ def find_partner(meta, partner_matrix, bachelor_index):
 #
 #
 # INPUT
+#   prt_parameters = the behavioural tables from setup_data()
 #   meta = the population array
 #   i = the index of the person finding a partner
 #   j = the index of their partner
@@ -378,7 +467,7 @@ def find_partner(meta, partner_matrix, bachelor_index):
 # OUTPUT
 #   relationship = {0 (long term), 1 (short term)}
 #
-def choose_relationship(meta, i, j):
+def choose_relationship(prt_parameters, meta, i, j):
 
 
     ##################################################
@@ -407,13 +496,11 @@ def choose_relationship(meta, i, j):
 
         # Decide if relationship is long term or short term
         risk_group = meta.at[i, "risk"] + meta.at[j, "risk"]
-        p_relationship = bias_relationship.iloc[int(meta.at[i, "age_group"]), :]
-        p_relationship = np.cumsum(p_relationship)
-        p_relationship[0] = aversion.iloc[0, int(risk_group)] * p_relationship[0]
+        p_long = prt_parameters['p_long_term'][int(meta.at[i, "age_group"]), int(risk_group)]
 
 
         # Now decide on a relationship type at random
-        relationship = int(np.searchsorted(p_relationship, np.random.random(1)))
+        relationship = int(rs.stream('partners').random() >= p_long)
 
 
     # print(i, j, relationship)
@@ -421,6 +508,68 @@ def choose_relationship(meta, i, j):
     return relationship
 
 
+#%% FUN choose_relationships()
+#
+# FUNCTION FOR DECIDING ON THE TYPE OF A SET OF RELATIONSHIPS
+#
+# DECIDE ON THE RELATIONSHIP (CASUAL vs LONG TERM) FOR AN ARRAY OF PAIRS
+#
+#
+# Vectorised version of choose_relationship(). The probability of a long-term
+# relationship is looked up from the p_long_term table for all pairs at once.
+#
+# The pairs are treated as being formed in order, so anybody who enters a
+# long-term relationship in an earlier pair is in a long-term relationship
+# for all later pairs. Any later pairs involving them are made short term.
+#
+#
+# INPUT
+#   prt_parameters = the behavioural tables from setup_data()
+#   meta = the population array
+#   pairs = an array with one row (i, j) for each relationship
+#   codes = the bucket codes of the CandidateIndex to read attributes from
+#           rather than meta, or None
+#
+# OUTPUT
+#   relationship = array of {0 (long term), 1 (short term)}
+#
+def choose_relationships(prt_parameters, meta, pairs, codes = None):
+
+
+    # Pull out the attributes of both partners
+    ii = pairs[:, 0]
+    jj = pairs[:, 1]
+    if codes is None:
+        risk_i, risk_j = meta.risk.to_numpy()[ii].astype(int), meta.risk.to_numpy()[jj].astype(int)
+        age_group = np.minimum(meta.age_group.to_numpy()[ii].astype(int), 3)
+        partnered = (meta.partner.to_numpy()[ii].astype(int) != -1) | (meta.partner.to_numpy()[jj].astype(int) != -1)
+    else:
+        _, _, age_group, risk_i, long_term_i = cnd.bucket_attributes(codes[ii])
+        _, _, _, risk_j, long_term_j = cnd.bucket_attributes(codes[jj])
+        partnered = (long_term_i == 1) | (long_term_j == 1)
+
+
+    # Make a decision at random based on the age group of i and the relationship risk-group
+    p_long = prt_parameters['p_long_term'][age_group, risk_i + risk_j]
+    relationship = (rs.stream('partners').random(len(pairs)) >= p_long).astype(int)
+
+
+    # Anybody already in a long term relationship can only have a short term one
+    relationship[partnered] = 1
+
+
+    # Only the first long term relationship for each person goes ahead
+    taken = set()
+    for k in np.flatnonzero(relationship == 0):
+        if (ii[k] in taken) or (jj[k] in taken):
+            relationship[k] = 1
+        else:
+            taken.update([ii[k], jj[k]])
+
+
+    return relationship
+
+
 #%% FUN prob_partnership()
 #
 # FUNCTION FOR DECIDING THE PROBABILITY OF FORMING A RELATIONSHIP
@@ -454,22 +603,100 @@ def choose_relationship(meta, i, j):
 #
 #
 # INPUT
+#   prt_parameters = the behavioural tables from setup_data()
 #   meta = the population array
-#   i = the index of the person under consideration
+#   i = the index (or array of indices) of the people under consideration
 #
 # OUTPUT
-#   the probability of this individual entering a new partnership
-def prob_partnership(meta, i):
+#   the probability of these individuals entering a new partnership
+def prob_partnership(prt_parameters, meta, i):
 
 
-    # Probability of making a new partnership
-    p_partner_it = ( int(meta.at[i, "partner"] == -1) \
-                    + int(meta.at[i, "partner"] != -1) * p_cheat.iloc[0, int(meta.at[i, "risk"])] ) \
-                    * p_new_partner.iloc[int(meta.at[i, "risk"]), int(meta.at[i, "age_group"])]
+    # Pull out the attributes of everybody under consideration
+    risk = meta.risk.to_numpy()[i].astype(int)
+    age_group = np.minimum(meta.age_group.to_numpy()[i].astype(int), 3)
+    partnered = meta.partner.to_numpy()[i].astype(int) != -1
 
 
     # Return the partnership formation probability
-    return p_partner_it
+    return _partnership_probability(prt_parameters, risk, age_group, partnered)
+
+
+#%% FUN seek_rate()
+#
+# FUNCTION FOR THE RATE OF LOOKING FOR A PARTNER IN CONTINUOUS TIME
+#
+#
+# The rate -log(1 - p) of a Poisson process where p is the daily probability
+# from prob_partnership(), so that the chance of looking for a partner at
+# least once in a day is the same as under the daily process.
+#
+# The attributes are decoded from the bucket codes kept by the
+# CandidateIndex rather than read from meta, so this only costs as much as
+# the number of people given.
+#
+#
+# INPUT
+#   prt_parameters = the behavioural tables from setup_data()
+#   codes = the CandidateIndex bucket codes of the people under consideration
+#
+# OUTPUT
+#   the rate at which these individuals look for a new partnership
+def seek_rate(prt_parameters, codes):
+
+
+    # Decode their attributes
+    _, _, age_group, risk, long_term = cnd.bucket_attributes(np.asarray(codes, dtype = int))
+
+
+    # Convert the daily probability into a rate
+    p_partner_it = _partnership_probability(prt_parameters, risk, age_group, long_term == 1)
+    return -np.log1p(-p_partner_it)
+
+
+#%% HELPER _partnership_probability()
+#
+#
+# The daily probability of a new partnership from the risk group, age group
+# (capped at 3) and whether or not people have a long-term partner.
+#
+#
+def _partnership_probability(prt_parameters, risk, age_group, partnered):
+    return np.where(partnered, prt_parameters['p_cheat'][risk], 1) \
+            * prt_parameters['p_new_partner'][risk, age_group]
+
+
+#%% FUN find_seekers()
+#
+# FUNCTION FOR DECIDING WHO LOOKS FOR A PARTNER TODAY
+#
+# SAMPLE EVERYBODY WHO WILL TRY TO FORM A NEW PARTNERSHIP ON THIS ITERATION
+#
+#
+# The partnership formation probability is computed for the whole population
+# at once using prob_partnership() and all of the Bernoulli trials are drawn
+# in one go. Note that this uses the partnership status at the start of the
+# day, rather than updating it as each new partnership is formed.
+#
+#
+# INPUT
+#   prt_parameters = the behavioural tables from setup_data()
+#   meta = the population array
+#
+# OUTPUT
+#   seekers = the indices of everybody seeking a partner, in ascending order
+def find_seekers(prt_parameters, meta):
+
+
+    # Compute the probability of seeking a partner for everybody
+    p_partner = prob_partnership(prt_parameters, meta, np.arange(len(meta)))
+
+
+    # Draw all of the Bernoulli trials at once
+    seekers = np.flatnonzero(rs.stream('partners').random(len(meta)) < p_partner)
+
+
+    return seekers
 
 
 #%% FUN relationship_duration()
@@ -487,22 +714,23 @@ def prob_partnership(meta, i):
 #
 #
 # INPUT
-#   meta, i, j
+#   prt_parameters, meta, i, j
 #   is_short = {0=long term relationship, 1=short term relationship}
 #
 # OUTPUT
 #   the duration of the relationship
-def relationship_duration(meta, i, j, is_short):
+def relationship_duration(prt_parameters, meta, i, j, is_short):
 
 
     # Sample a duration
+    duration_params = prt_parameters['duration_params']
     if is_short == 0:
         risk_group = meta.at[i, "risk"] + meta.at[j, "risk"]
-        duration = np.random.gamma(duration_params["long"][0, int(risk_group)],
-                                   duration_params["long"][1, int(risk_group)])
+        duration = rs.stream('partners').gamma(duration_params["long"][0, int(risk_group)],
+                                               duration_params["long"][1, int(risk_group)])
         #duration = 1000
     else:
-        duration = np.random.exponential(duration_params["short"])
+        duration = rs.stream('partners').exponential(duration_params["short"])
         #duration = 1
 
 
@@ -511,6 +739,50 @@ def relationship_duration(meta, i, j, is_short):
 
 
 
+#%% FUN relationship_durations()
+#
+# FUNCTION FOR SAMPLING THE DURATION OF A SET OF RELATIONSHIPS
+#
+# SAMPLE THE DURATIONS OF AN ARRAY OF PARTNERSHIPS
+#
+#
+# Vectorised version of relationship_duration() using the same
+# distributions.
+#
+#
+# INPUT
+#   prt_parameters = the behavioural tables from setup_data()
+#   meta = the population array
+#   pairs = an array with one row (i, j) for each relationship
+#   is_short = array of {0=long term relationship, 1=short term relationship}
+#   codes = the bucket codes of the CandidateIndex to read risk groups from
+#           rather than meta, or None
+#
+# OUTPUT
+#   the durations of the relationships
+def relationship_durations(prt_parameters, meta, pairs, is_short, codes = None):
+
+
+    # Work out the relationship risk-group
+    if codes is None:
+        risk = meta.risk.to_numpy()
+        risk_group = risk[pairs[:, 0]].astype(int) + risk[pairs[:, 1]].astype(int)
+    else:
+        risk_group = cnd.bucket_risk(codes[pairs[:, 0]]) + cnd.bucket_risk(codes[pairs[:, 1]])
+
+
+    # Sample a duration for both kinds of relationship and pick out the right one
+    duration_params = prt_parameters['duration_params']
+    duration = np.where(is_short == 0,
+                        rs.stream('partners').gamma(duration_params["long"][0, risk_group], duration_params["long"][1, risk_group]),
+                        rs.stream('partners').exponential(duration_params["short"], len(pairs)))
+
+
+    # Return duration
+    return duration
+
+
+
 #%% FUN new_partnership()
 #
 # FUNCTION FOR MAKING NEW PARTNERSHIPS
@@ -518,25 +790,25 @@ def relationship_duration(meta, i, j, is_short):
 # CREATE A NEW RELATIONSHIP FOR A GIVEN PERSON
 #
 #
-# 1. Sample prob_partnership() to decide whether or not to make a new relationship
+# 1. Run find_seekers() to decide who will look for a new relationship
 #
-# 2. Run find_partner() to decide who the partner will be
+# 2. Run match_partners() to decide who the partners will be
 #
-# 3. Run choose_relationship() to decide if it will be a long or short-term relationship
+# 3. Run choose_relationships() to decide if they will be long or short-term relationships
 #
-# 4. Sample a duration from relationship_duration()
+# 4. Sample durations from relationship_durations()
 #
-# 5. Update meta, partner_matrix, partner_expire accordingly.
+# 5. Update meta and partner_graph accordingly.
 #      Note that entering a long-term relationship causes an end to all
 #      current short-term relationships
 #
 #
 # INPUT
-#   meta, partner_matrix, partner_expire, i, t
+#   prt_parameters, meta, partner_graph, t
 #
 # OUTPUT
-#   meta, partner_matrix, partner_expire
-def new_partnership(meta, partner_matrix, partner_expire, t):
+#   meta, partner_graph
+def new_partnership(prt_parameters, meta, partner_graph, t):
 
 
     # Initilise a couple of summary statistics of duration for if you want them
@@ -546,77 +818,184 @@ def new_partnership(meta, partner_matrix, partner_expire, t):
     d3t = []
 
 
-    # Iterate over all people
-    for i in range(0, len(meta)):
+    # Decide who will look for a new partner on this iteration
+    seekers = find_seekers(prt_parameters, meta)
+
+
+    # Find partners for all of them
+    pairs = match_partners(prt_parameters, meta, partner_graph, seekers)
 
 
-        # Determine if this individual will look for a new partner on this iteration
-        if np.random.random(1) < prob_partnership(meta, i):
+    # Decide on their relationship types
+    is_short = choose_relationships(prt_parameters, meta, pairs)
 
 
-            # Find a new partner
-            j = find_partner(meta, partner_matrix, i)
+    # Sample their durations
+    duration = relationship_durations(prt_parameters, meta, pairs, is_short)
 
 
-            # Check that a partner was indeed found
-            if j != -1:
+    # Update partnership status for the long term relationships
+    long_term = pairs[is_short == 0, :]
+    meta.loc[long_term[:, 0], "partner"] = long_term[:, 1].astype(np.int32)
+    meta.loc[long_term[:, 1], "partner"] = long_term[:, 0].astype(np.int32)
 
 
-                # Decide on their relationship type
-                is_short = choose_relationship(meta, i, j)
+    # Iterate over all the new pairs
+    for k in range(0, len(pairs)):
+        i, j = pairs[k, :]
 
 
-                # Sample a duration
-                duration = relationship_duration(meta, i, j, is_short)
+        # End all other relationships for the long term ones
+        if is_short[k] == 0:
+            partner_graph.clear(i, t)
+            partner_graph.clear(j, t)
 
 
-                # Updates for long-term relationships
-                if is_short == 0:
+        # Update partnership network
+        # print(i, j, is_short[k], duration[k])
+        partner_graph.add(i, j, t + duration[k], is_short[k], t)
 
 
-                    # Update partnership status
-                    meta.at[i, "partner"] = j
-                    meta.at[j, "partner"] = i
+    # They are no longer available as singles
+    partner_graph.update_people(meta, long_term.flatten())
 
 
-                    # End all other relationships
-                    partner_matrix[i,] = 0
-                    partner_matrix[j,] = 0
-                    partner_expire[i,] = float("inf")
-                    partner_expire[j,] = float("inf")
+    # Update partner counter
+    # meta.loc[pairs.flatten(), "counter"] = meta.loc[pairs.flatten(), "counter"] + 1
 
 
-                # Update partnership array
-                partner_matrix[i,j] = 1
-                partner_matrix[j,i] = 1
+    # # Update summary statistics, if you want them
+    # d0t = duration[meta.age_group[pairs[:, 0]] == 0]
+    # d1t = duration[meta.age_group[pairs[:, 0]] == 1]
+    # d2t = duration[meta.age_group[pairs[:, 0]] == 2]
+    # d3t = duration[meta.age_group[pairs[:, 0]] == 3]
 
 
-                # Update partner counter
-                # meta.at[i, "counter"] = meta.at[i, "counter"] + 1
-                # meta.at[j, "counter"] = meta.at[j, "counter"] + 1
+    # Results
+    return meta, partner_graph, d0t, d1t, d2t, d3t
+
 
 
-                # Update partnership duration matrix
-                # print(i, j, is_short, duration)
-                partner_expire[i, j] = t + duration
-                partner_expire[j, i] = t + duration
+#%% FUN continuous_partnerships()
+#
+# FUNCTION FOR RUNNING THE PARTNERSHIP DYNAMICS IN CONTINUOUS TIME
+#
+# RUN ALL PARTNERSHIP EVENTS BETWEEN t AND t + 1
+#
+#
+# Rather than a daily Bernoulli trial, everybody looks for a partner at the
+# times of a Poisson process with the rate from seek_rate(), so the chance
+# of looking at least once in a day is the daily probability from
+# prob_partnership().
+#
+# Events are processed in time order:
+#
+#   1. Partnership expiries are popped off the queue held by partner_graph
+#       and ended as in old_partnerships().
+#
+#   2. A person whose seeking time comes up on the queue held by
+#       partner_graph goes through match_partners(), choose_relationships()
+#       and relationship_durations() as in new_partnership(), and their next
+#       seeking time is sampled. Attributes are read from the bucket codes
+#       of the CandidateIndex rather than from meta.
+#
+# Since waiting times are memoryless, anybody whose rate changes simply has
+# their next seeking time resampled from the new rate. The rate only
+# changes when somebody joins the population or moves between buckets of
+# the CandidateIndex, by changing age group or entering or leaving a
+# long-term relationship, and partner_graph notes these people down as it
+# happens. Only those people and the people with an event due in the day
+# are touched, so a day without any events costs nothing.
+#
+#
+# INPUT
+#   prt_parameters, meta, partner_graph, t
+#
+# OUTPUT
+#   meta, partner_graph
+def continuous_partnerships(prt_parameters, meta, partner_graph, t):
 
 
-                # # Update summary statistics, if you want them
-                # if meta.at[i, "age_group"] == 0:
-                #     d0t.append(duration)
-                # elif meta.at[i, "age_group"] == 1:
-                #     d1t.append(duration)
-                # elif meta.at[i, "age_group"] == 2:
-                #     d2t.append(duration)
-                # else:
-                #     d3t.append(duration)
+    # Reschedule anybody who is new or whose rate has changed since yesterday
+    _reschedule_seeking(prt_parameters, partner_graph, partner_graph.take_reseek(), t)
 
 
-    # Results
-    return meta, partner_matrix, partner_expire, d0t, d1t, d2t, d3t
+    # Run through the events in time order
+    while True:
 
 
+        # Work out what happens next
+        t_expire = partner_graph.next_expiry()
+        t_seek = partner_graph.next_seek()
+        if min(t_expire, t_seek) >= t + 1:
+            break
+
+
+        # End a partnership
+        if t_expire <= t_seek:
+            i, j, tt = partner_graph.pop_expiry()
+            long_term = meta.at[i, "partner"] == j
+            partner_graph.remove(i, j, tt)
+            if long_term:
+                meta.at[i, "partner"] = -1
+                meta.at[j, "partner"] = -1
+                partner_graph.update_people(meta, [i, j])
+                _reschedule_seeking(prt_parameters, partner_graph, partner_graph.take_reseek(), tt)
+            continue
+
+
+        # Otherwise somebody looks for a partner
+        i, tt = partner_graph.pop_seek()
+        pairs = match_partners(prt_parameters, meta, partner_graph, [i])
+
+
+        # Form the partnership
+        if len(pairs) > 0:
+            j = pairs[0, 1]
+            is_short = choose_relationships(prt_parameters, meta, pairs, partner_graph.candidates.codes)
+            duration = relationship_durations(prt_parameters, meta, pairs, is_short, partner_graph.candidates.codes)[0]
+
+
+            # Updates for long-term relationships
+            if is_short[0] == 0:
+                meta.at[i, "partner"] = j
+                meta.at[j, "partner"] = i
+                partner_graph.clear(i, tt)
+                partner_graph.clear(j, tt)
+                partner_graph.update_people(meta, [i, j])
+            partner_graph.add(i, j, tt + duration, is_short[0], tt)
+
+
+        # Work out when they, and anybody whose rate has changed, next look
+        # for a partner
+        _reschedule_seeking(prt_parameters, partner_graph, np.append(partner_graph.take_reseek(), i), tt)
+
+
+    return meta, partner_graph
+
+
+#%% HELPER _reschedule_seeking()
+#
+#
+# Sample the next seeking times of some people from time tt onwards.
+# Anybody with a rate of zero is left unscheduled until their rate changes.
+#
+#
+def _reschedule_seeking(prt_parameters, partner_graph, people, tt):
+
+
+    # Work out their current rates
+    people = np.unique(np.asarray(people, dtype = int))
+    if len(people) == 0:
+        return
+    rate = seek_rate(prt_parameters, partner_graph.candidates.codes[people])
+
+
+    # Sample their waiting times
+    with np.errstate(divide = 'ignore'):
+        seek_time = tt + rs.stream('partners').exponential(1, len(people))/rate
+    partner_graph.schedule_seek(people, seek_time, rate)
+
 
 #%% FUN old_partnerships()
 #
@@ -625,37 +1004,38 @@ def new_partnership(meta, partner_matrix, partner_expire, t):
 # REMOVE EXPIRED RELATIONSHIPS FROM THE POPULATION
 #
 #
-# Check the partner_expire array to see if any relationships have expired.
-# Remove all expired relationships from the array and the partner_matrix array.
+# Pop any relationships which have expired off the partnership expiry queue.
+# Remove all expired relationships from the network.
 # Check meta to see if any of the expired relationships are long-term
 # and update meta accordingly.
 #
 # INPUT
-#   meta, partner_matrix, partner_expire, i
+#   meta, partner_graph, t
 #
 # OUTPUT
-#   meta, partner_matrix, partner_expire
-def old_partnerships(meta, partner_matrix, partner_expire, t):
+#   meta, partner_graph
+def old_partnerships(meta, partner_graph, t):
+
+
+    # Identify partnerships whose time has expired
+    [ii, jj] = partner_graph.expired(t)
 
 
-    # Identify elements of partner_expire whose time has expired
-    [ii, jj] = np.where(partner_expire < t)
+    # Check meta to see which of these relationships are long term
+    long_term = meta.partner.to_numpy(dtype = int)[ii] == jj
+    meta.loc[np.append(ii[long_term], jj[long_term]), "partner"] = -1
 
 
-    # Iterate over meta to check if these relationships are long or short term
-    for i in range(0, len(ii)):
-        if meta.at[ii[i], "partner"] == jj[i]:
-            # print("ENDING IT:", ii[i], jj[i], meta.at[ii[i], "partner"], meta.at[jj[i], "partner"], partner_expire[ii[i], jj[i]])
-            meta.at[ii[i], "partner"] = -1
-            meta.at[jj[i], "partner"] = -1
+    # Remove the partnerships from the network
+    for i, j in zip(ii, jj):
+        partner_graph.remove(i, j, t)
 
 
-    # Reset these elements in the partnership matrices
-    partner_matrix[ii, jj] = 0
-    partner_expire[ii, jj] = float("inf")
+    # Put anybody who has become single back into the right bucket
+    partner_graph.update_people(meta, np.append(ii, jj))
 
 
     # Return output
-    return meta, partner_matrix, partner_expire
+    return meta, partner_graph
 
 
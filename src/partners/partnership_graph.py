@@ -0,0 +1,629 @@
+# -*- coding: utf-8 -*-
+"""
+Sparse store for the partnership network
+
+Each person only has a handful of partners at any one time, so rather than
+carrying around dense N x N arrays of partnerships and expiry times the
+network is stored as
+
+    adjacency lists - for each person a dictionary of {partner: edge slot}
+    an edge table   - arrays holding both ends of each partnership, the time
+                      that it expires and the type of relationship
+
+Adding, removing and clearing partnerships all cost O(degree). A dense view
+of the network can be produced for anything that still wants the old
+partner_matrix and partner_expire arrays.
+
+Each person's number of partners, number of short-term partners and whether
+they have a long-term partner are kept up to date as partnerships form and
+end, and are exposed as read-only arrays.
+
+Partnership expiry times are also held in a min-heap, so finding the
+partnerships which end on a given day only touches those which are due.
+Entries in the heap are invalidated lazily: each edge slot carries a version
+number which is bumped whenever the partnership in it ends early or has its
+expiry changed, and stale entries are discarded as they are popped.
+
+The graph also owns the CandidateIndex used for finding new partners, and
+the time at which each person next looks for a partner under the
+continuous-time partnership process, so that all of these are kept in step
+with meta as people come and go. Seeking times are held in a min-heap by
+person_id, invalidated lazily in the same way as the expiry queue, and
+anybody who joins or moves between buckets of the CandidateIndex is noted
+down so that only their seeking times need to be worked out again.
+
+The number of different partners each person has had over the last year
+(or any other window) is also kept up to date for calibrating against
+GOANNA. Everybody keeps a count of their partnerships with each partner
+which are either still going or ended within the window. Each partnership
+which ends is pushed onto a queue along with the time it ended, and is
+taken off these counts when it drops off the front of the queue a year
+later. As partnerships end in time order this costs O(1) per partnership.
+
+Everybody is given a person_id which stays the same as people come and go.
+If the graph is given a PartnershipLog, every partnership is written to it
+under these ids as it ends. Partnerships are time stamped with the times
+given to add(), remove(), clear() and remove_people().
+
+INDEX
+    PartnershipGraph: the partnership network
+    from_dense: build a partnership network from dense arrays
+    load_graph: read a saved partnership network back in
+"""
+
+
+#%% SETUP Load Libraries
+import numpy as np
+import heapq
+from collections import deque
+
+
+# My modules
+import src.partners.candidates as cnd
+
+
+# Relationship types stored in the edge table
+LONG_TERM = 0
+SHORT_TERM = 1
+
+
+#%% CLASS PartnershipGraph
+#
+#
+# The partnership network.
+#
+# Attributes
+#   n = the number of people in the network
+#   adjacency = list of dictionaries mapping partner to edge slot
+#   degree = the number of current partners of each person (read-only)
+#   n_short = the number of current short-term partners of each person (read-only)
+#   long_term = whether or not each person has a long-term partner (read-only)
+#   edge_i, edge_j = the two people in each edge slot
+#   edge_expire = the time at which each partnership expires
+#   edge_type = the relationship type {0 (long term), 1 (short term)}
+#   edge_active = whether or not each edge slot is in use
+#   edge_version = bumped each time an edge slot is changed
+#   queue = min-heap of (expire, slot, version) for pending expiries
+#   candidates = CandidateIndex of potential partners
+#   seek_time = the time each person next looks for a partner (nan if unscheduled)
+#   seek_rate = the rate that seek_time was sampled with
+#   seek_queue = min-heap of (seek_time, person_id) for pending seeking times
+#   reseek = set of the person_ids of anybody whose seeking rate may have
+#            changed since their seeking time was sampled
+#   edge_start = the time at which each partnership formed (nan if not known)
+#   person_id = an identifier for each person which doesn't change as people come and go
+#   next_id = the person_id that will be given to the next person added
+#   log = PartnershipLog which ended partnerships are written to, or None
+#   window = the number of days that partner_counts() looks back over
+#   recent = list of dictionaries mapping the person_id of each partner in
+#            the window to the number of partnerships with them
+#   ended = queue of (time ended, i, j, person_id of i, person_id of j) for
+#           partnerships which ended in the window
+#
+#
+class PartnershipGraph:
+
+
+    def __init__(self, meta, log = None, window = 365):
+
+
+        # Setup the nodes
+        self.n = len(meta)
+        self.adjacency = [dict() for i in range(0, self.n)]
+        self._degree = np.zeros(self.n, dtype = int)
+        self._n_short = np.zeros(self.n, dtype = int)
+        self._long_term = np.zeros(self.n, dtype = int)
+
+
+        # Setup an empty edge table
+        capacity = max(16, self.n)
+        self.edge_i = np.zeros(capacity, dtype = int)
+        self.edge_j = np.zeros(capacity, dtype = int)
+        self.edge_expire = float('inf') * np.ones(capacity)
+        self.edge_type = np.zeros(capacity, dtype = int)
+        self.edge_active = np.zeros(capacity, dtype = bool)
+        self.edge_version = np.zeros(capacity, dtype = int)
+        self.edge_start = np.nan * np.ones(capacity)
+        self.free = list(range(capacity - 1, -1, -1))
+
+
+        # Setup an empty expiry queue
+        self.queue = []
+
+
+        # Index the pool of potential partners
+        self.candidates = cnd.CandidateIndex(meta)
+
+
+        # Setup the partnership history
+        self.person_id = np.arange(0, self.n)
+        self.next_id = self.n
+
+
+        # Nobody is scheduled to look for a partner yet
+        self.seek_time = np.nan * np.ones(self.n)
+        self.seek_rate = np.zeros(self.n)
+        self.seek_queue = []
+        self.reseek = set(self.person_id.tolist())
+        self.log = log
+
+
+        # Nobody has had any partners yet
+        self.window = window
+        self.recent = [dict() for i in range(0, self.n)]
+        self._n_partners = np.zeros(self.n, dtype = int)
+        self.ended = deque()
+
+
+    #%% PROPERTY degree, n_short, long_term
+    # Read-only views of the partnership counters
+    @property
+    def degree(self):
+        return _read_only(self._degree)
+
+
+    @property
+    def n_short(self):
+        return _read_only(self._n_short)
+
+
+    @property
+    def long_term(self):
+        return _read_only(self._long_term)
+
+
+    #%% METHOD add()
+    # Add a partnership between i and j formed at time t, or update it if it
+    # already exists
+    def add(self, i, j, expire, relationship, t = np.nan):
+
+
+        # Update an existing partnership
+        slot = self.adjacency[i].get(j)
+        if slot is not None:
+            self._count(slot, -1)
+            self.edge_expire[slot] = expire
+            self.edge_type[slot] = relationship
+            self._count(slot, 1)
+            self._schedule(slot)
+            return
+
+
+        # Find a free slot in the edge table
+        if len(self.free) == 0:
+            self._grow()
+        slot = self.free.pop()
+
+
+        # Store the partnership
+        self.edge_i[slot] = i
+        self.edge_j[slot] = j
+        self.edge_expire[slot] = expire
+        self.edge_type[slot] = relationship
+        self.edge_start[slot] = t
+        self.edge_active[slot] = True
+        self.adjacency[i][j] = slot
+        self.adjacency[j][i] = slot
+        self._tally(i, self.person_id[j], 1)
+        self._tally(j, self.person_id[i], 1)
+        self._count(slot, 1)
+        self._schedule(slot)
+
+
+    #%% METHOD remove()
+    # End the partnership between i and j at time t if there is one
+    def remove(self, i, j, t = np.nan):
+
+
+        # Check there is a partnership to remove
+        slot = self.adjacency[i].pop(j, None)
+        if slot is None:
+            return
+        del self.adjacency[j][i]
+
+
+        # Write it to the log
+        if self.log is not None:
+            self.log.append(self.edge_start[slot], t, *self._record(slot))
+
+
+        # Keep counting it towards both partners' number of partners until
+        # it drops out of the window, unless we don't know when it ended
+        if np.isnan(t):
+            self._tally(i, self.person_id[j], -1)
+            self._tally(j, self.person_id[i], -1)
+        else:
+            self.ended.append((t, i, j, self.person_id[i], self.person_id[j]))
+
+
+        # Free up the slot in the edge table
+        self._count(slot, -1)
+        self.edge_active[slot] = False
+        self.edge_expire[slot] = float('inf')
+        self.edge_version[slot] = self.edge_version[slot] + 1
+        self.free.append(slot)
+
+
+    #%% METHOD clear()
+    # End all of the partnerships of person i at time t
+    def clear(self, i, t = np.nan):
+        for j in list(self.adjacency[i]):
+            self.remove(i, j, t)
+
+
+    #%% METHOD partners()
+    # The current partners of person i
+    def partners(self, i):
+        return np.fromiter(self.adjacency[i], dtype = int, count = len(self.adjacency[i]))
+
+
+    #%% METHOD expire()
+    # The time that the partnership between i and j expires
+    def expire(self, i, j):
+        slot = self.adjacency[i].get(j)
+        return float('inf') if slot is None else self.edge_expire[slot]
+
+
+    #%% METHOD expired()
+    # Pop all partnerships which have expired before time t off the queue
+    #
+    # The partnerships are not ended here, the caller is expected to remove()
+    # them once it has dealt with them
+    def expired(self, t):
+
+
+        # Pop everything that is due, skipping over any stale entries
+        slots = []
+        while (len(self.queue) > 0) and (self.queue[0][0] < t):
+            expire, slot, version = heapq.heappop(self.queue)
+            if version == self.edge_version[slot]:
+                slots.append(slot)
+
+
+        slots = np.array(slots, dtype = int)
+        return self.edge_i[slots], self.edge_j[slots]
+
+
+    #%% METHOD next_expiry()
+    # The time at which the next partnership expires, discarding any stale
+    # entries at the top of the queue
+    def next_expiry(self):
+        while (len(self.queue) > 0) and (self.queue[0][2] != self.edge_version[self.queue[0][1]]):
+            heapq.heappop(self.queue)
+        return self.queue[0][0] if len(self.queue) > 0 else float('inf')
+
+
+    #%% METHOD pop_expiry()
+    # Pop the next partnership to expire off the queue
+    #
+    # As with expired() the partnership is not ended here
+    def pop_expiry(self):
+        self.next_expiry()
+        expire, slot, version = heapq.heappop(self.queue)
+        return self.edge_i[slot], self.edge_j[slot], expire
+
+
+    #%% METHOD edges()
+    # All current partnerships as arrays of (i, j, expire, type)
+    def edges(self):
+        slots = np.flatnonzero(self.edge_active)
+        return self.edge_i[slots], self.edge_j[slots], self.edge_expire[slots], self.edge_type[slots]
+
+
+    #%% METHOD add_people()
+    # Make room for any rows which have been appended to meta
+    def add_people(self, meta):
+        n_new = len(meta) - self.n
+        self.adjacency = self.adjacency + [dict() for i in range(0, n_new)]
+        self._degree = np.append(self._degree, np.zeros(n_new, dtype = int))
+        self._n_short = np.append(self._n_short, np.zeros(n_new, dtype = int))
+        self._long_term = np.append(self._long_term, np.zeros(n_new, dtype = int))
+        self.seek_time = np.append(self.seek_time, np.nan * np.ones(n_new))
+        self.seek_rate = np.append(self.seek_rate, np.zeros(n_new))
+        self.person_id = np.append(self.person_id, np.arange(self.next_id, self.next_id + n_new))
+        self.recent = self.recent + [dict() for i in range(0, n_new)]
+        self._n_partners = np.append(self._n_partners, np.zeros(n_new, dtype = int))
+        self.reseek.update(range(self.next_id, self.next_id + n_new))
+        self.next_id = self.next_id + n_new
+        self.n = len(meta)
+        self.candidates.extend(meta)
+
+
+    #%% METHOD remove_people()
+    # Take people out of the network at time t, ending all of their
+    # partnerships, and shuffle everybody else's indices down in the same way
+    # as meta.drop(leave).reset_index()
+    #
+    # Returns the mapping from old to new indices (-1 for those removed)
+    def remove_people(self, leave, t = np.nan):
+
+
+        # End all partnerships with the people leaving
+        leave = np.unique(np.asarray(leave, dtype = int))
+        for i in leave:
+            self.clear(i, t)
+        self.reseek.difference_update(self.person_id[leave].tolist())
+
+
+        # Work out everybody's new index
+        keep = np.ones(self.n, dtype = bool)
+        keep[leave] = False
+        new_index = np.cumsum(keep) - 1
+        new_index[~keep] = -1
+
+
+        # Relabel the nodes
+        self.adjacency = [self.adjacency[i] for i in np.flatnonzero(keep)]
+        self.adjacency = [{int(new_index[j]): slot for j, slot in a.items()} for a in self.adjacency]
+        self._degree = self._degree[keep]
+        self._n_short = self._n_short[keep]
+        self._long_term = self._long_term[keep]
+        self.seek_time = self.seek_time[keep]
+        self.seek_rate = self.seek_rate[keep]
+        self.person_id = self.person_id[keep]
+        self.recent = [self.recent[i] for i in np.flatnonzero(keep)]
+        self._n_partners = self._n_partners[keep]
+        self.n = len(self._degree)
+        self.ended = deque((t_end, new_index[i] if i != -1 else -1, new_index[j] if j != -1 else -1, id_i, id_j)
+                           for t_end, i, j, id_i, id_j in self.ended)
+
+
+        # Relabel the edges
+        slots = np.flatnonzero(self.edge_active)
+        self.edge_i[slots] = new_index[self.edge_i[slots]]
+        self.edge_j[slots] = new_index[self.edge_j[slots]]
+
+
+        # Take them out of the candidate index
+        self.candidates.remove(leave)
+
+
+        return new_index
+
+
+    #%% METHOD partner_counts()
+    # The number of different partners everybody has had over the window up
+    # to time t, including their current partners
+    def partner_counts(self, t):
+
+
+        # Stop counting any partnerships which ended before the window
+        while (len(self.ended) > 0) and (self.ended[0][0] <= t - self.window):
+            _, i, j, id_i, id_j = self.ended.popleft()
+            if i != -1:
+                self._tally(i, id_j, -1)
+            if j != -1:
+                self._tally(j, id_i, -1)
+
+
+        return _read_only(self._n_partners)
+
+
+    #%% METHOD update_people()
+    # Bring the candidate index up to date with any changes to meta, noting
+    # down anybody who has changed bucket
+    def update_people(self, meta, people = None):
+        changed = self.candidates.update(meta, people)
+        self.reseek.update(self.person_id[changed].tolist())
+
+
+    #%% METHOD take_reseek()
+    # The indices of everybody whose seeking rate may have changed, who are
+    # then taken off the list
+    def take_reseek(self):
+        ids = np.array(sorted(self.reseek), dtype = int)
+        self.reseek.clear()
+        rows = np.minimum(np.searchsorted(self.person_id, ids), self.n - 1)
+        return rows[self.person_id[rows] == ids] if len(ids) > 0 else ids
+
+
+    #%% METHOD schedule_seek()
+    # Set the times at which some people next look for a partner, along with
+    # the rates they were sampled with
+    def schedule_seek(self, people, times, rates):
+        self.seek_time[people] = times
+        self.seek_rate[people] = rates
+        for i in np.asarray(people, dtype = int)[np.isfinite(times)]:
+            heapq.heappush(self.seek_queue, (self.seek_time[i], self.person_id[i]))
+
+
+    #%% METHOD next_seek()
+    # The next time at which somebody looks for a partner, discarding any
+    # stale entries at the top of the queue
+    def next_seek(self):
+        while (len(self.seek_queue) > 0) and (self._seeker(*self.seek_queue[0]) == -1):
+            heapq.heappop(self.seek_queue)
+        return self.seek_queue[0][0] if len(self.seek_queue) > 0 else float('inf')
+
+
+    #%% METHOD pop_seek()
+    # Pop the next person to look for a partner off the queue, returning
+    # their index and the time
+    def pop_seek(self):
+        self.next_seek()
+        seek_time, person_id = heapq.heappop(self.seek_queue)
+        return self._seeker(seek_time, person_id), seek_time
+
+
+    #%% METHOD to_dense()
+    # Dense view of the network as the old partner_matrix and partner_expire arrays
+    def to_dense(self):
+        partner_matrix = np.zeros((self.n, self.n))
+        partner_expire = float('inf') * np.ones((self.n, self.n))
+        ii, jj, expire, _ = self.edges()
+        partner_matrix[ii, jj] = 1
+        partner_matrix[jj, ii] = 1
+        partner_expire[ii, jj] = expire
+        partner_expire[jj, ii] = expire
+        return partner_matrix, partner_expire
+
+
+    #%% METHOD open_records()
+    # Log records for the partnerships which are still going, which end at inf
+    def open_records(self):
+        slots = np.flatnonzero(self.edge_active)
+        records = [self._record(slot) for slot in slots]
+        i, j, relationship, risk_group = np.array(records, dtype = int).reshape(-1, 4).T
+        return {'t_start': self.edge_start[slots],
+                't_end': float('inf') * np.ones(len(slots)),
+                'i': i,
+                'j': j,
+                'type': relationship,
+                'risk_group': risk_group}
+
+
+    #%% METHOD shift_time()
+    # Move all of the partnership expiry and seeking times forward by dt
+    def shift_time(self, dt):
+
+
+        # Shift the times
+        slots = np.flatnonzero(self.edge_active)
+        self.edge_expire[slots] = self.edge_expire[slots] + dt
+        self.edge_start[slots] = self.edge_start[slots] + dt
+        self.seek_time = self.seek_time + dt
+        self.ended = deque((t_end + dt, *e) for t_end, *e in self.ended)
+
+
+        # Rebuild the expiry queue
+        self.queue = []
+        for slot in slots:
+            self._schedule(slot)
+
+
+        # Rebuild the seeking queue
+        seekers = np.flatnonzero(np.isfinite(self.seek_time))
+        self.seek_queue = list(zip(self.seek_time[seekers], self.person_id[seekers]))
+        heapq.heapify(self.seek_queue)
+
+
+    #%% METHOD save()
+    # Write the edge table to file, along with the length of the burn in if given
+    def save(self, file_name, burn_in = -1):
+        ii, jj, expire, relationship = self.edges()
+        np.savez(file_name, n = self.n, i = ii, j = jj, expire = expire, type = relationship, burn_in = burn_in)
+
+
+    #%% HELPER _grow()
+    # Double the size of the edge table
+    def _grow(self):
+        capacity = len(self.edge_active)
+        self.edge_i = np.append(self.edge_i, np.zeros(capacity, dtype = int))
+        self.edge_j = np.append(self.edge_j, np.zeros(capacity, dtype = int))
+        self.edge_expire = np.append(self.edge_expire, float('inf') * np.ones(capacity))
+        self.edge_type = np.append(self.edge_type, np.zeros(capacity, dtype = int))
+        self.edge_active = np.append(self.edge_active, np.zeros(capacity, dtype = bool))
+        self.edge_version = np.append(self.edge_version, np.zeros(capacity, dtype = int))
+        self.edge_start = np.append(self.edge_start, np.nan * np.ones(capacity))
+        self.free = self.free + list(range(2*capacity - 1, capacity - 1, -1))
+
+
+    #%% HELPER _count()
+    # Add (sign = 1) or take away (sign = -1) the edge in a slot from the
+    # partnership counters of both people in it
+    def _count(self, slot, sign):
+        ends = [self.edge_i[slot], self.edge_j[slot]]
+        self._degree[ends] = self._degree[ends] + sign
+        if self.edge_type[slot] == SHORT_TERM:
+            self._n_short[ends] = self._n_short[ends] + sign
+        else:
+            self._long_term[ends] = self._long_term[ends] + sign
+
+
+    #%% HELPER _schedule()
+    # Put the expiry of the edge in a slot onto the queue, invalidating any
+    # earlier entry for the same slot
+    def _schedule(self, slot):
+        self.edge_version[slot] = self.edge_version[slot] + 1
+        if self.edge_expire[slot] < float('inf'):
+            heapq.heappush(self.queue, (self.edge_expire[slot], slot, self.edge_version[slot]))
+
+
+    #%% HELPER _seeker()
+    # The index of the person with an entry on the seeking queue, or -1 if
+    # they have left or the entry is stale
+    def _seeker(self, seek_time, person_id):
+        i = np.searchsorted(self.person_id, person_id)
+        if (i < self.n) and (self.person_id[i] == person_id) and (self.seek_time[i] == seek_time):
+            return i
+        return -1
+
+
+    #%% HELPER _tally()
+    # Add (sign = 1) or take away (sign = -1) a partnership with the partner
+    # whose person_id is given from the partners of person i in the window
+    def _tally(self, i, partner_id, sign):
+        count = self.recent[i].get(partner_id, 0) + sign
+        if count == 0:
+            del self.recent[i][partner_id]
+            self._n_partners[i] = self._n_partners[i] - 1
+        else:
+            self.recent[i][partner_id] = count
+            if count == 1 and sign == 1:
+                self._n_partners[i] = self._n_partners[i] + 1
+
+
+    #%% HELPER _record()
+    # The person_ids, type and risk-group of the partnership in a slot, as
+    # written to the log
+    def _record(self, slot):
+        i, j = self.edge_i[slot], self.edge_j[slot]
+        risk = cnd.bucket_risk(self.candidates.codes[[i, j]])
+        return self.person_id[i], self.person_id[j], self.edge_type[slot], risk.sum()
+
+
+#%% HELPER _read_only()
+def _read_only(a):
+    view = a.view()
+    view.flags.writeable = False
+    return view
+
+
+#%% FUN from_dense()
+#
+#
+# Build a partnership network from the old dense partner_matrix and
+# partner_expire arrays. The relationship type is taken from meta.partner.
+#
+#
+def from_dense(meta, partner_matrix, partner_expire):
+
+
+    # Setup an empty network
+    partner_graph = PartnershipGraph(meta)
+    n = len(meta)
+
+
+    # Pull out each partnership once
+    [ii, jj] = np.where(np.triu(partner_matrix[0:n, 0:n] > 0, 1))
+    long_term = meta.partner.to_numpy(dtype = int)[ii] == jj
+
+
+    # Add them all in
+    for i, j, lt in zip(ii, jj, long_term):
+        partner_graph.add(i, j, partner_expire[i, j], LONG_TERM if lt else SHORT_TERM)
+
+
+    return partner_graph
+
+
+#%% FUN load_graph()
+#
+#
+# Read in a partnership network written by PartnershipGraph.save()
+#
+#
+def load_graph(meta, file_name):
+
+
+    # Read in the edge table
+    data = np.load(file_name)
+
+
+    # Rebuild the network
+    partner_graph = PartnershipGraph(meta)
+    for i, j, expire, relationship in zip(data['i'], data['j'], data['expire'], data['type']):
+        partner_graph.add(i, j, expire, relationship)
+
+
+    return partner_graph
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only log of the partnership history
+
+Whenever a partnership ends, a record of
+
+    t_start    - the time the partnership formed
+    t_end      - the time the partnership ended
+    i, j       - the person_id of both partners, see PartnershipGraph
+    type       - the relationship type {0 (long term), 1 (short term)}
+    risk_group - the relationship risk-group (number of high-risk partners)
+
+is appended to the log. Partnerships are active over [t_start, t_end), so
+with the daily partnership engine a partnership is seen from the day that it
+forms up to the day before it is removed.
+
+Records are buffered in lists and flushed into chunks of NumPy arrays as the
+buffer fills up. If the log is given a file name each chunk is written out
+to file_name_<k>.npz rather than kept in memory.
+
+The log can be indexed with LogIndex, which answers questions like who was
+partnered with whom at a particular time, or who somebody's partners were
+over the last year, without replaying the simulation. The partnerships that
+are still going are taken from the PartnershipGraph when the index is built.
+
+INDEX
+    PartnershipLog: the log of partnerships
+    LogIndex: interval index over a log
+    load_log: read a saved log back in
+"""
+
+
+#%% SETUP Load Libraries
+import numpy as np
+
+
+# Columns of the log and how they are stored
+COLUMNS = {'t_start': float,
+           't_end': float,
+           'i': np.int32,
+           'j': np.int32,
+           'type': np.int8,
+           'risk_group': np.int8}
+
+
+#%% CLASS PartnershipLog
+#
+#
+# Columnar store of partnerships which have ended.
+#
+# Attributes
+#   chunk_size = the number of records to buffer before flushing
+#   file_name = where to write the chunks to, or None to keep them in memory
+#   buffer = dictionary of lists of records which haven't been flushed
+#   chunks = list of flushed chunks held in memory
+#   n_chunks = the number of chunks flushed so far
+#
+#
+class PartnershipLog:
+
+
+    def __init__(self, chunk_size = 2**16, file_name = None):
+        self.chunk_size = chunk_size
+        self.file_name = file_name
+        self.buffer = {c: [] for c in COLUMNS}
+        self.chunks = []
+        self.n_chunks = 0
+
+
+    #%% METHOD append()
+    # Record a partnership
+    def append(self, t_start, t_end, i, j, relationship, risk_group):
+        for c, x in zip(COLUMNS, [t_start, t_end, i, j, relationship, risk_group]):
+            self.buffer[c].append(x)
+        if len(self.buffer['t_start']) >= self.chunk_size:
+            self.flush()
+
+
+    #%% METHOD flush()
+    # Move everything in the buffer into a chunk
+    def flush(self):
+
+
+        # Check there is something to flush
+        if len(self.buffer['t_start']) == 0:
+            return
+
+
+        # Convert the buffer into arrays
+        chunk = {c: np.array(self.buffer[c], dtype = dtype) for c, dtype in COLUMNS.items()}
+        self.buffer = {c: [] for c in COLUMNS}
+
+
+        # Store it
+        if self.file_name is None:
+            self.chunks.append(chunk)
+        else:
+            np.savez(self.file_name + '_' + str(self.n_chunks) + '.npz', **chunk)
+        self.n_chunks = self.n_chunks + 1
+
+
+    #%% METHOD records()
+    # All of the records in the log as a dictionary of arrays
+    def records(self):
+
+
+        # Flush anything outstanding and gather up the chunks
+        self.flush()
+        if self.file_name is None:
+            chunks = self.chunks
+        else:
+            chunks = [np.load(self.file_name + '_' + str(k) + '.npz') for k in range(0, self.n_chunks)]
+
+
+        # Stick them together
+        return {c: np.concatenate([chunk[c] for chunk in chunks] + [np.zeros(0, dtype = dtype)])
+                for c, dtype in COLUMNS.items()}
+
+
+    #%% METHOD save()
+    # Write the whole log to a single file
+    def save(self, file_name):
+        np.savez(file_name, **self.records())
+
+
+#%% CLASS LogIndex
+#
+#
+# Interval index over the records in a PartnershipLog, along with any
+# partnerships which are still going in a PartnershipGraph.
+#
+# The partnerships are sorted by their start time and split into classes by
+# how long they lasted, class c holding those which lasted [2^c, 2^(c+1))
+# days. Anything in class c which overlaps [t0, t1] started in
+# (t0 - 2^(c+1), t1], so a binary search on the start times of each class
+# finds the partnerships going over an interval while only looking at a few
+# which had already ended. Partnerships without a finite duration, the ones
+# still going or going since before the log started, are checked directly.
+#
+# Each partnership is also listed under both partners, sorted by person_id
+# and then start time, so the partnerships of a particular person are found
+# by a binary search too.
+#
+#
+# INPUT
+#   log = the PartnershipLog
+#   partner_graph = the PartnershipGraph, or None for only the log
+#
+#
+class LogIndex:
+
+
+    def __init__(self, log, partner_graph = None):
+
+
+        # Gather up all the partnerships
+        records = log.records()
+        if partner_graph is not None:
+            ongoing = partner_graph.open_records()
+            records = {c: np.append(records[c], ongoing[c]).astype(dtype) for c, dtype in COLUMNS.items()}
+
+
+        # Partnerships which formed before anything was logged are taken to
+        # have been going forever
+        records['t_start'] = np.where(np.isnan(records['t_start']), -float('inf'), records['t_start'])
+
+
+        # Sort them by start time
+        order = np.argsort(records['t_start'], kind = 'stable')
+        for c in COLUMNS:
+            setattr(self, c, records[c][order])
+
+
+        # Split them up by duration, keeping each class in order of start time
+        duration = self.t_end - self.t_start
+        bounded = np.isfinite(duration)
+        self.unbounded = np.flatnonzero(~bounded)
+        duration_class = np.full(len(duration), -1)
+        duration_class[bounded] = np.floor(np.log2(np.maximum(duration[bounded], 1)))
+        self.classes = []
+        for c in np.unique(duration_class[bounded]):
+            k = np.flatnonzero(duration_class == c)
+            self.classes.append((2.0**(c + 1), k, self.t_start[k]))
+
+
+        # List them under each of the partners
+        person = np.append(self.i, self.j)
+        t_start = np.append(self.t_start, self.t_start)
+        order = np.lexsort((t_start, person))
+        self.person = person[order]
+        self.person_record = order % len(self.i)
+
+
+    #%% METHOD active()
+    # Indices of the partnerships which overlap the interval [t0, t1], or
+    # which are going at time t0 if t1 is not given
+    def active(self, t0, t1 = None):
+        t1 = t0 if t1 is None else t1
+
+
+        # Check the partnerships without a finite duration directly
+        k = self.unbounded
+        found = [k[(self.t_start[k] <= t1) & (self.t_end[k] > t0)]]
+
+
+        # Only look at the ones in each duration class which started recently
+        # enough to still be going at t0
+        for longest, k, t_start in self.classes:
+            lower, upper = np.searchsorted(t_start, [t0 - longest, t1], side = 'right')
+            k = k[lower:upper]
+            found.append(k[self.t_end[k] > t0])
+
+
+        return np.sort(np.concatenate(found))
+
+
+    #%% METHOD pairs()
+    # All of the pairs (i, j) who were partnered at time t
+    def pairs(self, t):
+        k = self.active(t)
+        return np.column_stack((self.i[k], self.j[k]))
+
+
+    #%% METHOD partners()
+    # The partners of person i over the interval [t0, t1]
+    def partners(self, i, t0, t1 = None):
+        t1 = t0 if t1 is None else t1
+        lower, upper = np.searchsorted(self.person, [i, i + 1])
+        k = self.person_record[lower:upper]
+        k = k[(self.t_start[k] <= t1) & (self.t_end[k] > t0)]
+        return np.unique(np.where(self.i[k] == i, self.j[k], self.i[k]))
+
+
+    #%% METHOD n_partners()
+    # The number of different partners each person had over the interval
+    # [t0, t1], indexed by person_id
+    def n_partners(self, t0, t1, n_people = None):
+
+
+        # Pull out the distinct pairs
+        k = self.active(t0, t1)
+        pairs = np.unique(np.sort(np.column_stack((self.i[k], self.j[k])), axis = 1), axis = 0)
+
+
+        # Count them up for both partners
+        n_people = (int(max(self.i.max(initial = -1), self.j.max(initial = -1))) + 1 if n_people is None else n_people)
+        return np.bincount(pairs.flatten(), minlength = n_people)
+
+
+#%% FUN load_log()
+#
+#
+# Read in a log written by PartnershipLog.save(). Further records can be
+# appended to it.
+#
+#
+def load_log(file_name, chunk_size = 2**16):
+
+
+    # Read in the records
+    data = np.load(file_name)
+    log = PartnershipLog(chunk_size)
+    if len(data['t_start']) > 0:
+        log.chunks.append({c: data[c].astype(dtype) for c, dtype in COLUMNS.items()})
+        log.n_chunks = 1
+
+
+    return log
@@ -52,97 +52,65 @@ def initilise_partner_number_tracking(n_days):
 
 
 #%% Summary statistics on the cumulative number of partners per year
-def update_cumulative_partners(meta, partner_matrix, partner_expire, t, n_people, xt, g0t, g1t, g2t, g3t):
+def update_cumulative_partners(meta, partner_graph, t, n_people, xt, g0t, g1t, g2t, g3t):
     # Track the number of partners over time
-    xt[t, 0] = sum(np.sum(partner_matrix, axis = 1) == 0)
-    xt[t, 1] = sum(meta["partner"] != -1)
-    xt[t, 2] = sum(np.sum(partner_matrix, axis = 1) > 0) - xt[t, 1]
-    xt[t, 3] = np.median(partner_expire[partner_expire < float("inf")]) - t
-
-
-    # Update partnership groups for age group 0
-    g0t[t, 0] = sum((meta["age_group"] == 0) & (meta["counter"][range(0,n_people)] == 0))
-    g0t[t, 1] = sum((meta["age_group"] == 0) & (meta["counter"][range(0,n_people)] == 1))
-    g0t[t, 2] = sum((meta["age_group"] == 0) & (meta["counter"][range(0,n_people)] > 1) & \
-                      (meta["counter"][range(0,n_people)] < 5))
-    g0t[t, 3] = sum((meta["age_group"] == 0) & (meta["counter"][range(0,n_people)] > 4))
-
-    # Update partnership groups for age group 0
-    g1t[t, 0] = sum((meta["age_group"] == 1) & (meta["counter"][range(0,n_people)] == 0))
-    g1t[t, 1] = sum((meta["age_group"] == 1) & (meta["counter"][range(0,n_people)] == 1))
-    g1t[t, 2] = sum((meta["age_group"] == 1) & (meta["counter"][range(0,n_people)] > 1) & \
-                      (meta["counter"][range(0,n_people)] < 5))
-    g1t[t, 3] = sum((meta["age_group"] == 1) & (meta["counter"][range(0,n_people)] > 4))
-
-    # Update partnership groups for age group 0
-    g2t[t, 0] = sum((meta["age_group"] == 2) & (meta["counter"][range(0,n_people)] == 0))
-    g2t[t, 1] = sum((meta["age_group"] == 2) & (meta["counter"][range(0,n_people)] == 1))
-    g2t[t, 2] = sum((meta["age_group"] == 2) & (meta["counter"][range(0,n_people)] > 1) & \
-                      (meta["counter"][range(0,n_people)] < 5))
-    g2t[t, 3] = sum((meta["age_group"] == 2) & (meta["counter"][range(0,n_people)] > 4))
-
-
-    # Update partnership groups for age group 0
-    g3t[t, 0] = sum((meta["age_group"] == 3) & (meta["counter"][range(0,n_people)] == 0))
-    g3t[t, 1] = sum((meta["age_group"] == 3) & (meta["counter"][range(0,n_people)] == 1))
-    g3t[t, 2] = sum((meta["age_group"] == 3) & (meta["counter"][range(0,n_people)] > 1) & \
-                      (meta["counter"][range(0,n_people)] < 5))
-    g3t[t, 3] = sum((meta["age_group"] == 3) & (meta["counter"][range(0,n_people)] > 4))
+    _, _, expire, _ = partner_graph.edges()
+    xt[t, 0] = sum(partner_graph.degree == 0)
+    xt[t, 1] = sum(partner_graph.long_term > 0)
+    xt[t, 2] = sum(partner_graph.degree > 0) - xt[t, 1]
+    xt[t, 3] = np.median(expire[expire < float("inf")]) - t
+
+
+    # Update partnership groups for each age group
+    counts = partner_count_distribution(meta, partner_graph, t).sum(axis = 1)
+    for a, gt in enumerate([g0t, g1t, g2t, g3t]):
+        gt[t, :] = counts[a, :]
 
     return xt, g0t, g1t, g2t, g3t
 
 
+#%% Distribution of the number of partners over the last year
+def partner_count_distribution(meta, partner_graph, t):
+    # Bin everybody's number of partners over the last year into
+    #   0 = no partners
+    #   1 = one partner
+    #   2 = 2-4 partners
+    #   3 = 5 or more partners
+    n_partners = partner_graph.partner_counts(t)
+    bins = np.digitize(n_partners, [1, 2, 5])
+
+
+    # Count the number of people in each bin by age group and risk group
+    # Indexed by [age group, risk group, bin]
+    age_group = meta["age_group"].to_numpy(dtype = int)
+    risk = meta["risk"].to_numpy(dtype = int)
+    use = (age_group >= 0) & (age_group <= 3)
+    return np.bincount(((2 * age_group + risk) * 4 + bins)[use], minlength = 32).reshape(4, 2, 4)
+
+
 #%% Summary statistics on the number of people in each partnership type
-def update_partnership_types(meta, partner_matrix, t, p0ht, p0lt, p1ht, p1lt, p2ht, p2lt, p3ht, p3lt):
+def update_partnership_types(meta, partner_graph, t, p0ht, p0lt, p1ht, p1lt, p2ht, p2lt, p3ht, p3lt):
+    # Work out which partnership type everybody is in
+    #   0 = single
+    #   1 = long-term only
+    #   2 = long-term with concurrent short-term
+    #   3 = one short-term
+    #   4 = multiple short-term
+    p = partner_graph.degree
+    lt = partner_graph.long_term > 0
+    ptype = np.select([p == 0, lt & (p == 1), lt, p == 1], [0, 1, 2, 3], 4)
+
+
+    # Count the number of people in each partnership type by age and risk group
+    age_group = meta["age_group"].to_numpy(dtype = int)
+    risk = meta["risk"].to_numpy(dtype = int)
+    use = (age_group >= 0) & (age_group <= 3)
+    counts = np.bincount(((2 * age_group + (1 - risk)) * 5 + ptype)[use], minlength = 40).reshape(8, 5)
+
+
     # Update the number of people in each partnership type
-    p = np.sum(partner_matrix, axis = 1)
-    p0ht[t, 0] = sum((meta["age_group"] == 0) & (meta["risk"] == 1) & (p == 0))
-    p0ht[t, 1] = sum((meta["age_group"] == 0) & (meta["risk"] == 1) & (meta["partner"] != -1) & (p == 1))
-    p0ht[t, 2] = sum((meta["age_group"] == 0) & (meta["risk"] == 1) & (meta["partner"] != -1) & (p > 1))
-    p0ht[t, 3] = sum((meta["age_group"] == 0) & (meta["risk"] == 1) & (meta["partner"] == -1) & (p == 1))
-    p0ht[t, 4] = sum((meta["age_group"] == 0) & (meta["risk"] == 1) & (meta["partner"] == -1) & (p > 1))
-
-    p0lt[t, 0] = sum((meta["age_group"] == 0) & (meta["risk"] == 0) & (p == 0))
-    p0lt[t, 1] = sum((meta["age_group"] == 0) & (meta["risk"] == 0) & (meta["partner"] != -1) & (p == 1))
-    p0lt[t, 2] = sum((meta["age_group"] == 0) & (meta["risk"] == 0) & (meta["partner"] != -1) & (p > 1))
-    p0lt[t, 3] = sum((meta["age_group"] == 0) & (meta["risk"] == 0) & (meta["partner"] == -1) & (p == 1))
-    p0lt[t, 4] = sum((meta["age_group"] == 0) & (meta["risk"] == 0) & (meta["partner"] == -1) & (p > 1))
-
-    p1ht[t, 0] = sum((meta["age_group"] == 1) & (meta["risk"] == 1) & (p == 0))
-    p1ht[t, 1] = sum((meta["age_group"] == 1) & (meta["risk"] == 1) & (meta["partner"] != -1) & (p == 1))
-    p1ht[t, 2] = sum((meta["age_group"] == 1) & (meta["risk"] == 1) & (meta["partner"] != -1) & (p > 1))
-    p1ht[t, 3] = sum((meta["age_group"] == 1) & (meta["risk"] == 1) & (meta["partner"] == -1) & (p == 1))
-    p1ht[t, 4] = sum((meta["age_group"] == 1) & (meta["risk"] == 1) & (meta["partner"] == -1) & (p > 1))
-
-    p1lt[t, 0] = sum((meta["age_group"] == 1) & (meta["risk"] == 0) & (p == 0))
-    p1lt[t, 1] = sum((meta["age_group"] == 1) & (meta["risk"] == 0) & (meta["partner"] != -1) & (p == 1))
-    p1lt[t, 2] = sum((meta["age_group"] == 1) & (meta["risk"] == 0) & (meta["partner"] != -1) & (p > 1))
-    p1lt[t, 3] = sum((meta["age_group"] == 1) & (meta["risk"] == 0) & (meta["partner"] == -1) & (p == 1))
-    p1lt[t, 4] = sum((meta["age_group"] == 1) & (meta["risk"] == 0) & (meta["partner"] == -1) & (p > 1))
-
-    p2ht[t, 0] = sum((meta["age_group"] == 2) & (meta["risk"] == 1) & (p == 0))
-    p2ht[t, 1] = sum((meta["age_group"] == 2) & (meta["risk"] == 1) & (meta["partner"] != -1) & (p == 1))
-    p2ht[t, 2] = sum((meta["age_group"] == 2) & (meta["risk"] == 1) & (meta["partner"] != -1) & (p > 1))
-    p2ht[t, 3] = sum((meta["age_group"] == 2) & (meta["risk"] == 1) & (meta["partner"] == -1) & (p == 1))
-    p2ht[t, 4] = sum((meta["age_group"] == 2) & (meta["risk"] == 1) & (meta["partner"] == -1) & (p > 1))
-
-    p2lt[t, 0] = sum((meta["age_group"] == 2) & (meta["risk"] == 0) & (p == 0))
-    p2lt[t, 1] = sum((meta["age_group"] == 2) & (meta["risk"] == 0) & (meta["partner"] != -1) & (p == 1))
-    p2lt[t, 2] = sum((meta["age_group"] == 2) & (meta["risk"] == 0) & (meta["partner"] != -1) & (p > 1))
-    p2lt[t, 3] = sum((meta["age_group"] == 2) & (meta["risk"] == 0) & (meta["partner"] == -1) & (p == 1))
-    p2lt[t, 4] = sum((meta["age_group"] == 2) & (meta["risk"] == 0) & (meta["partner"] == -1) & (p > 1))
-
-    p3ht[t, 0] = sum((meta["age_group"] == 3) & (meta["risk"] == 1) & (p == 0))
-    p3ht[t, 1] = sum((meta["age_group"] == 3) & (meta["risk"] == 1) & (meta["partner"] != -1) & (p == 1))
-    p3ht[t, 2] = sum((meta["age_group"] == 3) & (meta["risk"] == 1) & (meta["partner"] != -1) & (p > 1))
-    p3ht[t, 3] = sum((meta["age_group"] == 3) & (meta["risk"] == 1) & (meta["partner"] == -1) & (p == 1))
-    p3ht[t, 4] = sum((meta["age_group"] == 3) & (meta["risk"] == 1) & (meta["partner"] == -1) & (p > 1))
-
-    p3lt[t, 0] = sum((meta["age_group"] == 3) & (meta["risk"] == 0) & (p == 0))
-    p3lt[t, 1] = sum((meta["age_group"] == 3) & (meta["risk"] == 0) & (meta["partner"] != -1) & (p == 1))
-    p3lt[t, 2] = sum((meta["age_group"] == 3) & (meta["risk"] == 0) & (meta["partner"] != -1) & (p > 1))
-    p3lt[t, 3] = sum((meta["age_group"] == 3) & (meta["risk"] == 0) & (meta["partner"] == -1) & (p == 1))
-    p3lt[t, 4] = sum((meta["age_group"] == 3) & (meta["risk"] == 0) & (meta["partner"] == -1) & (p > 1))
+    for k, pt in enumerate([p0ht, p0lt, p1ht, p1lt, p2ht, p2lt, p3ht, p3lt]):
+        pt[t, :] = counts[k, :]
     return p0ht, p0lt, p1ht, p1lt, p2ht, p2lt, p3ht, p3lt
 
 
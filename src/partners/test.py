@@ -12,6 +12,8 @@ import matplotlib.pyplot as plt
 from tqdm import tqdm
 
 import src.partners.partners as ng
+import src.partners.partnership_graph as pg
+import src.partners.partnership_log as plog
 import src.partners.summary_stats as pstat
 import src.demographic.goanna as pop
 
@@ -19,7 +21,8 @@ import src.demographic.goanna as pop
 #%% Set up meta population
 
 n = 2000
-meta = pop.goanna(n)
+meta = pop.goanna(n, 0)
+prt_parameters = ng.setup_data()
 
 
 #%% Test partnership biasing function
@@ -62,8 +65,8 @@ if False:
 #%% Test Partnership aquisition rates
 
 
-# Default partnership durations to Inf
-partner_expire = float("inf") * np.ones((n, n))
+# Setup the partnership network, keeping a log of all the partnerships
+partner_graph = pg.PartnershipGraph(meta, plog.PartnershipLog())
 
 
 # Set simulation length
@@ -75,51 +78,32 @@ n_days = t_reset + 365
 
 
 # Preallocate for summary statistics
-# Number of partners last year
-xt = np.zeros((n_days, 4))
-g0t = np.zeros((n_days, 4))
-g1t = np.zeros((n_days, 4))
-g2t = np.zeros((n_days, 4))
-
-
-# Duration of partnerships
-d0t = []
-d1t = []
-d2t = []
-
-
-# In each partnership
-p0ht = np.zeros((n_days, 5))
-p0lt = np.zeros((n_days, 5))
-p1ht = np.zeros((n_days, 5))
-p1lt = np.zeros((n_days, 5))
-p2ht = np.zeros((n_days, 5))
-p2lt = np.zeros((n_days, 5))
+p0ht, p0lt, p1ht, p1lt, p2ht, p2lt, p3ht, p3lt, xt, g0t, g1t, g2t, g3t = pstat.initilise_partner_number_tracking(n_days)
 
 
 # Iterate over all time points
-n_people = min(n, 2000)
 for t in tqdm(range(0, n_days)):
 
 
-    # Create a new relationship
-    meta, partner_matrix, partner_expire, d0ti, d1ti, d2ti = ng.new_partnership(meta, partner_matrix, partner_expire, i, t)
+    # Update the partnership network
+    meta, partner_graph = ng.update_partnerships(prt_parameters, meta, partner_graph, t)
 
-    d0t.append(d0ti)
-    d1t.append(d1ti)
-    d2t.append(d2ti)
 
-    # Identify and remove expired relationships
-    meta, partner_matrix, partner_expire = ng.old_partnerships(meta, partner_matrix, partner_expire, t)
+    # Update summary stats on the number of people in each partnership type
+    p0ht, p0lt, p1ht, p1lt, p2ht, p2lt, p3ht, p3lt = pstat.update_partnership_types(meta, partner_graph, t, p0ht, p0lt, p1ht, p1lt, p2ht, p2lt, p3ht, p3lt)
 
 
-    # Update summary stats on the number of annual partners
-    xt, g0t, g1t, g2t = pstat.update_cumulative_partners(meta, partner_matrix, partner_expire, t, n_people, xt, g0t, g1t, g2t)
-    p0ht, p0lt, p1ht, p1lt, p2ht, p2lt = pstat.update_partnership_types(meta, partner_matrix, t, p0ht, p0lt, p1ht, p1lt, p2ht, p2lt)
-    if t == t_reset: meta.counter = np.sum(partner_matrix, axis=1)
+# Count the number of partners everybody had over the year up to each day
+# from the partnership log, nobody comes or goes so person_id is the index
+history = plog.LogIndex(partner_graph.log, partner_graph)
+for t in range(0, n_days):
+    n_partners = history.n_partners(max(0, t - 364), t, n)
+    for a, gt in enumerate([g0t, g1t, g2t, g3t]):
+        gt[t, :] = np.bincount(np.digitize(n_partners[meta.age_group == a], [1, 2, 5]), minlength = 4)
 
 
 # Plot of the partnership matrix
+partner_matrix, _ = partner_graph.to_dense()
 plt.imshow(partner_matrix)
 
 
@@ -129,11 +113,11 @@ plt.imshow(partner_matrix)
 
 #%%
 # Plot long vs short term partnerships over time
+ptype = p0ht + p0lt + p1ht + p1lt + p2ht + p2lt + p3ht + p3lt
 fig, ax = plt.subplots(4)
-ax[0].plot(range(0, n_days), xt[:,0], label = "single")
-ax[0].plot(range(0, n_days), xt[:,1], label = "long term")
-ax[0].plot(range(0, n_days), xt[:,2], label = "short term")
-ax[0].plot(range(0, n_days), xt[:,3], label = "time left")
+ax[0].plot(range(0, n_days), ptype[:,0], label = "single")
+ax[0].plot(range(0, n_days), ptype[:,1] + ptype[:,2], label = "long term")
+ax[0].plot(range(0, n_days), ptype[:,3] + ptype[:,4], label = "short term")
 ax[0].set_ylim([0, n])
 ax[0].legend(loc = "upper right")
 
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Script for checking the partnership burn in as it is run in
+setup_population_data.py: burn in the network, line its times up with the
+start of the simulation with shift_time() and save it.
+"""
+
+
+#%% SETUP Modules
+
+
+# Standard modules
+import os
+import tempfile
+import numpy as np
+
+
+# My modules
+import src.demographic.generate_population as pop
+import src.partners.partners as prt
+import src.partners.partnership_graph as pg
+import src.partners.burn_in as burn
+
+
+scenario = 3
+n_days = 2000
+
+
+if __name__ == '__main__':
+
+
+    #%% SETUP Population
+
+
+    np.random.seed(0)
+    pop_parameters = pop.setup_data(scenario, 'serial')
+    prt_parameters = prt.setup_data()
+    meta = pop.generate_population(pop_parameters)
+    partner_graph = pg.PartnershipGraph(meta)
+
+
+    #%% RUN Burn in
+
+
+    # Run the burn in
+    meta, partner_graph, burn_in, series = burn.burn_in_partnerships(prt_parameters, meta, partner_graph, n_days)
+    print('Burnt in after ' + str(burn_in) + ' days')
+
+
+    # Shift the times up to the start of the simulation
+    ii, jj, expire, relationship = partner_graph.edges()
+    n_ended = len(partner_graph.ended)
+    partner_graph.shift_time(n_days - burn_in)
+
+
+    # The same partnerships, just later
+    ii_shift, jj_shift, expire_shift, relationship_shift = partner_graph.edges()
+    assert (ii_shift == ii).all() & (jj_shift == jj).all() & (relationship_shift == relationship).all()
+    assert np.allclose(expire_shift, expire + n_days - burn_in)
+    assert len(partner_graph.ended) == n_ended
+
+
+    #%% RUN Save and read back in
+
+
+    with tempfile.TemporaryDirectory() as save_dir:
+        file_name = os.path.join(save_dir, 'population_graph.npz')
+        partner_graph.save(file_name, burn_in)
+        loaded = pg.load_graph(meta, file_name)
+        ii_load, jj_load, expire_load, relationship_load = loaded.edges()
+        assert len(ii_load) == len(ii)
+        assert np.allclose(np.sort(expire_load), np.sort(expire_shift))
+        assert int(np.load(file_name)['burn_in']) == burn_in
+
+
+    print('Burn in, shift_time() and save() all ran')
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Script for checking that the PartnershipGraph keeps its books straight while
+people come and go: run the partnerships with mobility for a while, then
+check the partnership counters against the dense view of the network and the
+candidate index against one built from scratch.
+"""
+
+
+#%% SETUP Modules
+
+
+# Standard modules
+import numpy as np
+
+
+# My modules
+import src.demographic.generate_population as pop
+import src.demographic.population_dynamics as demo
+import src.partners.partners as prt
+import src.partners.partnership_graph as pg
+import src.partners.candidates as cnd
+import src.calibration.setup as setup
+
+
+scenario = 3
+n_days = 365
+
+
+if __name__ == '__main__':
+
+
+    #%% SETUP Population
+
+
+    np.random.seed(9)
+    pop_parameters = pop.setup_data(scenario, 'serial')
+    prt_parameters = prt.setup_data()
+    inf_parameters = setup.parse_parameters('default', scenario)
+    meta = pop.generate_population(pop_parameters)
+    partner_graph = pg.PartnershipGraph(meta)
+    pop_parameters = demo.initilise_demographic_dynamics(pop_parameters, inf_parameters, meta)
+
+
+    #%% RUN Partnerships with mobility
+
+
+    for t in range(0, n_days):
+        meta, partner_graph = demo.update_population(pop_parameters, prt_parameters, inf_parameters, meta, partner_graph, t)
+        meta, partner_graph = prt.update_partnerships(prt_parameters, meta, partner_graph, t)
+    print('Ran ' + str(n_days) + ' days, ' + str(len(meta)) + ' people at the end')
+
+
+    #%% RUN Check the counters against to_dense()
+
+
+    # Everybody's partners and long-term partner
+    partner_matrix, partner_expire = partner_graph.to_dense()
+    n_partners = partner_matrix.sum(axis = 1)
+    partner = meta.partner.to_numpy(dtype = int)
+    has_long_term = partner > -1
+    assert partner_graph.n == len(meta)
+
+
+    # The counters agree with the dense view
+    assert (partner_graph.degree == n_partners).all()
+    assert (partner_graph.long_term == has_long_term).all()
+    assert (partner_graph.n_short == n_partners - has_long_term).all()
+
+
+    # Long-term partners are partnered both ways round
+    i = np.flatnonzero(has_long_term)
+    assert (partner[partner[i]] == i).all()
+    assert (partner_matrix[i, partner[i]] == 1).all()
+    assert (partner_matrix == partner_matrix.T).all()
+    assert np.isfinite(partner_expire[partner_matrix == 1]).all()
+
+
+    #%% RUN Check the candidate index against a rebuilt one
+
+
+    # Same bucket codes
+    candidates = partner_graph.candidates
+    fresh = cnd.CandidateIndex(meta)
+    assert (candidates.codes == fresh.codes).all()
+
+
+    # Same people in each bucket, and everybody is where the index says
+    for b in range(0, cnd.N_BUCKETS):
+        assert sorted(candidates.buckets[b]) == fresh.buckets[b]
+        assert (candidates.position[candidates.buckets[b]] == np.arange(len(candidates.buckets[b]))).all()
+
+
+    print('Partnership counters and candidate index all agree')
@@ -6,12 +6,75 @@ Created on Mon Jan 18 10:38:04 2021
 
 Treatment occurs roughly 7 days after symptoms
 Both partners get treated
+
+Unlike ng.py, everybody infected at a site counts as symptomatic there.
+Treatment times are worked out once, when somebody is infected, by
+treatment_time() below and are tracked by the InfectionEvents queue, so
+ng.new_infections() needs to be given treatment_time_fun = treatment_time
+whenever this treatment model is used.
 """
 
 
 #%% IMPORT REQUIRED MODULES
 import numpy as np
-import scipy.stats as sp
+
+
+# My modules
+import src.infections.ng as ng
+import src.infections.states as st
+import src.infections.streams as rs
+import src.infections.transitions as tr
+
+
+#%% VAR TREATMENT
+# Treatment clears all infections and confers immunity for a while, see
+# src/infections/transitions.py
+TREATMENT = [{'name': 'treatment',
+              'timer': None,
+              'set': {'state': st.R,
+                      'recovery_time': lambda x, rows, t, parameters: t + rs.stream('durations').gamma(parameters['infection'].immunity_mean[0]/parameters['infection'].immunity_var[0], parameters['infection'].immunity_var[0], len(rows)),
+                      'sites': 0,
+                      'site0_t0': float("inf"),
+                      'site1_t0': float("inf"),
+                      'site2_t0': float("inf"),
+                      'site0_t1': float("inf"),
+                      'site1_t1': float("inf"),
+                      'site2_t1': float("inf"),
+                      'treatment_time': float("inf")}}]
+
+
+#%% FUN treatment_time()
+#
+#
+# Time at which people will seek treatment given their current infections,
+# which is the delay from ng.treatment_delay() after the first of their
+# infected sites leaves its latent period. Anybody not infected gets inf.
+#
+#
+# INPUT
+#   parameters, meta
+#   people = rows of meta to work out treatment times for
+#
+# OUTPUT
+#   array of treatment times
+#
+#
+def treatment_time(parameters, meta, people):
+
+
+    # Pull out the sites which are infected
+    people = np.asarray(people, dtype = int)
+    t0 = meta[["site0_t0", "site1_t0", "site2_t0"]].to_numpy(dtype = float)[people]
+    t1 = meta[["site0_t1", "site1_t1", "site2_t1"]].to_numpy(dtype = float)[people]
+    infected = np.isfinite(t0) & np.isfinite(t1)
+
+
+    # Add the delay to the first of them
+    start = np.min(np.where(infected, t0, float("inf")), axis = 1)
+    time = start + ng.treatment_delay(parameters, meta.treatment_threshold.to_numpy(dtype = float)[people])
+
+
+    return time
 
 
 #%% FUN seek_treatment()
@@ -20,6 +83,7 @@ import scipy.stats as sp
 #
 # Time until treatment
 #    Gamma distributed with specified mean and variance.
+#    Worked out when somebody is infected, see treatment_time().
 #    Upon treatment, the indivdual's parter will also be treated.
 #    Immunity is conferred for a specied period.
 #
@@ -35,6 +99,9 @@ import scipy.stats as sp
 #    immune_mean
 #    immune_var
 #
+#    events = the InfectionEvents queue to take treatment times from and put
+#             the end of immunity into, or None
+#
 #
 # OUTPUT
 #    meta
@@ -45,36 +112,11 @@ import scipy.stats as sp
 #######################
 ##  GETTING TREATED  ##
 #######################
-def seek_treatment(parameters, meta, partner_matrix, t):
-
-
-    # Work out who is symptomatic
-    symp0 = np.isfinite(meta["site0_t0"]) & np.isfinite(meta["site0_t1"])
-    symp1 = np.isfinite(meta["site1_t0"]) & np.isfinite(meta["site1_t1"])
-    symp2 = np.isfinite(meta["site2_t0"]) & np.isfinite(meta["site2_t1"])
-
-
-    # Work out their duration of infectiousness
-    dur0 = t - meta.loc[symp0, "site0_t0"]
-    dur1 = t - meta.loc[symp1, "site1_t0"]
-    dur2 = t - meta.loc[symp2, "site2_t0"]
-
-
-    # Work out whose infectious period has exceeded their tolerance
-    treat0 = sp.gamma.cdf(dur0, parameters['infection'].treatment_mean[0]/parameters['infection'].treatment_var[0], parameters['infection'].treatment_var[0]) >= meta.loc[symp0, "treatment_threshold"]
-    treat1 = sp.gamma.cdf(dur1, parameters['infection'].treatment_mean[0]/parameters['infection'].treatment_var[0], parameters['infection'].treatment_var[0]) >= meta.loc[symp1, "treatment_threshold"]
-    treat2 = sp.gamma.cdf(dur2, parameters['infection'].treatment_mean[0]/parameters['infection'].treatment_var[0], parameters['infection'].treatment_var[0]) >= meta.loc[symp2, "treatment_threshold"]
-
+def seek_treatment(parameters, meta, partner_graph, t, events = None):
 
-    # Pull out their identifiers
-    treat0 = treat0.index[treat0]
-    treat1 = treat1.index[treat1]
-    treat2 = treat2.index[treat2]
 
-
-    # Combine these into one big list
-    treat = np.append(treat0, treat1)
-    treat = np.append(treat, treat2)
+    # Work out who seeks treatment today
+    meta, treat = ng.treatment_due(parameters, meta, t, events, treatment_time)
 
 
     # Look up their current partners
@@ -82,28 +124,9 @@ def seek_treatment(parameters, meta, partner_matrix, t):
     # treat = np.append(treat, part[1,:]).tolist()
 
 
-    # Make amendments to meta
-    meta.loc[treat, "state"] = "R"
-    meta.loc[treat, "recovery_time"] = t + np.random.gamma(parameters['infection'].immunity_mean[0]/parameters['infection'].immunity_var[0], parameters['infection'].immunity_var[0], len(treat))
-    meta.loc[treat, "site0"] = 0
-    meta.loc[treat, "site1"] = 0
-    meta.loc[treat, "site2"] = 0
-    meta.loc[treat, "site0_t0"] = float("inf")
-    meta.loc[treat, "site1_t0"] = float("inf")
-    meta.loc[treat, "site2_t0"] = float("inf")
-    meta.loc[treat, "site0_t1"] = float("inf")
-    meta.loc[treat, "site1_t1"] = float("inf")
-    meta.loc[treat, "site2_t1"] = float("inf")
+    # Make amendments to meta and schedule the end of their immunity
+    meta = tr.step(meta, t, TREATMENT, parameters, events, {'treatment': treat})
 
 
     # Return duration
     return meta
-
-
-
-
-
-
-
-
-
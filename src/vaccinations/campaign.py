@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Vaccination campaigns for deployment modes 1 and 2
+
+Deployment mode 0, vaccination at treatment, is in deployment_0.py. The
+other two deployment modes vaccinate people whether or not they're treated:
+
+    1 = everyone is vaccinated at the age of 16, at their sexual debut
+    2 = a proportion prop_vax_g of each age group g is vaccinated
+
+Rather than looking through the population every day for anybody due a
+vaccine, each person's vaccination time is worked out once. For anybody
+coming into the population this is done in demo.mobility(), at their
+sexual debut or when they are imported. For anybody already there this is
+done in a campaign round, which tops each age group back up to prop_vax_g
+in deployment mode 2. Vaccination times are kept in the vaccination_time
+column and the time of the booster in booster_t0, and both are tracked by
+the InfectionEvents queue.
+
+Each dose and booster is effective with probability prop_effective, in which
+case it starts or renews vaccine-conferred immunity as in deployment_0.py.
+Anybody susceptible moves to V. The number of doses and boosters given, and
+the number of people vaccinated, are counted up each day. The number
+vaccinated is a running count, kept up to date as people are protected, as
+the vaccine wears off and as people leave the population.
+
+Unlike vaccination at treatment, a campaign vaccinates people whatever state
+they are in, including while they're infected. The campaign therefore runs
+its own PROGRESSION, where anybody still protected by the vaccine recovers
+to V rather than S, and the vaccine wearing off only moves people in V back
+to S, leaving anybody infected or treated where they are.
+
+On top of the vaccine parameters used by deployment_0.py, these can be set
+in vax_parameters:
+
+    campaign_t0 = the day of the first campaign round, no rounds if not set
+    campaign_interval = the number of days between rounds, a single round
+                        if not set
+    booster_interval = the number of days from vaccination until the
+                       booster, no boosters if not set
+
+INDEX
+    Campaign: schedules vaccinations and counts them up
+"""
+
+
+#%% SETUP Load Libraries
+import numpy as np
+import pandas as pd
+
+
+# My modules
+import src.infections.events as ev
+import src.infections.states as st
+import src.infections.streams as rs
+import src.infections.transitions as tr
+import src.vaccinations.deployment_0 as vax
+
+
+#%% VAR CAMPAIGN
+# TRANSITIONS FOR VACCINATION CAMPAIGNS
+#
+#
+# See src/infections/transitions.py. All of these are triggered by
+# Campaign.update() for the people getting doses and boosters that day, and
+# protection is only triggered for those whose dose or booster is effective.
+#
+#
+CAMPAIGN = [{'name': 'dose',
+             'timer': None,
+             'set': {'vaccination_time': float('inf'),
+                     'vaccination_t0': lambda x, rows, t, vax_parameters: t,
+                     'booster_t0': lambda x, rows, t, vax_parameters: t + vax_parameters.get('booster_interval', float('inf'))}},
+            {'name': 'booster',
+             'timer': None,
+             'set': {'booster_t0': float('inf')}},
+            {'name': 'protection',
+             'timer': None,
+             'set': {'vaccinated': True,
+                     'vaccination_t1': lambda x, rows, t, vax_parameters: t + vax.vaccination_duration(vax_parameters, len(rows)),
+                     **{c: vax.vaccine_modifier(c) for c in vax.MODIFIERS}}},
+            {'name': 'protection_state',
+             'timer': None,
+             'when': lambda x, rows: x['state'][rows] == st.S,
+             'set': {'state': st.V}}]
+
+
+#%% VAR PROGRESSION
+# TRANSITIONS BETWEEN INFECTION STATES UNDER A CAMPAIGN
+#
+#
+# As in deployment_0.py, except that anybody protected by the vaccine goes
+# on to V once they recover naturally, as well as once treatment-conferred
+# immunity runs out, and when the vaccine wears off only those in V go back
+# to S.
+#
+#
+PROGRESSION = [transition for transition in vax.PROGRESSION if transition['name'] not in ['natural_recovery', 'vaccine_wanes']] + \
+              [{'name': 'natural_recovery',
+                'timer': ['site0_t1', 'site1_t1', 'site2_t1'],
+                'when': lambda x, rows: (x['sites'][rows] == 0) & (x['vaccinated'][rows] == False),
+                'set': {'state': st.S}},
+               {'name': 'natural_recovery_to_vaccinated',
+                'timer': ['site0_t1', 'site1_t1', 'site2_t1'],
+                'when': lambda x, rows: (x['sites'][rows] == 0) & (x['vaccinated'][rows] == True),
+                'set': {'state': st.V}},
+               {'name': 'vaccine_wanes_to_susceptible',
+                'timer': 'vaccination_t1',
+                'when': lambda x, rows: x['state'][rows] == st.V,
+                'set': {'state': st.S}},
+               {'name': 'vaccine_wanes',
+                'timer': 'vaccination_t1',
+                'set': {'vaccinated': False,
+                        'vaccination_t1': float('inf'),
+                        **{c: 1 for c in vax.MODIFIERS}}}]
+
+
+#%% CLASS Campaign
+#
+#
+# Works out vaccination times for deployment modes 1 and 2 and gives the
+# doses and boosters when they come up.
+#
+# The campaign needs to be put into pop_parameters['campaign'] so that
+# demo.mobility() can schedule anybody new, and passed to
+# deployment_0.set_function_for_updating_infections() so that the doses are
+# given and infections progressed each day.
+#
+# Attributes
+#   deployment = the deployment mode, 1 or 2
+#   prop_vax = the proportion of each age group to vaccinate
+#   next_round = the day of the next campaign round
+#   interval = the number of days between campaign rounds
+#   n_vaccinated = the number of people with vaccine-conferred immunity,
+#                  counted once on the first day and kept up to date after
+#   history = dictionary of lists with what happened each day
+#               t = the day
+#               doses, boosters = the number given
+#               effective = the number of doses and boosters which worked
+#               vaccinated = the number of people with vaccine-conferred immunity
+#               population = the size of the population
+#
+#
+class Campaign:
+
+
+    def __init__(self, vax_parameters):
+        self.deployment = vax_parameters['deployment']
+        self.prop_vax = np.array([vax_parameters['prop_vax_' + str(g)] for g in range(0, 4)], dtype = float)
+        self.next_round = vax_parameters.get('campaign_t0', float('inf')) if self.deployment == 2 else float('inf')
+        self.interval = vax_parameters.get('campaign_interval', float('inf'))
+        self.n_vaccinated = None
+        self.history = {'t': [], 'doses': [], 'boosters': [], 'effective': [], 'vaccinated': [], 'population': []}
+
+
+    #%% METHOD enter()
+    # Work out when the people coming into the population on day t will be
+    # vaccinated, where debut is True for those making their sexual debut
+    def enter(self, new, debut, t):
+
+
+        # Work out who is vaccinated as they come in
+        time = np.full(len(new), float('inf'))
+        if self.deployment == 1:
+            time[debut] = t
+        elif self.deployment == 2:
+            p = self.prop_vax[new.age_group.to_numpy(dtype = int)]
+            time[rs.stream('vaccination').random(len(new)) < p] = t
+
+
+        # Store their vaccination times
+        new['vaccination_time'] = time
+
+
+        return new
+
+
+    #%% METHOD leave()
+    # Take the people leaving the population out of the number vaccinated
+    def leave(self, meta, out):
+        if self.n_vaccinated is not None:
+            out = np.unique(out)
+            self.n_vaccinated = self.n_vaccinated - int(np.sum(meta.vaccinated.to_numpy()[out] == True))
+
+
+    #%% METHOD campaign_round()
+    # Vaccinate enough of each age group on day t to bring it up to prop_vax,
+    # counting anybody who has had a dose or has one coming
+    def campaign_round(self, meta, t, events = None):
+
+
+        # Work out who has been or will be vaccinated
+        age_group = meta.age_group.to_numpy(dtype = int)
+        covered = np.isfinite(meta.vaccination_t0.to_numpy(dtype = float)) | \
+                  np.isfinite(meta.vaccination_time.to_numpy(dtype = float))
+
+
+        # Choose who to vaccinate in each age group
+        rows = []
+        for g in range(0, 4):
+            group = age_group == g
+            n_new = int(round(self.prop_vax[g] * np.sum(group))) - np.sum(group & covered)
+            if n_new > 0:
+                rows.append(rs.stream('vaccination').choice(np.flatnonzero(group & ~covered), n_new, replace = False))
+
+
+        # Schedule them for today
+        rows = np.concatenate(rows) if len(rows) > 0 else np.zeros(0, dtype = int)
+        meta.loc[rows, 'vaccination_time'] = t
+        if events is not None:
+            events.schedule(meta, ['vaccination_time'], rows)
+
+
+        return meta
+
+
+    #%% METHOD update()
+    # Run any campaign rounds and give any doses and boosters due on day t
+    def update(self, vax_parameters, meta, t, events = None):
+
+
+        # Make sure meta has somewhere to put vaccination times
+        if 'vaccination_time' not in meta.columns:
+            meta['vaccination_time'] = np.full(len(meta), float('inf'), dtype = np.float32)
+
+
+        # Count the people vaccinated to begin with
+        if self.n_vaccinated is None:
+            self.n_vaccinated = int(np.sum(meta.vaccinated.to_numpy() == True))
+
+
+        # Run the campaign rounds
+        while self.next_round <= t:
+            meta = self.campaign_round(meta, t, events)
+            self.next_round = self.next_round + self.interval
+
+
+        # Work out who is due a dose or booster and which are effective
+        due = ev.due(meta, t, ['vaccination_time', 'booster_t0'], events)
+        given = np.append(due['vaccination_time'], due['booster_t0'])
+        effective = given[rs.stream('vaccination').random(len(given)) < vax_parameters['prop_effective']]
+        protected = np.unique(effective)
+        self.n_vaccinated = self.n_vaccinated + int(np.sum(meta.vaccinated.to_numpy()[protected] != True))
+
+
+        # Give them
+        meta = tr.step(meta, t, CAMPAIGN, vax_parameters, events, {'dose': due['vaccination_time'],
+                                                                   'booster': due['booster_t0'],
+                                                                   'protection': effective,
+                                                                   'protection_state': effective})
+
+
+        # Count them up
+        self.history['t'].append(t)
+        self.history['doses'].append(len(due['vaccination_time']))
+        self.history['boosters'].append(len(due['booster_t0']))
+        self.history['effective'].append(len(effective))
+        self.history['vaccinated'].append(self.n_vaccinated)
+        self.history['population'].append(len(meta))
+
+
+        return meta
+
+
+    #%% METHOD progress()
+    # Progress everybody's infection and vaccination on day t using the
+    # campaign's PROGRESSION, taking anybody whose vaccine wears off out of
+    # the number vaccinated
+    def progress(self, meta, t, events = None):
+        counts = {}
+        meta = tr.step(meta, t, PROGRESSION, events = events, counts = counts)
+        if self.n_vaccinated is not None:
+            self.n_vaccinated = self.n_vaccinated - counts.get('vaccine_wanes', 0)
+        return meta
+
+
+    #%% METHOD summary()
+    # The counts in history as a data frame
+    def summary(self):
+        return pd.DataFrame(self.history)
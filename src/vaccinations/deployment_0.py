@@ -11,19 +11,77 @@ Created on Mon May 24 09:10:03 2021
 
 # Standard libaries
 import numpy as np
-import pandas as pd
-import scipy.stats as sp
 # import matplotlib.pyplot as plt
 
 
 # Import the baseline NG library for doing all the stuff that hasn't been changed
 import src.infections.ng as ng
+import src.infections.states as st
+import src.infections.streams as rs
+import src.infections.transitions as tr
+
+
+#%% VAR MODIFIERS
+# PER-PERSON VACCINE MODIFIERS
+#
+#
+# The effect of the vaccine on each person is kept in meta as multipliers on
+#
+#   siteK_trans_mod = the probability of transmission from site K of them
+#   siteK_symp_mod = the probability of symptoms when infected at site K
+#   siteK_duration_mod = the duration of an infection at site K
+#
+# These are 1 for anybody unvaccinated. They are only changed when somebody's
+# vaccination status does, by the VACCINATION and VACCINE_WANING transitions,
+# and are read straight out of meta for everybody at once by the hooks
+# passed to ng.new_infections().
+#
+#
+MODIFIERS = ['site0_trans_mod', 'site1_trans_mod', 'site2_trans_mod',
+             'site0_symp_mod', 'site1_symp_mod', 'site2_symp_mod',
+             'site0_duration_mod', 'site1_duration_mod', 'site2_duration_mod']
+
+
+#%% FUN vaccine_modifiers()
+#
+#
+# The modifiers of somebody who has been vaccinated, given the effect of the
+# vaccine. Effect 0 gives complete immunity instead, so leaves them all at 1.
+#
+#
+def vaccine_modifiers(vax_parameters):
+
+
+    # Work out which of the modifiers the vaccine changes
+    effect = vax_parameters['effect']
+    modifiers = {}
+    for k in range(0, 3):
+        site = 'site' + str(k)
+        modifiers[site + '_trans_mod'] = vax_parameters[site + '_trans_reduce'] if effect in [1, 2, 3] else 1
+        modifiers[site + '_symp_mod'] = vax_parameters[site + '_symp_reduce'] if effect == 2 else 1
+        modifiers[site + '_duration_mod'] = vax_parameters[site + '_duration_reduce'] if effect == 3 else 1
+
+
+    return modifiers
+
+
+#%% FUN vaccine_modifier()
+#
+#
+# A transition setter giving the value of modifier c for somebody who has
+# just been vaccinated, see src/infections/transitions.py.
+#
+#
+def vaccine_modifier(c):
+    return lambda x, rows, t, vax_parameters: vaccine_modifiers(vax_parameters)[c]
 
 
 #%% FUN vaccine_reduced_trans_prob()
 #
 #
-# Compute the site-specific transmission probabilities
+# Compute the site-specific transmission probabilities across a set of
+# partnerships, as in ng.transmission_probability(), scaled by the
+# transmission modifiers of each infector
 #
 #
 def vaccine_reduced_trans_prob(inf_parameters, vax_parameters, meta, i, j):
@@ -33,14 +91,9 @@ def vaccine_reduced_trans_prob(inf_parameters, vax_parameters, meta, i, j):
     trans_prob = ng.transmission_probability(inf_parameters, vax_parameters, meta, i, j)
 
 
-    # Construct the reduction vector
-    vax_reduction = np.array([[vax_parameters['site0_trans_reduce'] * meta.vaccinated.iloc[i] + (1-meta.vaccinated.iloc[i])], \
-                              [vax_parameters['site1_trans_reduce'] * meta.vaccinated.iloc[i] + (1-meta.vaccinated.iloc[i])], \
-                              [vax_parameters['site2_trans_reduce'] * meta.vaccinated.iloc[i] + (1-meta.vaccinated.iloc[i])]])
-
-
     # Multiply the transmission probability by the vaccine reduction
-    trans_prob = vax_reduction * trans_prob
+    vax_reduction = meta[['site0_trans_mod', 'site1_trans_mod', 'site2_trans_mod']].to_numpy(dtype = float)[i]
+    trans_prob = vax_reduction[:, :, None] * trans_prob
 
 
     return trans_prob
@@ -54,15 +107,12 @@ def vaccine_reduced_trans_prob(inf_parameters, vax_parameters, meta, i, j):
 #
 def symptoms_rectal(inf_parameters, vax_parameters, meta, i, j):
 
-    # Compute the baseline porbability
-    p_baseline = inf_parameters['infection'].symptoms_rectal[meta.gender.iloc[j]]
-
-    # Modify the probability using the vaxination parameters
-    modifyer = meta.vaccinated.iloc[j] * vax_parameters['site0_symp_reduce'] + (1-meta.vaccinated.iloc[j])
-    prob = modifyer * p_baseline
+    # Modify the baseline probability using the symptom modifiers
+    p_baseline = inf_parameters['infection'].symptoms_rectal.to_numpy()[meta.gender.to_numpy(dtype = int)[j]]
+    prob = meta.site0_symp_mod.to_numpy(dtype = float)[j] * p_baseline
 
     # Decide whether or not they will be symptomatic
-    symptoms = np.random.random() < prob
+    symptoms = rs.stream('symptoms').random(len(j)) < prob
 
     return symptoms
 
@@ -75,15 +125,12 @@ def symptoms_rectal(inf_parameters, vax_parameters, meta, i, j):
 #
 def symptoms_pharynx(inf_parameters, vax_parameters, meta, i, j):
 
-    # Compute the baseline porbability
-    p_baseline = inf_parameters['infection'].symptoms_pharyngeal[meta.gender.iloc[j]]
-
-    # Modify the probability using the vaxination parameters
-    modifyer = meta.vaccinated.iloc[j] * vax_parameters['site1_symp_reduce'] + (1-meta.vaccinated.iloc[j])
-    prob = modifyer * p_baseline
+    # Modify the baseline probability using the symptom modifiers
+    p_baseline = inf_parameters['infection'].symptoms_pharyngeal.to_numpy()[meta.gender.to_numpy(dtype = int)[j]]
+    prob = meta.site1_symp_mod.to_numpy(dtype = float)[j] * p_baseline
 
     # Decide whether or not they will be symptomatic
-    symptoms = np.random.random() < prob
+    symptoms = rs.stream('symptoms').random(len(j)) < prob
 
     return symptoms
 
@@ -96,15 +143,12 @@ def symptoms_pharynx(inf_parameters, vax_parameters, meta, i, j):
 #
 def symptoms_urethra(inf_parameters, vax_parameters, meta, i, j):
 
-    # Compute the baseline porbability
-    p_baseline = inf_parameters['infection'].symptoms_urethral[meta.gender.iloc[j]]
-
-    # Modify the probability using the vaxination parameters
-    modifyer = meta.vaccinated.iloc[j] * vax_parameters['site2_symp_reduce'] + (1-meta.vaccinated.iloc[j])
-    prob = modifyer * p_baseline
+    # Modify the baseline probability using the symptom modifiers
+    p_baseline = inf_parameters['infection'].symptoms_urethral.to_numpy()[meta.gender.to_numpy(dtype = int)[j]]
+    prob = meta.site2_symp_mod.to_numpy(dtype = float)[j] * p_baseline
 
     # Decide whether or not they will be symptomatic
-    symptoms = np.random.random() < prob
+    symptoms = rs.stream('symptoms').random(len(j)) < prob
 
     return symptoms
 
@@ -121,16 +165,13 @@ symptoms_vax = {'site0': symptoms_rectal,
 #
 #
 def duration_vax_site0(vax_parameters, meta, j):
-    dur_reduce = meta.vaccinated.iloc[j] * vax_parameters['site0_duration_reduce'] + (1-meta.vaccinated.iloc[j])
-    return dur_reduce
+    return meta.site0_duration_mod.to_numpy(dtype = float)[j]
 
 def duration_vax_site1(vax_parameters, meta, j):
-    dur_reduce = meta.vaccinated.iloc[j] * vax_parameters['site1_duration_reduce'] + (1-meta.vaccinated.iloc[j])
-    return dur_reduce
+    return meta.site1_duration_mod.to_numpy(dtype = float)[j]
 
 def duration_vax_site2(vax_parameters, meta, j):
-    dur_reduce = meta.vaccinated.iloc[j] * vax_parameters['site2_duration_reduce'] + (1-meta.vaccinated.iloc[j])
-    return dur_reduce
+    return meta.site2_duration_mod.to_numpy(dtype = float)[j]
 
 duration_vax = {'site0': duration_vax_site0,
                 'site1': duration_vax_site1,
@@ -142,8 +183,14 @@ duration_vax = {'site0': duration_vax_site0,
 #
 # Function to update the state of infections
 #
+# The vaccination data of anybody who has just joined the population is set
+# up first, so that they have vaccine modifiers before any transmission.
 #
-def set_function_for_updating_infections(vax_parameters):
+# Deployment modes 1 and 2 give vaccines through a campaign.Campaign, which
+# needs to be passed in, rather than at treatment.
+#
+#
+def set_function_for_updating_infections(vax_parameters, campaign = None):
 
 
     # Where distribution occurrs during treatment
@@ -155,54 +202,52 @@ def set_function_for_updating_infections(vax_parameters):
 
 
             # Situation where vaccinations given during treatment and makes people immune
-            def update_infections(inf_parameters, vax_parameters, meta, partner_matrix, t):
-                meta = ng.new_infections(inf_parameters, meta, partner_matrix, t)
-                meta = progress_state_of_infection(meta, t)
-                meta = progress_state_of_vaccination(meta, t)
-                meta = seek_treatment(inf_parameters, vax_parameters, meta, partner_matrix, t)
+            def update_infections(inf_parameters, vax_parameters, meta, partner_graph, t, events = None):
+                meta = initilise_vaccination(meta)
+                meta = ng.new_infections(inf_parameters, meta, partner_graph, t, events = events)
+                meta = progress_state_of_infection(meta, t, events)
+                meta = progress_state_of_vaccination(meta, t, events)
+                meta = seek_treatment(inf_parameters, vax_parameters, meta, partner_graph, t, events)
                 return meta
 
 
-        # Where the effect is to reduce transmission
-        elif vax_parameters['effect'] == 1:
+        # Where the effect is to reduce transmission, symptoms or the
+        # duration of infection
+        elif vax_parameters['effect'] in [1, 2, 3]:
 
 
-            # Situation where vaccines given during treatment and result is to
-            # decrease transmission probability
-            def update_infections(inf_parameters, vax_parameters, meta, partner_matrix, t):
-                meta = ng.new_infections(inf_parameters, meta, partner_matrix, t, ['S', 'E', 'I', 'V'], vaccine_reduced_trans_prob, vax_parameters)
-                meta = progress_state_of_infection(meta, t)
-                meta = progress_state_of_vaccination(meta, t)
-                meta = seek_treatment(inf_parameters, vax_parameters, meta, partner_matrix, t)
+            # Situation where vaccines given during treatment and the result
+            # is set by the modifiers given by vaccine_modifiers()
+            def update_infections(inf_parameters, vax_parameters, meta, partner_graph, t, events = None):
+                meta = initilise_vaccination(meta)
+                meta = ng.new_infections(inf_parameters, meta, partner_graph, t, [st.S, st.E, st.I, st.V], vaccine_reduced_trans_prob, vax_parameters, symptoms_vax, duration_vax, events = events)
+                meta = progress_state_of_infection(meta, t, events)
+                meta = progress_state_of_vaccination(meta, t, events)
+                meta = seek_treatment(inf_parameters, vax_parameters, meta, partner_graph, t, events)
                 return meta
 
 
-        # Where the effect is to reduce symptoms
-        elif vax_parameters['effect'] == 2:
-
-
-            # Situation where vaccines given during treatment and result in
-            # people being more likely to be asymptomatic
-            def update_infections(inf_parameters, vax_parameters, meta, partner_matrix, t):
-                meta = ng.new_infections(inf_parameters, meta, partner_matrix, t, ['S', 'E', 'I', 'V'], vaccine_reduced_trans_prob, vax_parameters, symptoms_vax)
-                meta = progress_state_of_infection(meta, t)
-                meta = progress_state_of_vaccination(meta, t)
-                meta = seek_treatment(inf_parameters, vax_parameters, meta, partner_matrix, t)
-                return meta
+    # Where vaccines are given by a campaign
+    elif vax_parameters['deployment'] in [1, 2]:
 
 
-        # Where the effect is the reduce the duration of infection
-        elif vax_parameters['effect'] == 3:
+        # Make sure there's a campaign to run
+        if campaign is None:
+            raise ValueError('Deployment mode ' + str(vax_parameters['deployment']) + ' needs a campaign.Campaign')
 
 
-            # Situation where vaccines given during treatment and result in
-            # people having a shorter duration of infection
-            def update_infections(inf_parameters, vax_parameters, meta, partner_matrix, t):
-                meta = ng.new_infections(inf_parameters, meta, partner_matrix, t, ['S', 'E', 'I', 'V'], vaccine_reduced_trans_prob, duration_mod = duration_vax)
-                meta = progress_state_of_infection(meta, t)
-                meta = progress_state_of_vaccination(meta, t)
-                meta = seek_treatment(inf_parameters, vax_parameters, meta, partner_matrix, t)
-                return meta
+        # Situation where vaccines are given by the campaign, either giving
+        # complete immunity (effect 0) or acting through the modifiers
+        def update_infections(inf_parameters, vax_parameters, meta, partner_graph, t, events = None):
+            meta = initilise_vaccination(meta)
+            meta = campaign.update(vax_parameters, meta, t, events)
+            if vax_parameters['effect'] == 0:
+                meta = ng.new_infections(inf_parameters, meta, partner_graph, t, events = events)
+            else:
+                meta = ng.new_infections(inf_parameters, meta, partner_graph, t, [st.S, st.E, st.I, st.V], vaccine_reduced_trans_prob, vax_parameters, symptoms_vax, duration_vax, events = events)
+            meta = campaign.progress(meta, t, events)
+            meta = ng.seek_treatment(inf_parameters, meta, partner_graph, t, events)
+            return meta
 
 
     return update_infections
@@ -219,14 +264,54 @@ def vaccination_duration(vax_parameters, n):
 
 
     # Sample duration
-    duration = np.random.gamma(vax_parameters['duration_mean'] / \
-                               vax_parameters['duration_var'], \
-                               vax_parameters['duration_var'], n)
+    duration = rs.stream('vaccination').gamma(vax_parameters['duration_mean'] / \
+                                              vax_parameters['duration_var'], \
+                                              vax_parameters['duration_var'], n)
 
 
     return duration
 
 
+#%% VAR VACCINATION
+# TRANSITIONS INTO AND OUT OF VACCINE-CONFERRED IMMUNITY
+#
+#
+# See src/infections/transitions.py. Vaccination is triggered by
+# give_vaccine() for the people whose vaccine is effective.
+#
+#
+VACCINATION = [{'name': 'vaccination',
+                'timer': None,
+                'set': {'vaccinated': True,
+                        'vaccination_t0': lambda x, rows, t, vax_parameters: t,
+                        'vaccination_t1': lambda x, rows, t, vax_parameters: t + vaccination_duration(vax_parameters, len(rows)),
+                        **{c: vaccine_modifier(c) for c in MODIFIERS}}}]
+
+
+VACCINE_WANING = [{'name': 'vaccine_wanes',
+                   'timer': 'vaccination_t1',
+                   'set': {'state': st.S,
+                           'vaccinated': False,
+                           'vaccination_t1': float('inf'),
+                           **{c: 1 for c in MODIFIERS}}}]
+
+
+# Once treatment-conferred immunity runs out anybody vaccinated goes on to V
+# rather than S, and the vaccine itself wears off afterwards
+PROGRESSION = [transition for transition in ng.PROGRESSION if transition['name'] != 'immunity_wanes'] + \
+              [{'name': 'immunity_wanes',
+                'timer': 'recovery_time',
+                'when': lambda x, rows: x['vaccinated'][rows] == False,
+                'set': {'state': st.S,
+                        'recovery_time': float('inf')}},
+               {'name': 'immunity_wanes_to_vaccinated',
+                'timer': 'recovery_time',
+                'when': lambda x, rows: x['vaccinated'][rows] == True,
+                'set': {'state': st.V,
+                        'recovery_time': float('inf')}}] + \
+              VACCINE_WANING
+
+
 #%% FUN give_vaccine()
 #
 #
@@ -234,22 +319,16 @@ def vaccination_duration(vax_parameters, n):
 # active NG infection
 #
 #
-def give_vaccine(inf_parameters, vax_parameters, meta, t, treat):
+def give_vaccine(inf_parameters, vax_parameters, meta, t, treat, events = None):
 
 
     # Decide which vaccinations are effective
-    uu = np.random.random(len(treat))
+    uu = rs.stream('vaccination').random(len(treat))
     uu = uu < vax_parameters['prop_effective']
 
 
-    # Update their vaccination data
-    # meta.loc[treat[uu], 'state'] = 'V'
-    meta.loc[treat[uu], 'vaccinated'] = True
-    meta.loc[treat[uu], 'vaccination_t0'] = t
-
-
-    # Set the time until the vaccine wears off
-    meta.loc[treat[uu], 'vaccination_t1'] = t + vaccination_duration(vax_parameters, len(treat[uu]))
+    # Update their vaccination data and schedule the vaccine wearing off
+    meta = tr.step(meta, t, VACCINATION, vax_parameters, events, {'vaccination': treat[uu]})
 
 
     # Pass back meta
@@ -259,24 +338,55 @@ def give_vaccine(inf_parameters, vax_parameters, meta, t, treat):
 #%% FUN progress_state_of_vaccination()
 #
 #
+# Sets up the vaccination data for anybody new and removes vaccine-conferred
+# immunity once it has worn off. With an InfectionEvents queue only the
+# people whose vaccine wears off today are looked at.
 #
 #
-#
-def progress_state_of_vaccination(meta, t):
+def progress_state_of_vaccination(meta, t, events = None):
 
 
     # Check for new people in the population
-    new = meta.vaccinated.isin([True, False]) == False
-    meta.loc[new, 'vaccinated'] = False
-    meta.loc[new, 'vaccination_t0'] = float('inf')
-    meta.loc[new, 'vaccination_t1'] = float('inf')
-    meta.loc[new, 'booster_t0'] = float('inf')
+    meta = initilise_vaccination(meta)
 
 
     # Remove vaccine-conferred immunity
-    waned_immunity = meta["vaccination_t1"] < t
-    meta.loc[waned_immunity, "state"] = "S"
-    meta.loc[waned_immunity, "vaccinated"] = False
+    meta = tr.step(meta, t, VACCINE_WANING, events = events)
+
+
+    return meta
+
+
+#%% FUN initilise_vaccination()
+#
+#
+# Sets up the vaccination data for anybody new in the population, adding the
+# modifier columns to meta the first time round.
+#
+#
+def initilise_vaccination(meta):
+
+
+    # Add the modifiers if they aren't there yet
+    for c in MODIFIERS:
+        if c not in meta.columns:
+            meta[c] = np.ones(len(meta), dtype = np.float32)
+
+
+    # Anybody new is unvaccinated
+    new = meta.vaccinated.isin([True, False]) == False
+    if new.any():
+        meta.loc[new, 'vaccinated'] = False
+        meta.loc[new, 'vaccination_t0'] = float('inf')
+        meta.loc[new, 'vaccination_t1'] = float('inf')
+        meta.loc[new, 'booster_t0'] = float('inf')
+        meta.loc[new, MODIFIERS] = 1
+
+
+        # Filling in the gaps leaves the columns widened, so put them back
+        meta['vaccinated'] = meta.vaccinated.astype(bool)
+        for c in ['vaccination_t0', 'vaccination_t1', 'booster_t0'] + MODIFIERS:
+            meta[c] = meta[c].astype(np.float32)
 
 
     return meta
@@ -288,6 +398,7 @@ def progress_state_of_vaccination(meta, t):
 #
 # Time until treatment
 #    Gamma distributed with specified mean and variance.
+#    Worked out when somebody is infected, see treatment_due().
 #    Upon treatment, the indivdual's parter will also be treated.
 #    Immunity is conferred for a specied period.
 #
@@ -303,42 +414,19 @@ def progress_state_of_vaccination(meta, t):
 #    immune_mean
 #    immune_var
 #
+#    events = the InfectionEvents queue to take treatment times from and put
+#             the end of immunity into, or None
+#
 #
 # OUTPUT
 #    meta
 #
 #
-def seek_treatment(parameters, vax_parameters, meta, partner_matrix, t):
-
-
-    # Work out who is symptomatic
-    symp0 = meta.site0_symptoms == True
-    symp1 = meta.site1_symptoms == True
-    symp2 = meta.site2_symptoms == True
-
+def seek_treatment(parameters, vax_parameters, meta, partner_graph, t, events = None):
 
-    # Work out their duration of infectiousness
-    dur0 = t - meta.loc[symp0, "site0_t0"]
-    dur1 = t - meta.loc[symp1, "site1_t0"]
-    dur2 = t - meta.loc[symp2, "site2_t0"]
 
-
-    # Work out whose infectious period has exceeded their tolerance
-    treat0 = sp.gamma.cdf(dur0, parameters['infection'].treatment_mean[0]/parameters['infection'].treatment_var[0], parameters['infection'].treatment_var[0]) >= meta.loc[symp0, "treatment_threshold"]
-    treat1 = sp.gamma.cdf(dur1, parameters['infection'].treatment_mean[0]/parameters['infection'].treatment_var[0], parameters['infection'].treatment_var[0]) >= meta.loc[symp1, "treatment_threshold"]
-    treat2 = sp.gamma.cdf(dur2, parameters['infection'].treatment_mean[0]/parameters['infection'].treatment_var[0], parameters['infection'].treatment_var[0]) >= meta.loc[symp2, "treatment_threshold"]
-
-
-    # Pull out their identifiers
-    treat0 = treat0.index[treat0]
-    treat1 = treat1.index[treat1]
-    treat2 = treat2.index[treat2]
-
-
-    # Combine these into one big list
-    treat = np.append(treat0, treat1)
-    treat = np.append(treat, treat2)
-    treat = np.unique(treat)
+    # Work out who seeks treatment today
+    meta, treat = ng.treatment_due(parameters, meta, t, events)
 
 
     # Have their current long-term partners get treated as well
@@ -347,26 +435,13 @@ def seek_treatment(parameters, vax_parameters, meta, partner_matrix, t):
     treat = np.append(treat, part[part>-1])
 
 
-    # Make amendments to meta
-    meta.loc[treat, "state"] = "T"
-    meta.loc[treat, "recovery_time"] = t + ng.duration_treatment_immunity(parameters, treat)
-    meta.loc[treat, "site0"] = 0
-    meta.loc[treat, "site1"] = 0
-    meta.loc[treat, "site2"] = 0
-    meta.loc[treat, "site0_t0"] = float("inf")
-    meta.loc[treat, "site1_t0"] = float("inf")
-    meta.loc[treat, "site2_t0"] = float("inf")
-    meta.loc[treat, "site0_t1"] = float("inf")
-    meta.loc[treat, "site1_t1"] = float("inf")
-    meta.loc[treat, "site2_t1"] = float("inf")
-    meta.loc[treat, 'site0_symptoms'] = False
-    meta.loc[treat, 'site1_symptoms'] = False
-    meta.loc[treat, 'site2_symptoms'] = False
+    # Make amendments to meta and schedule the end of their immunity
+    meta = tr.step(meta, t, ng.TREATMENT, parameters, events, {'treatment': treat})
 
 
     # Implement vaccinations
     if len(treat) > 0:
-        meta = give_vaccine(parameters, vax_parameters, meta, t, treat)
+        meta = give_vaccine(parameters, vax_parameters, meta, t, treat, events)
 
 
     # Return duration
@@ -378,78 +453,29 @@ def seek_treatment(parameters, vax_parameters, meta, partner_matrix, t):
 #
 #
 # Simply checks the duration of each compartment and progresses the
-# individual if the duration is up.
+# individual if the duration is up, using the transitions in PROGRESSION.
+#
+# With an InfectionEvents queue only the people with events due today are
+# looked at, otherwise everybody is checked.
 #
 #
 # INPUT
 #   meta, t
+#   events = the InfectionEvents queue, or None
 #
 # OUTPUT
 #   meta
 #
 #
-def progress_state_of_infection(meta, t):
-
-
-    # Test for new rectal infections
-    infectious = (meta["site0_t0"] < t) & (meta["site0"] == 0)
-    meta.loc[infectious, "state"] = "I"
-    meta.loc[infectious, "site0"] = 1
-
-
-    # Test for new urethral infections
-    infectious = (meta["site1_t0"] < t) & (meta["site1"] == 0)
-    meta.loc[infectious, "state"] = "I"
-    meta.loc[infectious, "site1"] = 1
-
-
-    # Test for new pharyngeal infections
-    infectious = (meta["site2_t0"] < t) & (meta["site2"] == 0)
-    meta.loc[infectious, "state"] = "I"
-    meta.loc[infectious, "site2"] = 1
+def progress_state_of_infection(meta, t, events = None):
 
 
-    # Remove expired rectal infections
-    recovery0 = meta["site0_t1"] <= t
-    meta.at[recovery0, "site0"] = 0
-    meta.at[recovery0, "site0_t0"] = float("inf")
-    meta.at[recovery0, "site0_t1"] = float("inf")
-    meta.at[recovery0, 'site0_symptoms'] = False
-
-
-    # Remove expired urethral infections
-    recovery1 = meta["site1_t1"] <= t
-    meta.at[recovery1, "site1"] = 0
-    meta.at[recovery1, "site1_t0"] = float("inf")
-    meta.at[recovery1, "site1_t1"] = float("inf")
-    meta.at[recovery1, 'site1_symptoms'] = False
-
-
-    # Remove expired pharengynal infections
-    recovery2 = meta["site2_t1"] <= t
-    meta.at[recovery2, "site2"] = 0
-    meta.at[recovery2, "site2_t0"] = float("inf")
-    meta.at[recovery2, "site2_t1"] = float("inf")
-    meta.at[recovery2, 'site2_symptoms'] = False
-
-
-    # Check if anybody has achieved a natural recovery
-    natural_recovery = ((recovery0 | recovery1) | recovery2) & (meta.site0==0) & (meta.site1==0) & (meta.site2==0)
-    meta.at[natural_recovery, 'state'] = 'S'
-
-
-    # Identify those where treatment has worn off
-    waned_immunity = meta["recovery_time"] < t
-    meta.loc[waned_immunity, "recovery_time"] = float("inf")
-
-
-    # Work out if they should progress to vacinated or susceptible
-    meta.loc[waned_immunity & (meta.vaccinated == False), "state"] = 'S'
-    meta.loc[waned_immunity & (meta.vaccinated == True), "state"] = 'V'
+    # Check for new people in the population
+    meta = initilise_vaccination(meta)
 
 
-    # Progress the state of vaccinated people
-    meta = progress_state_of_vaccination(meta, t)
+    # Progress everybody's infection and vaccination
+    meta = tr.step(meta, t, PROGRESSION, events = events)
 
     return meta
 
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+Sweeps over vaccine scenarios from a calibrated simulation
+
+Every vaccine scenario starts from the end of the same calibrated run, so
+the end state is loaded once with load_calibrated_state() and then handed
+out to a Pool of workers. Where processes can be forked the workers share
+the state copy-on-write with the parent, otherwise it is sent to each
+worker once when the Pool starts. Each worker copies the bits of the state
+that a simulation changes before running a configuration from it.
+
+Configurations of vax_parameters are made up from a base set with either
+a grid, every combination of the values given, or a Latin hypercube sample
+of ranges of values. Each configuration is run for a number of replicates
+and a row of summary statistics comes back from each run. Rows are
+collected into one table as they come in, and written out to a csv as they
+go if asked.
+
+Sweeps can also be paired with a baseline with no vaccine. Each replicate
+is then run once more without the vaccine, and every run draws from the
+named random number streams in src/infections/streams.py seeded by its
+replicate, so each configuration shares all its streams other than the
+vaccine ones with the baseline run of the same replicate. The difference
+from the baseline is worked out for each replicate, and has much less noise
+than comparing independent runs would.
+
+INDEX
+    load_calibrated_state: reads in the end of a calibrated simulation
+    grid: every combination of some vaccine parameters
+    latin_hypercube: a Latin hypercube sample of some vaccine parameters
+    run_sweep: runs all the configurations across a Pool
+    run_configuration: runs one configuration from the shared state
+"""
+
+
+#%% SETUP Load Libraries
+import numpy as np
+import pandas as pd
+import copy
+import itertools
+import pickle
+import time
+import multiprocessing as mp
+
+
+# My modules
+import src.demographic.population_dynamics as demo
+import src.demographic.schema as schema
+import src.partners.partners as prt
+import src.partners.partnership_graph as pg
+import src.calibration.setup as setup
+import src.infections.events as ev
+import src.infections.ng as ng
+import src.infections.states as st
+import src.infections.streams as rs
+import src.vaccinations.deployment_0 as vax
+import src.vaccinations.campaign as camp
+
+
+# The calibrated state shared with the workers
+_STATE = {}
+
+
+# The configuration number given to baseline runs
+BASELINE = -1
+
+
+# Outcomes compared with the baseline in paired sweeps
+OUTCOMES = ['prevalence', 'prevalence_end', 'site0_prevalence', 'site1_prevalence', 'site2_prevalence']
+
+
+#%% FUN load_calibrated_state()
+#
+#
+# Read in the end of a calibrated simulation, as in test_script.py, and get
+# it ready to run vaccine scenarios from.
+#
+#
+# INPUT
+#   scenario = the population scenario
+#   calibrated_no = the calibrated parameter set
+#
+# OUTPUT
+#   state = dictionary with inf_parameters, pop_parameters, prt_parameters,
+#           sim_parameters, meta, partner_graph and t, the last day simulated
+#
+#
+def load_calibrated_state(scenario = 1, calibrated_no = 0):
+
+
+    # Work out which simulation the calibrated set came from
+    inf_parameters = setup.parse_parameters('calibrated', scenario, calibrated_no, 'parallel')
+    output_file = 'simulations/calibration/scenario_' + str(scenario) + '/simulation_' + str(inf_parameters['calibration_set']) + '/output.pkl'
+
+
+    # Read in the end of it
+    with open(output_file, 'rb') as f:
+        output = pickle.load(f)
+    meta = schema.apply(output['meta'])
+
+
+    # Parse the partnership network, converting older output if needed
+    if 'partner_graph' in output:
+        partner_graph = output['partner_graph']
+    else:
+        partner_graph = pg.from_dense(meta, output['partner_matrix'], output['partner_expire'])
+
+
+    # Set up the importations once for all the scenarios
+    pop_parameters = output['pop_parameters']
+    if 'imports' not in pop_parameters:
+        pop_parameters = demo.initilise_demographic_dynamics(pop_parameters, output['inf_parameters'], meta)
+
+
+    # Nobody is vaccinated yet
+    meta['vaccinated'] = False
+    meta['vaccination_t0'] = float('inf')
+    meta['vaccination_t1'] = float('inf')
+    meta['booster_t0'] = float('inf')
+    meta = schema.apply(meta)
+
+
+    return {'inf_parameters': output['inf_parameters'],
+            'pop_parameters': pop_parameters,
+            'prt_parameters': output['prt_parameters'] if 'prt_parameters' in output else prt.setup_data(),
+            'sim_parameters': output['sim_parameters'],
+            'meta': meta,
+            'partner_graph': partner_graph,
+            't': output['t']}
+
+
+#%% FUN grid()
+#
+#
+# Every combination of the values of some vaccine parameters.
+#
+#
+# INPUT
+#   base = the vax_parameters shared by every configuration
+#   values = dictionary of the values to try for each parameter
+#
+# OUTPUT
+#   list of vax_parameters
+#
+#
+def grid(base, values):
+    names = list(values.keys())
+    return [dict(base, **dict(zip(names, x))) for x in itertools.product(*[values[n] for n in names])]
+
+
+#%% FUN latin_hypercube()
+#
+#
+# A Latin hypercube sample of some vaccine parameters. Each parameter is
+# split into n equally likely strata and each stratum is used once.
+#
+#
+# INPUT
+#   base = the vax_parameters shared by every configuration
+#   ranges = dictionary for each parameter of either
+#              a tuple (low, high) to sample uniformly between, or
+#              a list of values to choose between, like the effect
+#   n = the number of configurations
+#   seed = the random seed
+#
+# OUTPUT
+#   list of vax_parameters
+#
+#
+def latin_hypercube(base, ranges, n, seed = 0):
+
+
+    # Sample one point in each stratum and shuffle them for each parameter
+    rng = np.random.RandomState(seed)
+    configurations = [dict(base) for i in range(0, n)]
+    for name, r in ranges.items():
+        u = (rng.permutation(n) + rng.random_sample(n)) / n
+
+
+        # Put them on the scale of the parameter
+        if isinstance(r, tuple):
+            x = r[0] + u * (r[1] - r[0])
+        else:
+            x = [r[k] for k in np.floor(u * len(r)).astype(int)]
+        for i in range(0, n):
+            configurations[i][name] = x[i]
+
+
+    return configurations
+
+
+#%% FUN run_sweep()
+#
+#
+# Run every configuration of vax_parameters from the calibrated state, with
+# the replicates of each configuration using the same seeds.
+#
+#
+# INPUT
+#   state = the output of load_calibrated_state()
+#   configurations = list of vax_parameters, from grid() or latin_hypercube()
+#   n_days = the number of days to simulate
+#   n_reps = the number of replicates of each configuration
+#   n_cores = the number of workers in the Pool
+#   seed = the seed of the first replicate
+#   out_file = csv to write each row to as it comes in, or None
+#   paired = whether to also run a baseline for each replicate, using common
+#            random numbers
+#
+# OUTPUT
+#   data frame with a row for each configuration and replicate, with the
+#   parameters which vary between configurations and the output of
+#   run_configuration(). Paired sweeps also have a row for the baseline of
+#   each replicate, with configuration BASELINE, and the difference of each
+#   of the OUTCOMES from the baseline of the same replicate.
+#
+#
+def run_sweep(state, configurations, n_days = 365, n_reps = 1, n_cores = 10, seed = 0, out_file = None, paired = False):
+
+
+    # Work out which parameters vary
+    varies = [c for c in configurations[0] if any(x.get(c) != configurations[0][c] for x in configurations)]
+
+
+    # Set up the jobs
+    jobs = [(k, r, configurations[k], seed + r, n_days, paired) for k in range(0, len(configurations)) for r in range(0, n_reps)]
+    if paired:
+        jobs = [(BASELINE, r, None, seed + r, n_days, paired) for r in range(0, n_reps)] + jobs
+
+
+    # Run them across the pool and collect the rows as they come in
+    rows = []
+    with _start_pool(state, n_cores) as pool:
+        for row in pool.imap_unordered(run_configuration, jobs):
+            k = row['configuration']
+            row.update({c: np.nan if k == BASELINE else configurations[k][c] for c in varies})
+            rows.append(row)
+            if out_file is not None:
+                pd.DataFrame([row]).to_csv(out_file, mode = 'w' if len(rows) == 1 else 'a', header = len(rows) == 1, index = False)
+
+
+    # Put them in order
+    results = pd.DataFrame(rows).sort_values(['configuration', 'replicate']).reset_index(drop = True)
+
+
+    # Compare each run with the baseline of the same replicate
+    if paired:
+        baseline = results.loc[results.configuration == BASELINE, :].set_index('replicate')
+        for c in OUTCOMES:
+            results[c + '_difference'] = results[c].to_numpy() - baseline.loc[results.replicate, c].to_numpy()
+
+
+    return results
+
+
+#%% FUN run_configuration()
+#
+#
+# Run one configuration of vax_parameters from the shared calibrated state.
+#
+#
+# INPUT
+#   job = tuple of
+#       configuration = the number of the configuration
+#       replicate = the number of the replicate
+#       vax_parameters = the vaccine parameters, or None for the baseline
+#       seed = the random seed
+#       n_days = the number of days to simulate
+#       paired = whether to seed the named random number streams, so that
+#                runs with the same seed use common random numbers
+#
+# OUTPUT
+#   dictionary with
+#       configuration, replicate, seed = as given
+#       prevalence = mean proportion infected at any site over the run
+#       prevalence_end = proportion infected at any site at the end
+#       site0_prevalence, site1_prevalence, site2_prevalence = mean
+#           proportion infected at each site over the run
+#       vaccinated_end = proportion with vaccine-conferred immunity at the end
+#       doses = the number of doses given by a campaign
+#       runtime = time taken in minutes
+#
+#
+def run_configuration(job):
+
+
+    # Take a copy of everything that gets changed
+    configuration, replicate, vax_parameters, seed, n_days, paired = job
+    t0 = time.time()
+    np.random.seed(seed)
+    if paired:
+        rs.seed(seed)
+    else:
+        rs.reset()
+    inf_parameters = copy.deepcopy(_STATE['inf_parameters'])
+    prt_parameters = copy.deepcopy(_STATE['prt_parameters'])
+    pop_parameters = dict(_STATE['pop_parameters'])
+    meta = _STATE['meta'].copy()
+    partner_graph = copy.deepcopy(_STATE['partner_graph'])
+
+
+    # Set up the vaccine, if there is one
+    campaign = None
+    if vax_parameters is None:
+        update_infections = _update_infections_baseline
+    else:
+        campaign = camp.Campaign(vax_parameters) if vax_parameters['deployment'] in [1, 2] else None
+        if campaign is not None:
+            pop_parameters['campaign'] = campaign
+        update_infections = vax.set_function_for_updating_infections(vax_parameters, campaign)
+    events = ev.InfectionEvents(meta, partner_graph)
+
+
+    # Run the simulation
+    sites = np.zeros((n_days, 3))
+    infected = np.zeros(n_days)
+    for d in range(0, n_days):
+        t = _STATE['t'] + 1 + d
+        meta, partner_graph = demo.update_population(pop_parameters, prt_parameters, inf_parameters, meta, partner_graph, t)
+        meta, partner_graph = prt.update_partnerships(prt_parameters, meta, partner_graph, t)
+        meta = update_infections(inf_parameters, vax_parameters, meta, partner_graph, t, events)
+        meta = schema.check(meta)
+
+
+        # Keep track of prevalence
+        infected[d] = np.mean(meta.sites.to_numpy() > 0)
+        sites[d, :] = np.mean(st.site_matrix(meta), axis = 0)
+
+
+    return {'configuration': configuration,
+            'replicate': replicate,
+            'seed': seed,
+            'prevalence': np.mean(infected),
+            'prevalence_end': infected[-1],
+            'site0_prevalence': np.mean(sites[:, 0]),
+            'site1_prevalence': np.mean(sites[:, 1]),
+            'site2_prevalence': np.mean(sites[:, 2]),
+            'vaccinated_end': np.mean(meta.vaccinated.to_numpy() == True),
+            'doses': 0 if campaign is None else int(np.sum(campaign.history['doses'])),
+            'runtime': (time.time() - t0)/60}
+
+
+#%% HELPER _update_infections_baseline()
+#
+#
+# Update infections without a vaccine, with the same arguments as the
+# functions from vax.set_function_for_updating_infections(). Anybody new
+# still gets the vaccination columns so that meta keeps to the schema.
+#
+#
+def _update_infections_baseline(inf_parameters, vax_parameters, meta, partner_graph, t, events = None):
+    meta = vax.initilise_vaccination(meta)
+    return ng.update_infections(inf_parameters, meta, partner_graph, t, events)
+
+
+#%% HELPER _start_pool()
+#
+#
+# Start a Pool of workers with the calibrated state. Forked workers pick it
+# up from the parent copy-on-write, otherwise it is sent once to each worker.
+#
+#
+def _start_pool(state, n_cores):
+    if 'fork' in mp.get_all_start_methods():
+        _set_state(state)
+        return mp.get_context('fork').Pool(n_cores)
+    else:
+        return mp.Pool(n_cores, initializer = _set_state, initargs = (state,))
+
+
+#%% HELPER _set_state()
+def _set_state(state):
+    _STATE.clear()
+    _STATE.update(state)
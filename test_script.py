@@ -25,10 +25,14 @@ import time
 # My modules
 import src.demographic.generate_population as pop
 import src.demographic.population_dynamics as demo
+import src.demographic.schema as schema
 import src.partners.partners as prt
+import src.partners.partnership_graph as pg
 import src.calibration.setup as setup
 import src.infections.ng as ng
+import src.infections.states as st
 import src.vaccinations.deployment_0 as vax
+import src.vaccinations.campaign as camp
 
 
 run_mode = 'serial'
@@ -56,16 +60,22 @@ parameter_no = output['parameter_no']
 population_no = output['population_no']
 inf_parameters = output['inf_parameters']
 pop_parameters = output['pop_parameters']
+prt_parameters = output['prt_parameters'] if 'prt_parameters' in output else prt.setup_data()
 sim_parameters = output['sim_parameters']
 
 
-# Parse data from simulation
-meta = output['meta']
-partner_expire = output['partner_expire']
-partner_matrix = output['partner_matrix']
+# Parse data from simulation, encoding older output if needed
+meta = schema.apply(output['meta'])
 sim_t0 = output['t']
 
 
+# Parse the partnership network, converting older output if needed
+if 'partner_graph' in output:
+    partner_graph = output['partner_graph']
+else:
+    partner_graph = pg.from_dense(meta, output['partner_matrix'], output['partner_expire'])
+
+
 # Print
 if run_mode == 'serial':
     print('Parsing scenario ' + str(scenario) + ' with calibrated parameter set ' + str(calibrated_no) + '\n')
@@ -138,8 +148,15 @@ vax_parameters = {'duration_mean': 2*365,
                   'prop_vax_3': 0.0}  # Proportion of over 30 year olds vaccinated
 
 
+# Set up a vaccination campaign for deployment modes 1 and 2, which needs to
+# know about anybody new coming into the population
+campaign = camp.Campaign(vax_parameters) if vax_parameters['deployment'] in [1, 2] else None
+if campaign is not None:
+    pop_parameters['campaign'] = campaign
+
+
 # Setup method for updating infections
-update_infections = vax.set_function_for_updating_infections(vax_parameters)
+update_infections = vax.set_function_for_updating_infections(vax_parameters, campaign)
 
 
 #%% RUN Simulation
@@ -165,15 +182,15 @@ for t in tqdm.tqdm(tt):
 
 
     # Update population
-    meta, partner_matrix, partner_expire = demo.update_population(pop_parameters, inf_parameters, meta, partner_matrix, partner_expire, sim_t0 + t)
+    meta, partner_graph = demo.update_population(pop_parameters, prt_parameters, inf_parameters, meta, partner_graph, sim_t0 + t)
 
 
     # Update partnerships
-    meta, partner_matrix, partner_expire = prt.update_partnerships(meta, partner_matrix, partner_expire, sim_t0 + t)
+    meta, partner_graph = prt.update_partnerships(prt_parameters, meta, partner_graph, sim_t0 + t)
 
 
     # Update infections
-    meta = update_infections(inf_parameters, vax_parameters, meta, partner_matrix, sim_t0 + t)
+    meta = update_infections(inf_parameters, vax_parameters, meta, partner_graph, sim_t0 + t)
 
 
     # Dump simulation output
@@ -184,22 +201,22 @@ for t in tqdm.tqdm(tt):
     partners[t, 0] = sum(meta.partner == -1)
     partners[t, 1] = sum(meta.partner > -1)
     partners[t, 2] = len(meta)
-    partners[t, 3] = sum(sum(partner_matrix>0)) - sum(meta.partner > -1)
+    partners[t, 3] = sum(partner_graph.n_short)
 
 
     # How many are in each compartment?
-    compartments[t, 0] = sum(meta.state == 'S')
-    compartments[t, 1] = sum(meta.state == 'E')
-    compartments[t, 2] = sum(meta.state == 'I')
-    compartments[t, 3] = sum(meta.state == 'R')
-    compartments[t, 4] = sum(meta.state == 'V')
-    compartments[t, 5] = sum(meta.state == 'T')
-    compartments[t, 6] = sum((meta.site0 == 1) & (meta.site0_symptoms == True))
-    compartments[t, 7] = sum((meta.site0 == 1) & (meta.site0_symptoms == False))
-    compartments[t, 8] = sum((meta.site1 == 1) & (meta.site1_symptoms == True))
-    compartments[t, 9] = sum((meta.site1 == 1) & (meta.site1_symptoms == False))
-    compartments[t, 10] = sum((meta.site2 == 1) & (meta.site2_symptoms == True))
-    compartments[t, 11] = sum((meta.site2 == 1) & (meta.site2_symptoms == False))
+    compartments[t, 0] = sum(meta.state == st.S)
+    compartments[t, 1] = sum(meta.state == st.E)
+    compartments[t, 2] = sum(meta.state == st.I)
+    compartments[t, 3] = sum(meta.state == st.R)
+    compartments[t, 4] = sum(meta.state == st.V)
+    compartments[t, 5] = sum(meta.state == st.T)
+    compartments[t, 6] = sum(st.infected_at(meta, 0) & (meta.site0_symptoms == True))
+    compartments[t, 7] = sum(st.infected_at(meta, 0) & (meta.site0_symptoms == False))
+    compartments[t, 8] = sum(st.infected_at(meta, 1) & (meta.site1_symptoms == True))
+    compartments[t, 9] = sum(st.infected_at(meta, 1) & (meta.site1_symptoms == False))
+    compartments[t, 10] = sum(st.infected_at(meta, 2) & (meta.site2_symptoms == True))
+    compartments[t, 11] = sum(st.infected_at(meta, 2) & (meta.site2_symptoms == False))
 
 
 # Print update